@@ -3,10 +3,12 @@ Flask API for Sunique Freight Quote System
 Backend service for Railway.com deployment
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import json
 from flask_cors import CORS
 import os
 import sys
+import time
 from pathlib import Path
 
 # Add lib directory to path
@@ -15,22 +17,73 @@ lib_path = str(current_dir / 'lib')
 if lib_path not in sys.path:
     sys.path.insert(0, lib_path)
 
-from lib.inflow_api import InflowAPI
-from lib.product_dimensions import ProductDimensionsLoader
-from lib.pallet_calculator import determine_order_situation, calculate_pallets, adjust_low_height_pallets
-from lib.freight import build_freight_items, get_city_state_from_zip, get_chr_quotes
-from lib.chr_auth import CHRobinsonAuth
-from lib.quote_service import select_optimal_quote
+from lib import metrics
+from lib.inflow_api import InflowAPI, order_index
+from lib.order_index import start_background_sync
+from lib.quote_pipeline import (QuoteError, parse_quote_request, request_key, load_settings, run_quote_pipeline,
+                                stream_quote_pipeline)
+from lib.quote_batch import run_quote_batch
+from lib.server_metrics import http_in_flight, record_request, register_cache_metrics
+from lib.single_flight import SingleFlight
+
+# Product dimension workbook (loaded once per process)
+DIMENSIONS_PATH = str(current_dir / 'data' / 'Product Dimension.xlsx')
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Coalesces identical concurrent quote requests
+quote_flights = SingleFlight()
+
+
+def make_inflow_api():
+    """Build an inFlow client from the environment (None if not configured)"""
+    inflow_company_id = os.environ.get('INFLOW_COMPANY_ID')
+    inflow_api_key = os.environ.get('INFLOW_API_KEY')
+    if not inflow_company_id or not inflow_api_key:
+        return None
+    return InflowAPI(inflow_company_id, inflow_api_key)
+
+
+register_cache_metrics(quote_flights)
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    http_in_flight.inc()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    method = request.method
+    status = response.status_code
+    
+    # Runs once the body has been sent, so streamed responses are timed in full
+    response.call_on_close(lambda: record_request(endpoint, method, status, time.perf_counter() - start))
+    return response
+
+
+# Keep the local order index current (requires ORDER_INDEX_DB)
+ORDER_INDEX_SYNC_INTERVAL = int(os.environ.get('ORDER_INDEX_SYNC_INTERVAL', 0))
+if order_index is not None and ORDER_INDEX_SYNC_INTERVAL > 0:
+    start_background_sync(order_index, make_inflow_api, ORDER_INDEX_SYNC_INTERVAL)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'freight-quote-api'}), 200
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/quote', methods=['POST', 'OPTIONS'])
 def get_quote():
     """
@@ -45,7 +98,9 @@ def get_quote():
         "destinationZip": "67890",
         "deliveryType": "Commercial" or "Residential",
         "liftgateService": "yes" or "no",
-        "pickupDate": "2024-01-15T08:00:00"
+        "pickupDate": "2024-01-15T08:00:00",
+        "includeTimings": true (optional, adds per-step "timings" to the response)
+        "palletPacking": "volume", "cartons" or "cheapest" (optional, defaults to PALLET_PACKING)
     }
     """
     
@@ -54,165 +109,20 @@ def get_quote():
         return '', 200
     
     try:
-        # Parse request body
-        data = request.get_json()
-        
-        # Extract parameters
-        order_number = data.get('orderNumber', '').strip()
-        needs_assembly = data.get('needsAssembly', 'no')
-        pickup_zip = data.get('pickupZip', '').strip()
-        destination_zip = data.get('destinationZip', '').strip()
-        delivery_type = data.get('deliveryType', 'Commercial')
-        liftgate_service = data.get('liftgateService', 'no')
-        pickup_date = data.get('pickupDate', '')
-        
-        # Validate inputs
-        if not order_number:
-            return jsonify({'error': 'Order/Quote number is required'}), 400
-        if len(pickup_zip) != 5 or not pickup_zip.isdigit():
-            return jsonify({'error': 'Invalid pickup ZIP code'}), 400
-        if len(destination_zip) != 5 or not destination_zip.isdigit():
-            return jsonify({'error': 'Invalid destination ZIP code'}), 400
-        if not pickup_date:
-            return jsonify({'error': 'Pickup date is required'}), 400
-        
-        # Get environment variables
-        inflow_company_id = os.environ.get('INFLOW_COMPANY_ID')
-        inflow_api_key = os.environ.get('INFLOW_API_KEY')
-        chr_client_id = os.environ.get('CHR_CLIENT_ID')
-        chr_client_secret = os.environ.get('CHR_CLIENT_SECRET')
-        chr_customer_code = os.environ.get('CHR_CUSTOMER_CODE')
-        chr_environment = os.environ.get('CHR_ENVIRONMENT', 'sandbox')
-        
-        if not all([inflow_company_id, inflow_api_key, chr_client_id, chr_client_secret, chr_customer_code]):
-            return jsonify({'error': 'Missing required environment variables'}), 500
-        
-        # Initialize API clients
-        inflow_api = InflowAPI(inflow_company_id, inflow_api_key)
-        chr_auth = CHRobinsonAuth(chr_client_id, chr_client_secret, chr_environment)
-        
-        # Load product dimensions
-        dimensions_path = str(current_dir / 'data' / 'Product Dimension.xlsx')
-        dimensions_loader = ProductDimensionsLoader(dimensions_path)
-        
-        # Step 1: Fetch order or quote from inFlow
-        order_df = inflow_api.search_todays_orders(order_number)
-        
-        if order_df.empty:
-            return jsonify({'error': f'Order/Quote "{order_number}" not found in inFlow'}), 404
-        
-        # Step 2: Process products
-        products_df = inflow_api.process_order_products(order_df)
-        
-        if products_df.empty:
-            return jsonify({'error': 'No valid products found in this order'}), 400
-        
-        # Step 3: Merge dimensions
-        products_with_dims = dimensions_loader.merge_dimensions(products_df, needs_assembly)
-        
-        # Debug logging
-        print(f"DEBUG: Products before merge: {products_df[['name']].to_dict('records')}")
-        print(f"DEBUG: Products after merge: {products_with_dims[['name', 'ProductType', 'Length']].to_dict('records')}")
-        print(f"DEBUG: Products with NaN Length: {products_with_dims[products_with_dims['Length'].isna()][['name', 'ProductType']].to_dict('records')}")
-        
-        # Filter out products without dimensions
-        valid_products = products_with_dims[products_with_dims['Length'].notna()].copy()
-        
-        if valid_products.empty:
-            # Enhanced error message with debug info
-            missing_products = products_with_dims[products_with_dims['Length'].isna()][['name', 'ProductType']].to_dict('records')
-            error_msg = f'No products with valid dimensions found. Products without dimensions: {missing_products}'
-            print(f"DEBUG: {error_msg}")
-            return jsonify({'error': error_msg}), 400
-        
-        # Step 4: Calculate pallets
-        order_situation = determine_order_situation(valid_products)
-        pallets, total_weight, total_volume = calculate_pallets(valid_products, order_situation)
-        
-        # Adjust low-height pallets
-        pallets = adjust_low_height_pallets(pallets, total_volume, total_weight)
-        
-        # Step 5: Build freight items
-        freight_items = build_freight_items(pallets)
-        
-        # Step 6: Get location info from ZIP codes
-        pickup_city, pickup_state = get_city_state_from_zip(pickup_zip)
-        dest_city, dest_state = get_city_state_from_zip(destination_zip)
-        
-        if not pickup_city or not dest_city:
-            return jsonify({'error': 'Invalid ZIP code. Could not determine city/state.'}), 400
-        
-        pickup_info = {'zip': pickup_zip, 'city': pickup_city, 'state': pickup_state}
-        delivery_info = {'zip': destination_zip, 'city': dest_city, 'state': dest_state}
-        
-        # Step 7: Get shipping quotes from C.H. Robinson
-        is_residential = delivery_type == 'Residential'
-        needs_liftgate = liftgate_service == 'yes'
-        
-        quotes = get_chr_quotes(
-            chr_auth, freight_items, pickup_info, delivery_info,
-            pickup_date, is_residential, needs_liftgate, chr_customer_code
+        # Parse and validate request body
+        params = parse_quote_request(request.get_json())
+        settings = load_settings()
+        
+        # Identical requests already in flight share one pipeline run
+        response_data, _ = quote_flights.do(
+            request_key(params),
+            lambda: run_quote_pipeline(params, settings, DIMENSIONS_PATH)
         )
         
-        if not quotes:
-            return jsonify({'error': 'No shipping quotes available for this route'}), 400
-        
-        # Step 8: Select optimal quote
-        selected_quote = select_optimal_quote(quotes)
-        
-        # Step 9: Format response
-        products_list = []
-        for _, row in valid_products.iterrows():
-            products_list.append({
-                'name': row['name'],
-                'quantity': float(row['quantity']),
-                'length': float(row['Length']),
-                'width': float(row['Width']),
-                'height': float(row['Height']),
-                'weight': float(row['weight(kg)']),
-                'index': int(row['Index'])
-            })
-        
-        pallets_list = []
-        for i, (pallet, freight_item) in enumerate(zip(pallets, freight_items)):
-            pallets_list.append({
-                'length': freight_item['Length'],
-                'width': freight_item['Width'],
-                'height': freight_item['Height'],
-                'weight': freight_item['Weight'],
-                'freightClass': freight_item['FreightClass'],
-                'stackable': freight_item['Stackable'],
-                'hazmat': freight_item['Hazmat'],
-                'palletType': pallet['Type'],
-                'originalHeight': pallet['Height']
-            })
-        
-        # Convert quotes to camelCase for frontend compatibility
-        quotes_camelcase = []
-        for q in quotes:
-            quotes_camelcase.append({
-                'carrier': q.get('carrier', 'Unknown'),
-                'totalCost': q.get('total_cost', 0),
-                'service': q.get('service', 'N/A'),
-                'mode': q.get('mode', 'N/A'),
-                'distance': q.get('distance', 'N/A')
-            })
-        
-        response_data = {
-            'orderSummary': {
-                'orderNumber': order_number,
-                'totalProducts': len(products_list),
-                'totalWeight': float(total_weight),
-                'totalVolume': float(total_volume)
-            },
-            'products': products_list,
-            'pallets': pallets_list,
-            'quotes': quotes_camelcase,
-            'selectedQuote': selected_quote
-        }
-        
         return jsonify(response_data), 200
         
+    except QuoteError as e:
+        return jsonify({'error': str(e)}), e.status_code
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
@@ -221,6 +131,75 @@ def get_quote():
         traceback.print_exc()
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
+@app.route('/api/quote/stream', methods=['POST', 'OPTIONS'])
+def get_quote_stream():
+    """
+    Streaming quote endpoint
+    Same request body as /api/quote. Responds with newline-delimited JSON,
+    one {"event": ..., "data": ...} object per pipeline stage as it finishes:
+    order, products, pallets, quote (once per carrier), selectedQuote, then
+    result (the /api/quote response) or error ({"error", "status"}).
+    """
+    
+    # Handle OPTIONS request (CORS preflight)
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        params = parse_quote_request(request.get_json())
+        settings = load_settings()
+    except QuoteError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        for event, data in stream_quote_pipeline(params, settings, DIMENSIONS_PATH):
+            yield json.dumps({'event': event, 'data': data}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/quotes/batch', methods=['POST', 'OPTIONS'])
+def get_quotes_batch():
+    """
+    Batch quote endpoint
+    Quotes many orders in one call; fields outside "orders" apply to every order
+    
+    Expected POST body:
+    {
+        "pickupZip": "12345",
+        "pickupDate": "2024-01-15T08:00:00",
+        "orders": [
+            {"orderNumber": "SO-009537", "destinationZip": "67890"},
+            {"orderNumber": "Quote-010450", "destinationZip": "10001", "needsAssembly": "yes"}
+        ]
+    }
+    
+    Returns one result per order, each with "status" and either "quote"
+    (the /api/quote response) or "error".
+    """
+    
+    # Handle OPTIONS request (CORS preflight)
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        settings = load_settings()
+        response_data = run_quote_batch(request.get_json(), settings, DIMENSIONS_PATH,
+                                        flights=quote_flights)
+        return jsonify(response_data), 200
+        
+    except QuoteError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error processing batch quote: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 10000))
     app.run(host='0.0.0.0', port=port)
@@ -0,0 +1,249 @@
+"""
+ASGI API for Sunique Freight Quote System
+Same endpoints as app.py, served by an async pipeline
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 10000
+
+A quote waiting on inFlow or C.H. Robinson holds no thread, so one process
+serves many concurrent quotes. Batch quotes still run on the sync pipeline,
+on a worker thread.
+"""
+
+import asyncio
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+from lib import async_http, metrics
+from lib.async_pipeline import run_quote_pipeline, stream_quote_pipeline
+from lib.inflow_api import InflowAPI, order_index
+from lib.order_index import start_background_sync
+from lib.quote_pipeline import QuoteError, parse_quote_request, request_key, load_settings, warm_up
+from lib.quote_batch import run_quote_batch
+from lib.server_metrics import http_in_flight, record_request, register_cache_metrics
+from lib.single_flight import AsyncSingleFlight
+
+# Product dimension workbook (loaded once per process)
+DIMENSIONS_PATH = str(Path(__file__).parent / 'data' / 'Product Dimension.xlsx')
+
+# Keep the local order index current (requires ORDER_INDEX_DB)
+ORDER_INDEX_SYNC_INTERVAL = int(os.environ.get('ORDER_INDEX_SYNC_INTERVAL', 0))
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Content-Type'),
+    (b'access-control-allow-methods', b'GET, POST, OPTIONS')
+]
+
+# Coalesces identical concurrent quote requests
+quote_flights = AsyncSingleFlight()
+
+register_cache_metrics(quote_flights)
+
+
+def make_inflow_api():
+    """Build an inFlow client from the environment (None if not configured)"""
+    inflow_company_id = os.environ.get('INFLOW_COMPANY_ID')
+    inflow_api_key = os.environ.get('INFLOW_API_KEY')
+    if not inflow_company_id or not inflow_api_key:
+        return None
+    return InflowAPI(inflow_company_id, inflow_api_key)
+
+
+async def send_response(send, status, body, content_type='application/json', headers=()):
+    """Send a complete response"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode())] + CORS_HEADERS + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, status, data):
+    await send_response(send, status, json.dumps(data).encode())
+
+
+async def read_json(receive):
+    """
+    Read and parse the request body
+
+    Raises:
+        ValueError: If the body is not valid JSON
+    """
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError('Client disconnected')
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body = b''.join(chunks)
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ValueError('Request body must be valid JSON')
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def health_check(receive, send):
+    """Health check endpoint"""
+    await send_json(send, 200, {'status': 'healthy', 'service': 'freight-quote-api'})
+
+
+async def metrics_endpoint(receive, send):
+    """Prometheus metrics for this process"""
+    await send_response(send, 200, metrics.REGISTRY.render().encode(), 'text/plain; version=0.0.4')
+
+
+async def get_quote(receive, send):
+    """Main quote endpoint (see app.get_quote for the request body)"""
+    try:
+        params = parse_quote_request(await read_json(receive))
+        settings = load_settings()
+
+        # Identical requests already in flight share one pipeline run
+        response_data, _ = await quote_flights.do(
+            request_key(params),
+            lambda: run_quote_pipeline(params, settings, DIMENSIONS_PATH)
+        )
+
+        await send_json(send, 200, response_data)
+
+    except QuoteError as e:
+        await send_json(send, e.status_code, {'error': str(e)})
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+
+
+async def get_quote_stream(receive, send):
+    """Streaming quote endpoint (see app.get_quote_stream for the events)"""
+    try:
+        params = parse_quote_request(await read_json(receive))
+        settings = load_settings()
+    except QuoteError as e:
+        await send_json(send, e.status_code, {'error': str(e)})
+        return
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/x-ndjson'), (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')] + CORS_HEADERS
+    })
+
+    events = stream_quote_pipeline(params, settings, DIMENSIONS_PATH)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        async for event, data in events:
+            # Closing the generator cancels the pipeline
+            if disconnected.done():
+                return
+            line = json.dumps({'event': event, 'data': data}) + '\n'
+            await send({'type': 'http.response.body', 'body': line.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await events.aclose()
+
+
+async def get_quotes_batch(receive, send):
+    """Batch quote endpoint (see app.get_quotes_batch for the request body)"""
+    try:
+        data = await read_json(receive)
+        settings = load_settings()
+        # The batch pipeline is thread-based; run it off the event loop
+        response_data = await asyncio.to_thread(run_quote_batch, data, settings, DIMENSIONS_PATH)
+        await send_json(send, 200, response_data)
+
+    except QuoteError as e:
+        await send_json(send, e.status_code, {'error': str(e)})
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+
+
+# path -> (allowed methods, handler)
+ROUTES = {
+    '/health': (('GET',), health_check),
+    '/metrics': (('GET',), metrics_endpoint),
+    '/api/quote': (('POST',), get_quote),
+    '/api/quote/stream': (('POST',), get_quote_stream),
+    '/api/quotes/batch': (('POST',), get_quotes_batch)
+}
+
+
+async def lifespan(receive, send):
+    """Warm up on startup and close upstream connections on shutdown"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            print(f"Warm-up: {await asyncio.to_thread(warm_up, DIMENSIONS_PATH)}")
+            async_http.get_client()
+            if order_index is not None and ORDER_INDEX_SYNC_INTERVAL > 0:
+                start_background_sync(order_index, make_inflow_api, ORDER_INDEX_SYNC_INTERVAL)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_http.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path']
+    method = scope['method']
+    route = ROUTES.get(path)
+    endpoint = path if route is not None else 'unmatched'
+
+    status = None
+    start = time.perf_counter()
+    http_in_flight.inc()
+
+    async def send_and_track(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    try:
+        if route is None:
+            await send_json(send_and_track, 404, {'error': 'Not found'})
+        elif method == 'OPTIONS':
+            # CORS preflight
+            await send_response(send_and_track, 200, b'', 'text/plain')
+        elif method not in route[0]:
+            await send_json(send_and_track, 405, {'error': 'Method not allowed'})
+        else:
+            await route[1](receive, send_and_track)
+
+    except ConnectionError:
+        pass
+    except Exception as e:
+        print(f"Error processing {path}: {str(e)}")
+        traceback.print_exc()
+        if status is None:
+            await send_json(send_and_track, 500, {'error': f'Internal server error: {str(e)}'})
+
+    finally:
+        # Recorded once the body has been sent, so streamed responses are timed in full
+        record_request(endpoint, method, status or 500, time.perf_counter() - start)
@@ -0,0 +1,317 @@
+"""
+Async Upstream Clients
+inFlow, C.H. Robinson and ZIP lookups for the async pipeline
+
+Each client subclasses or mirrors its sync counterpart and reuses its
+request building and response parsing, so both pipelines send the same
+calls and read the same answers. Process-wide state is shared with the sync
+clients: the inFlow rate limiter, product / quote / ZIP caches, the order
+index and C.H. Robinson tokens. Local stores (the order index and optional
+SQLite cache tiers) are still called inline.
+"""
+
+import asyncio
+
+from . import async_http, metrics
+from .async_http import loop_local
+from .chr_auth import TOKEN_CACHE_FILE, CHRobinsonAuth
+from .freight import (quote_cache, lookup_zip_offline, zip_api_url, read_zip_response,
+                      prepare_chr_quote_request, read_chr_quote_response)
+from .inflow_api import (INFLOW_MAX_IN_FLIGHT, PRODUCT_FETCH_WORKERS, SEARCH_PAGE_WINDOW, InflowAPI,
+                         build_order_lines, inflow_rate_limiter, order_quantities)
+
+
+class AsyncInflowAPI(InflowAPI):
+    """InflowAPI whose network methods are coroutines"""
+
+    async def _get(self, url, timeout=None):
+        """GET an inFlow URL under the shared rate limit and this loop's in-flight slots"""
+        await inflow_rate_limiter.acquire_async()
+        slots = loop_local('inflow_slots', lambda: asyncio.Semaphore(INFLOW_MAX_IN_FLIGHT))
+        async with slots:
+            return await async_http.get(url, headers=self.headers, timeout=timeout)
+
+    async def fetch_with_retries(self, url, timeout=60, max_attempts=5, retry_errors=True):
+        """Async fetch_with_retries: same retry, backoff and 429 handling"""
+        attempt = 0
+
+        while attempt < max_attempts:
+            attempt += 1
+            try:
+                resp = await self._get(url, timeout=timeout)
+                delay = self.retry_delay(resp, attempt, max_attempts, retry_errors)
+                if delay is None:
+                    return resp
+
+            except async_http.Timeout:
+                print(f"Timeout on attempt {attempt}/{max_attempts}")
+                delay = self.error_delay('timeout', attempt, max_attempts)
+
+            except Exception as e:
+                print(f"Error on attempt {attempt}/{max_attempts}: {e}")
+                delay = self.error_delay('error', attempt, max_attempts)
+
+            if delay:
+                await asyncio.sleep(delay)
+
+        raise Exception(f"Failed to fetch data after {max_attempts} attempts")
+
+    async def fetch_single_order_from_api(self, sales_order_id):
+        """Fetch a single order by ID"""
+        response = await self.fetch_with_retries(self.order_url(sales_order_id), timeout=60, max_attempts=5)
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            raise Exception(f"Failed to fetch order {sales_order_id}")
+
+    async def search_todays_orders(self, order_number):
+        """
+        Search for an order or quote by order number (see InflowAPI.search_todays_orders)
+
+        Returns:
+            dict: The inFlow sales order (with lines), or None if not found
+        """
+        if self.order_index is not None:
+            order = await self.find_indexed_order(order_number)
+            if order is not None:
+                return order
+
+        try:
+            print(f"Searching for order/quote: {order_number}")
+            response = await self.fetch_with_retries(self.order_search_url(order_number),
+                                                     timeout=60, max_attempts=5)
+            order = self.match_filtered_orders(response, order_number)
+            if order is not None:
+                return order
+        except Exception as e:
+            print(f"Error with filtered search: {e}")
+
+        print(f"Filter search didn't find order/quote, trying pagination...")
+        order = await self.search_order_pages(order_number, range(0, 1000, 100))
+        if order is not None:
+            return order
+
+        print(f"Order/quote {order_number} not found after exhaustive search")
+        return None
+
+    async def search_order_pages(self, order_number, skips, window=SEARCH_PAGE_WINDOW):
+        """
+        Scan pages of recent orders for an order number
+
+        Keeps up to `window` pages in flight. Once a page finds the order,
+        the other pages are cancelled, including calls already in flight.
+        No new pages are started after an empty or failed page.
+
+        Returns:
+            dict: The order, or None if no page contains it
+        """
+        window = max(1, window)
+        remaining = iter(skips)
+        pending = set()
+
+        def start_next():
+            skip = next(remaining, None)
+            if skip is None:
+                return False
+            pending.add(asyncio.ensure_future(self._search_order_page(order_number, skip)))
+            return True
+
+        try:
+            exhausted = False
+            while len(pending) < window and start_next():
+                pass
+
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending -= done
+                for task in done:
+                    status, order = task.result()
+                    if status == 'found':
+                        return order
+                    if status == 'end':
+                        exhausted = True
+
+                while not exhausted and len(pending) < window and start_next():
+                    pass
+
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _search_order_page(self, order_number, skip):
+        """
+        Fetch one page of the pagination fallback
+
+        Returns:
+            tuple: (status, order) where status is 'found', 'miss' or 'end'
+        """
+        try:
+            response = await self.fetch_with_retries(self.order_page_url(skip), timeout=60, max_attempts=5)
+            return self.read_order_page(response, order_number, skip)
+        except Exception as e:
+            print(f"Error searching at skip={skip}: {e}")
+            return 'miss', None
+
+    async def find_indexed_order(self, order_number):
+        """Fetch an order through the local order index (see InflowAPI.find_indexed_order)"""
+        sales_order_id = self.order_index.lookup(order_number)
+        if not sales_order_id:
+            return None
+
+        try:
+            order = await self.fetch_single_order_from_api(sales_order_id)
+        except Exception as e:
+            print(f"Indexed order {order_number} could not be fetched: {e}")
+            order = None
+
+        return self.check_indexed_order(order, order_number)
+
+    async def get_product_details(self, product_id):
+        """
+        Get product details by product ID (served from product_cache when available)
+
+        Returns:
+            dict: The inFlow product
+        """
+        json_data = self.cached_product(product_id)
+        if json_data is not None:
+            return json_data
+
+        url = f"{self.base_url}/products/{product_id}?include=category"
+        # Retry rate limits and timeouts, but fail fast on other errors (e.g. 404)
+        response = await self.fetch_with_retries(url, timeout=None, max_attempts=6, retry_errors=False)
+        return self.read_product(response, product_id)
+
+    async def fetch_product_details(self, product_ids, max_workers=PRODUCT_FETCH_WORKERS):
+        """
+        Fetch details for many products concurrently
+
+        Duplicate IDs are fetched once. Products that fail to fetch are
+        logged and skipped.
+
+        Returns:
+            list: One product dict per fetched product, in first-seen order
+        """
+        unique_ids = list(dict.fromkeys(product_ids))
+        if not unique_ids:
+            return []
+
+        workers = asyncio.Semaphore(max(1, max_workers))
+
+        async def fetch(product_id):
+            async with workers:
+                try:
+                    return await self.get_product_details(product_id)
+                except Exception as e:
+                    print(f"Error fetching product {product_id}: {e}")
+                    return None
+
+        results = await asyncio.gather(*(fetch(product_id) for product_id in unique_ids))
+        return [details for details in results if details is not None]
+
+    async def process_order_products(self, order):
+        """
+        Extract the order's products with summed quantities
+
+        Returns:
+            list: OrderLine (name, quantity) per product, ordered by productId
+        """
+        quantities = order_quantities(order)
+        product_details = await self.fetch_product_details(quantities)
+        return build_order_lines(quantities, product_details)
+
+
+class AsyncCHRobinsonAuth(CHRobinsonAuth):
+    """CHRobinsonAuth whose token methods are coroutines"""
+
+    async def get_token(self):
+        """
+        Get a valid access token, refreshing if necessary
+
+        Tokens are shared with every sync and async client in the process.
+        With CHR_TOKEN_CACHE_FILE set, the refresh goes through the sync
+        client on a worker thread, because the file is guarded by a
+        blocking lock.
+        """
+        token = self.cached_token()
+        if token:
+            return token
+
+        if TOKEN_CACHE_FILE:
+            return await asyncio.to_thread(CHRobinsonAuth.get_token, self)
+
+        # Only one coroutine per loop fetches; the others wait for its token
+        async with loop_local(f'chr_token_lock:{self.cache_key}', asyncio.Lock):
+            token = self.cached_token()
+            if token:
+                return token
+
+            response = await async_http.post(f'{self.base_url}/v1/oauth/token',
+                                             json=self.token_request_payload(),
+                                             headers={'Content-Type': 'application/json'})
+            return self.store_token(self.parse_token_response(response))
+
+    async def invalidate_token(self):
+        """Drop the shared token; the token file lock is taken on a worker thread"""
+        await asyncio.to_thread(CHRobinsonAuth.invalidate_token, self)
+
+    async def get_headers(self):
+        """Get headers with valid bearer token"""
+        return {
+            'Authorization': f'Bearer {await self.get_token()}',
+            'Content-Type': 'application/json'
+        }
+
+
+async def get_city_state_from_zip(zip_code):
+    """
+    Get city and state from ZIP code (see freight.get_city_state_from_zip)
+
+    Returns:
+        tuple: (city, state) or (None, None) if not found
+    """
+    location = lookup_zip_offline(zip_code)
+    if location is not None:
+        return location
+
+    try:
+        return read_zip_response(zip_code, await async_http.get(zip_api_url(zip_code)))
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        metrics.zip_lookups.inc(source='miss')
+        return None, None
+
+
+async def fetch_chr_quotes(chr_auth, freight_items, pickup_info, delivery_info,
+                           ship_date, is_residential, needs_liftgate, customer_code,
+                           cache=None):
+    """
+    Get shipping quotes from C.H. Robinson, using the quote cache when possible
+    (see freight.fetch_chr_quotes)
+
+    Args:
+        chr_auth: AsyncCHRobinsonAuth
+
+    Returns:
+        tuple: (parsed quotes, True if served from cache)
+    """
+    cache = quote_cache if cache is None else cache
+
+    payload, cache_key, cached = prepare_chr_quote_request(
+        chr_auth, freight_items, pickup_info, delivery_info, ship_date,
+        is_residential, needs_liftgate, customer_code, cache
+    )
+    if cached is not None:
+        return cached, True
+
+    url = f"{chr_auth.base_url}/v1/quotes"
+    response = await async_http.post(url, json=payload, headers=await chr_auth.get_headers())
+
+    # The shared token may have been revoked early; fetch a fresh one and retry once
+    if response.status_code == 401:
+        await chr_auth.invalidate_token()
+        response = await async_http.post(url, json=payload, headers=await chr_auth.get_headers())
+
+    return read_chr_quote_response(response, cache, cache_key), False
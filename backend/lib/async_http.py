@@ -0,0 +1,111 @@
+"""
+Async HTTP Client
+httpx counterpart of http_client for the async pipeline
+
+Same per-host connection pools, default timeouts, metrics and timing spans
+as http_client, without blocking a thread while a call is in flight.
+asyncio objects cannot be shared between event loops, so the client (and
+anything made with loop_local) is kept per running loop.
+"""
+
+import asyncio
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import metrics, timing
+from .http_client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, HOST_POOL_SIZES, HOST_TIMEOUTS
+
+
+# Raised when a call times out (connect, read, write or pool)
+Timeout = httpx.TimeoutException
+
+# Event loop -> {name: object} (see loop_local)
+_loop_objects = weakref.WeakKeyDictionary()
+
+
+def loop_local(name, factory):
+    """
+    Get a per-event-loop object (client, lock, semaphore), creating it on first use
+
+    Args:
+        name: Key for the object within the running loop
+        factory: Zero-argument callable that creates it
+    """
+    objects = _loop_objects.setdefault(asyncio.get_running_loop(), {})
+    if name not in objects:
+        objects[name] = factory()
+    return objects[name]
+
+
+def _create_client():
+    # Dedicated pool per upstream, like http_client's per-host adapters
+    mounts = {}
+    for host, pool_size in HOST_POOL_SIZES.items():
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        transport = httpx.AsyncHTTPTransport(limits=limits)
+        mounts[f'all://{host}'] = transport
+    limits = httpx.Limits(max_connections=DEFAULT_POOL_SIZE, max_keepalive_connections=DEFAULT_POOL_SIZE)
+    return httpx.AsyncClient(limits=limits, mounts=mounts)
+
+
+def get_client():
+    """Get the running loop's client, creating it on first use"""
+    return loop_local('http_client', _create_client)
+
+
+async def aclose():
+    """Close the running loop's client (call on shutdown)"""
+    objects = _loop_objects.get(asyncio.get_running_loop(), {})
+    client = objects.pop('http_client', None)
+    if client is not None:
+        await client.aclose()
+
+
+def _timeout(value):
+    """httpx timeout from a seconds or (connect, read) value"""
+    if isinstance(value, tuple):
+        connect, read = value
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(value)
+
+
+async def request(method, url, timeout=None, **kwargs):
+    """
+    Send a request through the running loop's client
+
+    Args:
+        method: HTTP method
+        url: Full URL
+        timeout: Seconds or (connect, read) tuple; defaults to the host's timeout
+        **kwargs: Passed through to httpx (headers, json, ...)
+
+    Returns:
+        httpx.Response
+    """
+    host = urlsplit(url).hostname
+    if timeout is None:
+        timeout = HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+    upstream = metrics.upstream_name(host)
+    status = 'error'
+    start = time.perf_counter()
+    try:
+        with timing.span('http', method=method, host=host, path=urlsplit(url).path) as span:
+            response = await get_client().request(method, url, timeout=_timeout(timeout), **kwargs)
+            status = span['status'] = response.status_code
+        return response
+    finally:
+        metrics.upstream_latency.observe(time.perf_counter() - start, upstream=upstream, method=method)
+        metrics.upstream_requests.inc(upstream=upstream, method=method, status=status)
+
+
+async def get(url, **kwargs):
+    """GET through the running loop's client"""
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    """POST through the running loop's client"""
+    return await request('POST', url, **kwargs)
@@ -0,0 +1,222 @@
+"""
+Async Quote Pipeline
+The quote pipeline as coroutines, for the ASGI app
+
+Steps, validation, spans, metrics and the response are the same as in
+quote_pipeline; only the inFlow, C.H. Robinson and ZIP calls differ: they
+are awaited instead of holding a thread, so one process can keep hundreds
+of quotes waiting on upstreams.
+"""
+
+import asyncio
+import traceback
+
+from .async_clients import AsyncCHRobinsonAuth, AsyncInflowAPI, fetch_chr_quotes, get_city_state_from_zip
+from .freight import lookup_zip_offline
+from .product_dimensions import get_dimensions_loader
+from .quote_pipeline import (QuoteError, record_quote_metrics, plan_order, shipment_locations,
+                             chr_quote_options, finish_quote)
+from . import timing
+
+
+def create_inflow_api(settings, **kwargs):
+    """Build an async inFlow client from load_settings output"""
+    return AsyncInflowAPI(settings['inflow_company_id'], settings['inflow_api_key'], **kwargs)
+
+
+def create_chr_auth(settings):
+    """Build an async C.H. Robinson auth client from load_settings output"""
+    return AsyncCHRobinsonAuth(settings['chr_client_id'], settings['chr_client_secret'],
+                               settings['chr_environment'])
+
+
+async def find_order(inflow_api, order_number):
+    """
+    Fetch an order or quote from inFlow
+
+    Raises:
+        QuoteError: If the order cannot be found
+    """
+    order = await inflow_api.search_todays_orders(order_number)
+
+    if order is None:
+        raise QuoteError(f'Order/Quote "{order_number}" not found in inFlow', 404)
+
+    return order
+
+
+async def run_quote_pipeline(params, settings, dimensions_path, inflow_api=None, order=None,
+                             on_event=None, chr_auth=None):
+    """
+    Produce a freight quote for one order (see quote_pipeline.run_quote_pipeline)
+
+    Args:
+        inflow_api: AsyncInflowAPI to use (defaults to a new client from settings)
+        chr_auth: AsyncCHRobinsonAuth to use (defaults to a new client from settings)
+
+    Returns:
+        dict: Response body, as from quote_pipeline.run_quote_pipeline
+
+    Raises:
+        QuoteError: If the order cannot be quoted
+    """
+    outcome = 'error'
+    quote_trace = None
+    try:
+        with timing.trace('quote', orderNumber=params['orderNumber']) as quote_trace:
+            response = await _run_steps(params, settings, dimensions_path, inflow_api, chr_auth, order,
+                                        on_event or (lambda event, data: None))
+        outcome = 'ok'
+    except QuoteError:
+        outcome = 'rejected'
+        raise
+    finally:
+        record_quote_metrics(outcome, quote_trace)
+
+    if params.get('includeTimings'):
+        response['timings'] = quote_trace.to_dict()
+    return response
+
+
+async def _run_steps(params, settings, dimensions_path, inflow_api, chr_auth, order, emit):
+    """The pipeline steps behind run_quote_pipeline, each timed as a span"""
+    order_number = params['orderNumber']
+
+    inflow_api = inflow_api or create_inflow_api(settings)
+    chr_auth = chr_auth or create_chr_auth(settings)
+
+    # ZIP lookups and the C.H. Robinson token run while inFlow is queried
+    with AsyncUpstreamPrefetch(params, chr_auth) as prefetch:
+        # Loading the sheet, planning and cache locks block; keep them off the event loop
+        with timing.span('load_dimensions'):
+            dimensions_loader = await asyncio.to_thread(get_dimensions_loader, dimensions_path)
+
+        # Step 1: Fetch order or quote from inFlow
+        if order is None:
+            with timing.span('fetch_order'):
+                order = await find_order(inflow_api, order_number)
+        emit('order', {'orderNumber': order_number})
+
+        # Step 2: Process products
+        with timing.span('process_products'):
+            products = await inflow_api.process_order_products(order)
+
+        # Steps 3-5: Merge dimensions, calculate pallets, build freight items
+        products_list, freight_items, pallets_list, total_weight, total_volume = await asyncio.to_thread(
+            plan_order, products, dimensions_loader, params)
+        emit('products', products_list)
+        emit('pallets', pallets_list)
+
+        # Step 6: Get location info from ZIP codes (started with the prefetch)
+        with timing.span('zip_lookup'):
+            pickup, destination = await prefetch.locations()
+        pickup_info, delivery_info = shipment_locations(params, pickup, destination)
+
+        # Step 7: Get shipping quotes from C.H. Robinson
+        with timing.span('chr_quotes') as chr_span:
+            await prefetch.wait_for_token()
+            quotes, quotes_from_cache = await fetch_chr_quotes(
+                chr_auth, freight_items, pickup_info, delivery_info, *chr_quote_options(params, settings)
+            )
+            chr_span['cached'] = quotes_from_cache
+
+    # Steps 8-9: Select optimal quote and format response
+    return finish_quote(order_number, products_list, pallets_list, total_weight, total_volume,
+                        quotes, quotes_from_cache, emit)
+
+
+class AsyncUpstreamPrefetch:
+    """
+    quote_pipeline.UpstreamPrefetch with tasks instead of worker threads
+    """
+
+    def __init__(self, params, chr_auth):
+        self.zip_codes = (params['pickupZip'], params['destinationZip'])
+        self._locations = {}
+        self._remote = {}
+        self._token = None
+
+        for zip_code in self.zip_codes:
+            location = lookup_zip_offline(zip_code)
+            if location is not None:
+                self._locations[zip_code] = location
+            elif zip_code not in self._remote:
+                self._remote[zip_code] = asyncio.ensure_future(get_city_state_from_zip(zip_code))
+
+        if chr_auth.cached_token() is None:
+            self._token = asyncio.ensure_future(chr_auth.get_token())
+
+    async def locations(self):
+        """
+        Wait for the ZIP lookups
+
+        Returns:
+            tuple: (pickup, destination), each as from get_city_state_from_zip
+        """
+        for zip_code, task in self._remote.items():
+            self._locations[zip_code] = await task
+        return tuple(self._locations[zip_code] for zip_code in self.zip_codes)
+
+    async def wait_for_token(self):
+        """Wait for the token fetch (a failure is left for the quote request to retry and report)"""
+        if self._token is None:
+            return
+        try:
+            await self._token
+        except Exception as e:
+            print(f"C.H. Robinson token prefetch failed: {e}")
+
+    def close(self):
+        """Cancel calls still running (e.g. when the order was not found)"""
+        for task in list(self._remote.values()) + [self._token]:
+            if task is not None and not task.done():
+                task.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def stream_quote_pipeline(params, settings, dimensions_path, **kwargs):
+    """
+    Run the quote pipeline, yielding its stage events as they happen
+
+    Args:
+        **kwargs: Passed to run_quote_pipeline (inflow_api, chr_auth)
+
+    Yields:
+        tuple: (event, data) for each stage, then ("result", response body)
+            or ("error", {"error", "status"})
+    """
+    events = asyncio.Queue()
+    done = object()
+
+    async def run():
+        try:
+            result = await run_quote_pipeline(params, settings, dimensions_path,
+                                              on_event=lambda event, data: events.put_nowait((event, data)),
+                                              **kwargs)
+            events.put_nowait(('result', result))
+        except QuoteError as e:
+            events.put_nowait(('error', {'error': str(e), 'status': e.status_code}))
+        except ValueError as e:
+            events.put_nowait(('error', {'error': str(e), 'status': 400}))
+        except Exception as e:
+            print(f"Error processing quote: {str(e)}")
+            traceback.print_exc()
+            events.put_nowait(('error', {'error': f'Internal server error: {str(e)}', 'status': 500}))
+        finally:
+            events.put_nowait(done)
+
+    task = asyncio.ensure_future(run())
+    try:
+        while True:
+            item = await events.get()
+            if item is done:
+                return
+            yield item
+    finally:
+        # The client went away before the result: stop the pipeline
+        task.cancel()
@@ -0,0 +1,194 @@
+"""
+TTL / LRU Cache
+In-process cache with an optional SQLite tier shared across processes
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry
+
+    Entries live in an in-process OrderedDict. When db_path is set, entries
+    are also written to a SQLite file, so they survive restarts and are
+    shared by every worker on the host. Values stored on disk must be
+    JSON-serializable.
+    """
+
+    def __init__(self, ttl=None, max_entries=1024, db_path=None, disk_max_entries=None, table='cache'):
+        """
+        Args:
+            ttl: Seconds an entry stays valid (None = never expires)
+            max_entries: Maximum in-memory entries before LRU eviction
+            db_path: Optional SQLite file for the on-disk tier
+            disk_max_entries: Maximum on-disk entries (defaults to 10 x max_entries)
+            table: SQLite table name, so several caches can share one file
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.disk_max_entries = disk_max_entries or max_entries * 10
+        self.table = table
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_prune = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+        if self.db_path:
+            self._init_db()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.db_path:
+            found, value, expires_at = self._disk_get(key, now)
+            if found:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Store value under key (ttl overrides the cache default)"""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._store(key, value, expires_at)
+
+        if self.db_path:
+            self._disk_set(key, value, expires_at)
+
+    def delete(self, key):
+        """Remove key from both tiers"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.db_path:
+            self._execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            self._execute(f'DELETE FROM {self.table}')
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'diskHits': self.disk_hits,
+                'size': len(self._entries)
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, value, expires_at):
+        """Insert into the memory tier (caller holds the lock)"""
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # On-disk tier
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+        # sqlite3 is only imported by caches with an on-disk tier
+        import sqlite3
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql, params=()):
+        import sqlite3
+
+        try:
+            return self._connection().execute(sql, params).fetchall()
+        except sqlite3.Error as e:
+            print(f"Cache database error ({self.db_path}): {e}")
+            return []
+
+    def _init_db(self):
+        import sqlite3
+
+        try:
+            conn = self._connection()
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'expires_at REAL, stored_at REAL NOT NULL)'
+            )
+        except sqlite3.Error as e:
+            print(f"Disabling on-disk cache tier ({self.db_path}): {e}")
+            self.db_path = None
+
+    def _disk_get(self, key, now):
+        rows = self._execute(
+            f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)
+        )
+        if not rows:
+            return False, None, None
+        value, expires_at = rows[0]
+        if expires_at is not None and expires_at <= now:
+            self._execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            return False, None, None
+        return True, json.loads(value), expires_at
+
+    def _disk_set(self, key, value, expires_at):
+        self._execute(
+            f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at, stored_at) VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), expires_at, time.time())
+        )
+
+        # Prune expired and oldest rows every so often rather than on every write
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 100:
+            self._writes_since_prune = 0
+            self._disk_prune()
+
+    def _disk_prune(self):
+        self._execute(f'DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        rows = self._execute(f'SELECT COUNT(*) FROM {self.table}')
+        excess = (rows[0][0] if rows else 0) - self.disk_max_entries
+        if excess > 0:
+            self._execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY stored_at LIMIT ?)',
+                (excess,)
+            )
+            with self._lock:
+                self.evictions += excess
@@ -3,8 +3,33 @@ C.H. Robinson Authentication
 Copied from development/chr_auth.py
 """
 
-import requests
-from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from . import http_client
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the file store then skips locking
+    fcntl = None
+
+
+# Optional JSON file that shares tokens between gunicorn workers and warm
+# Netlify containers on the same host (e.g. /tmp/chr-token.json)
+TOKEN_CACHE_FILE = os.environ.get('CHR_TOKEN_CACHE_FILE')
+
+# Refresh tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 3600
+
+# Process-wide tokens: cache key -> {'token': str, 'expires_at': epoch seconds}
+_tokens = {}
+_token_locks = {}
+_token_locks_guard = threading.Lock()
 
 
 class CHRobinsonAuth:
@@ -17,38 +42,162 @@ class CHRobinsonAuth:
                         else 'https://api.navisphere.com')
         self.token = None
         self.token_expiry = None
+        self.cache_key = hashlib.sha256(f"{self.base_url}|{client_id}".encode()).hexdigest()[:16]
     
     def get_token(self):
-        """Get valid access token, refreshing if necessary"""
+        """
+        Get valid access token, refreshing if necessary
+        
+        Tokens are shared by every CHRobinsonAuth in the process (and, with
+        CHR_TOKEN_CACHE_FILE set, by every process on the host). Only one
+        caller fetches a new token; the others wait for it.
+        """
+        token = self.cached_token()
+        if token:
+            return token
+        
+        with _get_token_lock(self.cache_key):
+            # Another thread may have refreshed while we waited for the lock
+            token = self.cached_token()
+            if token:
+                return token
+            
+            if TOKEN_CACHE_FILE:
+                with _locked_token_file(TOKEN_CACHE_FILE):
+                    cached = _read_token_file(TOKEN_CACHE_FILE).get(self.cache_key)
+                    if not _is_valid(cached):
+                        cached = self.request_token()
+                        _write_token_file(TOKEN_CACHE_FILE, self.cache_key, cached)
+            else:
+                cached = self.request_token()
+            
+            return self.store_token(cached)
+    
+    def cached_token(self):
+        """The token held by this client or the process, or None if a new one is needed"""
         if self.token and self.token_expiry and datetime.now() < self.token_expiry:
             return self.token
         
-        # Request new token
-        url = f'{self.base_url}/v1/oauth/token'
-        payload = {
+        cached = _tokens.get(self.cache_key)
+        if _is_valid(cached):
+            return self._use(cached)
+        return None
+    
+    def store_token(self, cached):
+        """Share a freshly requested token with the process and start using it"""
+        _tokens[self.cache_key] = cached
+        return self._use(cached)
+    
+    def request_token(self):
+        """
+        Request a new token from the OAuth endpoint
+        
+        Returns:
+            dict: {'token': access token, 'expires_at': refresh time in epoch seconds}
+        """
+        response = http_client.post(f'{self.base_url}/v1/oauth/token', json=self.token_request_payload(),
+                                    headers={'Content-Type': 'application/json'})
+        return self.parse_token_response(response)
+    
+    def token_request_payload(self):
+        """Body of the OAuth client-credentials request"""
+        return {
             "client_id": self.client_id,
             "client_secret": self.client_secret,
             "audience": "https://inavisphere.chrobinson.com",
             "grant_type": "client_credentials"
         }
+    
+    @staticmethod
+    def parse_token_response(response):
+        """
+        Read an OAuth token response
         
-        response = requests.post(url, json=payload, 
-                                headers={'Content-Type': 'application/json'})
-        
+        Returns:
+            dict: {'token': access token, 'expires_at': refresh time in epoch seconds}
+            
+        Raises:
+            Exception: If the request failed
+        """
         if response.status_code == 200:
             data = response.json()
-            self.token = data['access_token']
             expires_in = data.get('expires_in', 86400)
-            # Refresh 1 hour early for safety
-            self.token_expiry = datetime.now() + timedelta(seconds=expires_in - 3600)
-            return self.token
+            # Refresh 1 hour early for safety (or halfway through short-lived tokens)
+            lifetime = max(expires_in - TOKEN_REFRESH_MARGIN, expires_in / 2)
+            return {'token': data['access_token'], 'expires_at': time.time() + lifetime}
         else:
             raise Exception(f"Auth failed: {response.status_code} - {response.text}")
     
+    def invalidate_token(self):
+        """Drop the cached token (e.g. after a 401) so the next call fetches a new one"""
+        self.token = None
+        self.token_expiry = None
+        _tokens.pop(self.cache_key, None)
+        if TOKEN_CACHE_FILE:
+            with _locked_token_file(TOKEN_CACHE_FILE):
+                _write_token_file(TOKEN_CACHE_FILE, self.cache_key, None)
+    
     def get_headers(self):
         """Get headers with valid bearer token"""
         return {
             'Authorization': f'Bearer {self.get_token()}',
             'Content-Type': 'application/json'
         }
+    
+    def _use(self, cached):
+        self.token = cached['token']
+        self.token_expiry = datetime.fromtimestamp(cached['expires_at'])
+        return self.token
+
+
+def _is_valid(cached):
+    return bool(cached and cached.get('token') and cached.get('expires_at', 0) > time.time())
+
 
+def _get_token_lock(cache_key):
+    with _token_locks_guard:
+        if cache_key not in _token_locks:
+            _token_locks[cache_key] = threading.Lock()
+        return _token_locks[cache_key]
+
+
+@contextmanager
+def _locked_token_file(path):
+    """Hold an exclusive lock shared by every process using the token file"""
+    fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _read_token_file(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_token_file(path, cache_key, cached):
+    """Update one entry of the token file (caller holds the file lock)"""
+    data = _read_token_file(path)
+    if cached is None:
+        data.pop(cache_key, None)
+    else:
+        data[cache_key] = cached
+    
+    # Write owner-only and swap in atomically so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not write CHR token cache {path}: {e}")
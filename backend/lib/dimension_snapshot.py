@@ -0,0 +1,155 @@
+"""
+Product Dimension Snapshot
+Compiles Product Dimension.xlsx into a compact binary file for fast cold starts
+
+The xlsx stays the source of truth. The snapshot stores the SHA-256 of the
+workbook it was compiled from, and is ignored when the workbook changes.
+
+Rebuild after editing the workbook:
+    python -m lib.dimension_snapshot [path/to/Product Dimension.xlsx ...]
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+
+
+SNAPSHOT_MAGIC = b'SQDIMSNP'
+SNAPSHOT_VERSION = 1
+
+# Header: magic, format version, workbook SHA-256, assembled rows, RTA rows
+HEADER_FORMAT = struct.Struct('<8sH32sII')
+
+# Row: name, Length, Width, Height, weight(kg), Index
+ROW_FORMAT = struct.Struct('<32sddddi')
+
+# Stored Index of rows whose Index cell is blank (read back as NaN, as from the xlsx)
+MISSING_INDEX = -2 ** 31
+
+DEFAULT_EXCEL_PATH = Path(__file__).parent.parent / 'data' / 'Product Dimension.xlsx'
+
+
+def get_snapshot_path(excel_path):
+    """Snapshot file that sits next to the workbook"""
+    return str(Path(excel_path).with_suffix('.snapshot'))
+
+
+def file_digest(path):
+    """SHA-256 of a file's contents"""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def write_snapshot(snapshot_path, source_digest, assembled_rows, rta_rows):
+    """
+    Write dimension rows to a binary snapshot
+
+    Args:
+        snapshot_path: Output file path
+        source_digest: SHA-256 digest of the source workbook
+        assembled_rows, rta_rows: Lists of dicts with name, Length, Width,
+            Height, weight(kg) and Index
+    """
+    parts = [HEADER_FORMAT.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, source_digest,
+        len(assembled_rows), len(rta_rows)
+    )]
+    for row in list(assembled_rows) + list(rta_rows):
+        name = str(row['name']).encode('utf-8')
+        if len(name) > 32:
+            raise ValueError(f"Product name too long for snapshot: {row['name']}")
+        parts.append(ROW_FORMAT.pack(
+            name,
+            float(row['Length']),
+            float(row['Width']),
+            float(row['Height']),
+            float(row['weight(kg)']),
+            pack_index(row['Index'])
+        ))
+
+    # Write to a temp file first so readers never see a partial snapshot
+    tmp_path = f"{snapshot_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(parts))
+    os.replace(tmp_path, snapshot_path)
+
+
+def pack_index(value):
+    """Index cell as stored in a snapshot row (MISSING_INDEX when blank)"""
+    value = float(value)
+    return MISSING_INDEX if math.isnan(value) else int(value)
+
+
+def read_snapshot(snapshot_path, source_digest):
+    """
+    Read dimension rows from a binary snapshot
+
+    Args:
+        snapshot_path: Snapshot file path
+        source_digest: SHA-256 digest of the current workbook
+
+    Returns:
+        tuple: (assembled_rows, rta_rows) as lists of dicts, or None if the
+        snapshot is missing, unreadable or was built from another workbook
+    """
+    try:
+        with open(snapshot_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if len(mm) < HEADER_FORMAT.size:
+                    return None
+                magic, version, digest, n_assembled, n_rta = HEADER_FORMAT.unpack_from(mm, 0)
+                if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or digest != source_digest:
+                    return None
+                if len(mm) != HEADER_FORMAT.size + (n_assembled + n_rta) * ROW_FORMAT.size:
+                    return None
+
+                rows = []
+                for name, length, width, height, weight, index in ROW_FORMAT.iter_unpack(mm[HEADER_FORMAT.size:]):
+                    rows.append({
+                        'name': name.rstrip(b'\0').decode('utf-8'),
+                        'Length': length,
+                        'Width': width,
+                        'Height': height,
+                        'weight(kg)': weight,
+                        'Index': math.nan if index == MISSING_INDEX else index
+                    })
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Could not read dimension snapshot {snapshot_path}: {e}")
+        return None
+
+    return rows[:n_assembled], rows[n_assembled:]
+
+
+def compile_snapshot(excel_path, snapshot_path=None):
+    """
+    Compile a dimension workbook into a binary snapshot
+
+    Args:
+        excel_path: Path to Product Dimension.xlsx
+        snapshot_path: Output path (defaults to get_snapshot_path(excel_path))
+
+    Returns:
+        str: Path of the written snapshot
+    """
+    from .product_dimensions import ProductDimensionsLoader
+
+    snapshot_path = snapshot_path or get_snapshot_path(excel_path)
+    assembled, rta = ProductDimensionsLoader.read_excel(excel_path)
+    write_snapshot(snapshot_path, file_digest(excel_path), assembled, rta)
+    return snapshot_path
+
+
+def main(argv=None):
+    """Rebuild snapshots for the given workbooks (default: data/Product Dimension.xlsx)"""
+    paths = (argv if argv is not None else sys.argv[1:]) or [str(DEFAULT_EXCEL_PATH)]
+    for excel_path in paths:
+        snapshot_path = compile_snapshot(excel_path)
+        print(f"Wrote {snapshot_path} ({os.path.getsize(snapshot_path)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
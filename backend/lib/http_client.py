@@ -0,0 +1,116 @@
+"""
+Shared HTTP Client
+Process-lifetime requests session with keep-alive connection pooling
+
+Every outbound call (inFlow, C.H. Robinson, ZIP lookups) goes through this
+module so TCP/TLS connections are reused across requests and every call
+gets a timeout.
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from . import metrics, timing
+
+
+# Keep-alive connections kept open per upstream host
+HOST_POOL_SIZES = {
+    'cloudapi.inflowinventory.com': int(os.environ.get('INFLOW_POOL_SIZE', 16)),
+    'api.navisphere.com': int(os.environ.get('CHR_POOL_SIZE', 8)),
+    'sandbox-api.navisphere.com': int(os.environ.get('CHR_POOL_SIZE', 8)),
+    'api.zippopotam.us': 4
+}
+DEFAULT_POOL_SIZE = 4
+
+# (connect, read) timeouts in seconds, used when the caller passes none
+HOST_TIMEOUTS = {
+    'cloudapi.inflowinventory.com': (5, 60),
+    'api.navisphere.com': (5, 60),
+    'sandbox-api.navisphere.com': (5, 60),
+    'api.zippopotam.us': (3, 10)
+}
+DEFAULT_TIMEOUT = (5, 30)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Get the process-wide session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def _create_session():
+    # requests is imported on first use, keeping it off the import path of
+    # callers that never make a request (cold starts, CLI tools)
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+
+    # Fallback pools for any other host
+    default_adapter = HTTPAdapter(pool_maxsize=DEFAULT_POOL_SIZE)
+    session.mount('https://', default_adapter)
+    session.mount('http://', default_adapter)
+
+    # Dedicated pool per upstream (requests picks the longest matching prefix)
+    for host, pool_size in HOST_POOL_SIZES.items():
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount(f'https://{host}', adapter)
+        session.mount(f'http://{host}', adapter)
+
+    return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Send a request through the shared session
+
+    Args:
+        method: HTTP method
+        url: Full URL
+        timeout: Seconds or (connect, read) tuple; defaults to the host's timeout
+        **kwargs: Passed through to requests (headers, json, ...)
+
+    Returns:
+        requests.Response
+    """
+    host = urlsplit(url).hostname
+    if timeout is None:
+        timeout = HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+    upstream = metrics.upstream_name(host)
+    status = 'error'
+    start = time.perf_counter()
+    try:
+        with timing.span('http', method=method, host=host, path=urlsplit(url).path) as span:
+            response = get_session().request(method, url, timeout=timeout, **kwargs)
+            status = span['status'] = response.status_code
+        return response
+    finally:
+        metrics.upstream_latency.observe(time.perf_counter() - start, upstream=upstream, method=method)
+        metrics.upstream_requests.inc(upstream=upstream, method=method, status=status)
+
+
+def __getattr__(name):
+    """Resolve Timeout (requests.exceptions.Timeout) without importing requests up front"""
+    if name == 'Timeout':
+        from requests.exceptions import Timeout
+        return Timeout
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get(url, **kwargs):
+    """GET through the shared session"""
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST through the shared session"""
+    return request('POST', url, **kwargs)
@@ -0,0 +1,221 @@
+"""
+Operational Metrics
+Process-wide counters, gauges and histograms rendered in the Prometheus
+text exposition format
+
+Updating a metric takes one lock and a dict lookup, so instrumenting the
+hot path costs microseconds. Values computed elsewhere (cache statistics,
+in-flight calls) are read only when /metrics is scraped, via CallbackMetric.
+
+Each process keeps its own values; scrape every worker, or run one worker
+per container.
+"""
+
+import threading
+from bisect import bisect_left
+
+
+# Latency buckets in seconds, from local work up to slow upstream calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Upstream names by host, used as the "upstream" label
+UPSTREAM_HOSTS = {
+    'cloudapi.inflowinventory.com': 'inflow',
+    'api.navisphere.com': 'chr',
+    'sandbox-api.navisphere.com': 'chr',
+    'api.zippopotam.us': 'zip'
+}
+
+
+class Registry:
+    """Set of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class CallbackMetric(_Metric):
+    """Counter or gauge whose samples are computed when metrics are rendered"""
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, metric_type='gauge',
+                 registry=REGISTRY):
+        """
+        Args:
+            callback: Returns an iterable of (labels dict, value)
+            metric_type: "gauge" or "counter"
+        """
+        super().__init__(name, documentation, labelnames, registry)
+        self.callback = callback
+        self.type = metric_type
+
+    def samples(self):
+        try:
+            values = list(self.callback())
+        except Exception as e:
+            print(f"Metric {self.name} failed: {e}")
+            return []
+        return [
+            f"{self.name}{_format_labels(self.labelnames, self._key(labels))} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (e.g. latencies in seconds)"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def upstream_name(host):
+    """"inflow", "chr", "zip" or the host itself"""
+    return UPSTREAM_HOSTS.get(host, host or 'unknown')
+
+
+# Metrics recorded by the library modules
+
+upstream_requests = Counter(
+    'freight_upstream_requests_total', 'Outbound HTTP calls by upstream and status',
+    ['upstream', 'method', 'status'])
+upstream_latency = Histogram(
+    'freight_upstream_request_duration_seconds', 'Outbound HTTP call latency',
+    ['upstream', 'method'])
+inflow_retries = Counter(
+    'freight_inflow_retries_total', 'inFlow calls retried by fetch_with_retries, by reason',
+    ['reason'])
+inflow_rate_limited = Counter(
+    'freight_inflow_rate_limited_total', 'inFlow responses with status 429')
+quote_stage_latency = Histogram(
+    'freight_quote_stage_duration_seconds', 'Quote pipeline step latency (stage="total" for the whole quote)',
+    ['stage'])
+quotes = Counter(
+    'freight_quotes_total', 'Quote pipeline runs by outcome',
+    ['outcome'])
+zip_lookups = Counter(
+    'freight_zip_lookups_total', 'ZIP code lookups by source (bundled, remote_cache, remote, miss)',
+    ['source'])
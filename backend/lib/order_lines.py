@@ -0,0 +1,149 @@
+"""
+Order Lines
+Lightweight per-request representation of an order's products
+
+Each line is a small __slots__ object instead of a DataFrame row, so a
+5-50 line order is processed without building, merging or iterating
+DataFrames. Sums reproduce pandas' results bit for bit (NumPy pairwise
+summation for column totals, Kahan summation for grouped quantities), so
+pallets and totals are unchanged.
+
+pandas is only needed for to_dataframe(), for offline analysis.
+"""
+
+import math
+
+
+KG_TO_LB = 2.20462
+
+NAN = float('nan')
+
+
+class OrderLine:
+    """One product on an order, with its dimensions once merged"""
+
+    __slots__ = ('name', 'quantity', 'product_type', 'length', 'width', 'height', 'weight_kg', 'index')
+
+    def __init__(self, name, quantity, product_type=None, length=NAN, width=NAN, height=NAN,
+                 weight_kg=NAN, index=NAN):
+        self.name = name
+        self.quantity = quantity
+        self.product_type = product_type
+        self.length = length
+        self.width = width
+        self.height = height
+        self.weight_kg = weight_kg
+        self.index = index
+
+    def __repr__(self):
+        return f"OrderLine({self.name!r}, quantity={self.quantity!r}, product_type={self.product_type!r})"
+
+    @property
+    def has_dimensions(self):
+        """True when a dimension row was found (Length is set)"""
+        return not is_missing(self.length)
+
+    @property
+    def volume(self):
+        """Cubic inches for the whole line"""
+        return self.length * self.width * self.height * self.quantity
+
+    @property
+    def weight_lb(self):
+        """Pounds for the whole line"""
+        return self.weight_kg * self.quantity * KG_TO_LB
+
+    def to_dict(self):
+        """Row in the column names the pandas version used"""
+        return {
+            'name': self.name,
+            'quantity': self.quantity,
+            'ProductType': self.product_type,
+            'Length': self.length,
+            'Width': self.width,
+            'Height': self.height,
+            'weight(kg)': self.weight_kg,
+            'Index': self.index
+        }
+
+
+def is_missing(value):
+    """None or NaN"""
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def product_type_of(name):
+    """
+    Product type from a product name (the part after the first "-")
+
+    Matches pandas' name.str.split('-').str[1].astype(str): names without
+    a "-" (or that are not strings) give 'nan'.
+    """
+    if not isinstance(name, str):
+        return 'nan'
+    parts = name.split('-')
+    return parts[1] if len(parts) > 1 else 'nan'
+
+
+def to_number(value):
+    """Parse a quantity like pd.to_numeric(errors='coerce'): NaN when invalid"""
+    if isinstance(value, bool) or value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def column_sum(values):
+    """
+    Sum like pandas Series.sum(): NaN counts as 0 and the float result
+    matches NumPy's pairwise summation exactly
+    """
+    values = [0.0 if is_missing(value) else value for value in values]
+    return _pairwise_sum(values, 0, len(values))
+
+
+def _pairwise_sum(values, start, count):
+    # Same blocking as NumPy's pairwise_sum (8 accumulators, 128-item blocks)
+    if count < 8:
+        total = 0.0
+        for i in range(start, start + count):
+            total += values[i]
+        return total
+    if count <= 128:
+        acc = values[start:start + 8]
+        end = count - count % 8
+        for i in range(8, end, 8):
+            for j in range(8):
+                acc[j] += values[start + i + j]
+        total = ((acc[0] + acc[1]) + (acc[2] + acc[3])) + ((acc[4] + acc[5]) + (acc[6] + acc[7]))
+        for i in range(end, count):
+            total += values[start + i]
+        return total
+    half = count // 2
+    half -= half % 8
+    return _pairwise_sum(values, start, half) + _pairwise_sum(values, start + half, count - half)
+
+
+def group_sum(values):
+    """Sum like pandas groupby().sum(): NaN skipped, Kahan-compensated"""
+    total = 0.0
+    compensation = 0.0
+    for value in values:
+        if is_missing(value):
+            continue
+        y = value - compensation
+        t = total + y
+        compensation = t - total - y
+        if compensation != compensation:
+            compensation = 0.0
+        total = t
+    return total
+
+
+def to_dataframe(lines):
+    """Order lines as a DataFrame (requires pandas; for offline analysis)"""
+    import pandas as pd
+
+    return pd.DataFrame([line.to_dict() for line in lines])
@@ -0,0 +1,315 @@
+"""
+Batch Pallet Calculation
+Pallets and freight classes for many orders in one vectorized pass
+
+Takes the order lines of many orders as columns (order, quantity, Length,
+Width, Height, weight(kg), Index; the names of OrderLine.to_dict) and
+computes what calculate_pallets, adjust_low_height_pallets and
+build_freight_items give for each order, bit for bit: per-order sums use
+the same pairwise summation as column_sum and pallets come from
+pallet_engine. Large tables can be split across processes.
+
+Run from backend/ on a CSV of order lines:
+    python -m lib.pallet_batch lines.csv [--workers 4] > pallets.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .freight import FREIGHT_CLASS_MAP, LONG_PALLET_DIMENSIONS, STANDARD_PALLET_DIMENSIONS
+from .order_lines import KG_TO_LB
+from .pallet_engine import PalletTable, allocate, adjust_low_height
+
+
+# Order line columns read by calculate_batch
+LINE_COLUMNS = ('order', 'quantity', 'Length', 'Width', 'Height', 'weight(kg)', 'Index')
+
+# Orders per process when calculate_batch splits a table
+BATCH_CHUNK_ORDERS = int(os.environ.get('PALLET_BATCH_CHUNK_ORDERS', 5000))
+
+_THRESHOLDS = np.array([threshold for threshold, _ in reversed(FREIGHT_CLASS_MAP)], dtype=float)
+_CLASSES = np.array([freight_class for _, freight_class in reversed(FREIGHT_CLASS_MAP)] + [500], dtype=object)
+
+
+def lines_to_columns(orders):
+    """
+    Columns for calculate_batch from order lines
+
+    Args:
+        orders: Mapping of order key -> list of OrderLine with dimensions
+
+    Returns:
+        dict: Column name -> list
+    """
+    columns = {name: [] for name in LINE_COLUMNS}
+    for key, lines in orders.items():
+        for line in lines:
+            row = line.to_dict()
+            row['order'] = key
+            for name in LINE_COLUMNS:
+                columns[name].append(row[name])
+    return columns
+
+
+def segment_sums(values, counts):
+    """
+    column_sum of consecutive segments of values, all at once
+
+    Reproduces NumPy's pairwise summation (8 accumulators, 128-item blocks)
+    for each segment. Segments longer than 128 items are split in two and
+    summed the same way, as NumPy does.
+
+    Args:
+        values: Float array (NaN counts as 0)
+        counts: Items per segment
+
+    Returns:
+        numpy.ndarray: One sum per segment
+    """
+    values = np.where(np.isnan(values), 0.0, values)
+    counts = np.asarray(counts, dtype=np.int64)
+    starts = np.cumsum(counts) - counts
+    sums = np.zeros(len(counts))
+
+    segment = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(len(values)) - starts[segment]
+    size = counts[segment]
+    blocked_end = np.where(size >= 8, size - size % 8, 0)
+
+    # Eight running accumulators over whole blocks of eight (zero padding is exact)
+    blocked_segments = (counts >= 8) & (counts <= 128)
+    row = np.cumsum(blocked_segments) - 1
+    in_block = (position < blocked_end) & (size <= 128)
+    blocks = np.zeros((int(blocked_segments.sum()), 16, 8))
+    blocks[row[segment[in_block]], position[in_block] // 8, position[in_block] % 8] = values[in_block]
+    a = blocks[:, 0, :].copy()
+    for block in range(1, 16):
+        a += blocks[:, block, :]
+    sums[blocked_segments] = ((a[:, 0] + a[:, 1]) + (a[:, 2] + a[:, 3])) + ((a[:, 4] + a[:, 5]) + (a[:, 6] + a[:, 7]))
+
+    # Then the items after the last whole block, one at a time
+    in_tail = (position >= blocked_end) & (size <= 128)
+    tail = np.zeros((len(counts), 8))
+    tail[segment[in_tail], position[in_tail] - blocked_end[in_tail]] = values[in_tail]
+    for column in range(8):
+        sums = sums + tail[:, column]
+
+    large = counts > 128
+    if large.any():
+        half = counts[large] // 2
+        half -= half % 8
+        halves = np.stack((half, counts[large] - half), axis=1).ravel()
+        parts = segment_sums(values[large[segment]], halves)
+        sums[large] = parts[0::2] + parts[1::2]
+    return sums
+
+
+def freight_columns(table):
+    """
+    build_freight_items for every pallet in a table
+
+    Returns:
+        dict: length, width, height, weight (rounded, as sent to C.H. Robinson)
+            and freightClass arrays, one entry per pallet
+    """
+    length = np.where(table.long, LONG_PALLET_DIMENSIONS['length'], STANDARD_PALLET_DIMENSIONS['length'])
+    width = np.where(table.long, LONG_PALLET_DIMENSIONS['width'], STANDARD_PALLET_DIMENSIONS['width'])
+    weight = table.weight + np.where(table.long, 100.0, 50.0)
+    height = table.height + np.where(table.height >= 96, 0.0, 5.0)
+
+    with np.errstate(all='ignore'):
+        density = weight / (((length * width) * height) / 1728)
+    # Highest threshold the density reaches; below every threshold (or NaN) is class 500
+    position = np.searchsorted(_THRESHOLDS, density, side='right') - 1
+    position = np.where(np.isnan(density) | (position < 0), len(_THRESHOLDS), position)
+
+    return {
+        'length': length,
+        'width': width,
+        'height': np.round(height).astype(np.int64),
+        'weight': np.round(weight).astype(np.int64),
+        'freightClass': _CLASSES[position]
+    }
+
+
+def _calculate(columns):
+    """calculate_batch for one chunk, in this process"""
+    keys, first, inverse = np.unique(np.asarray(columns['order']), return_index=True, return_inverse=True)
+    # Orders in first-seen order, each order's lines in table order
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(keys))
+    group = rank[inverse.ravel()]
+    line_order = np.argsort(group, kind='stable')
+    group = group[line_order]
+    keys = keys[np.argsort(first, kind='stable')]
+    counts = np.bincount(group, minlength=len(keys))
+
+    def column(name):
+        return np.asarray(columns[name], dtype=float)[line_order]
+
+    quantity = column('quantity')
+    weight_kg = column('weight(kg)')
+    volume = column('Length') * column('Width') * column('Height') * quantity
+    index_100 = column('Index') == 100
+
+    total_volume = segment_sums(volume, counts)
+    total_weight = segment_sums(weight_kg * quantity * KG_TO_LB, counts)
+    # Index 100 sums over the Index 100 lines only (line weight in lbs times quantity again)
+    index_100_counts = np.bincount(group[index_100], minlength=len(keys))
+    index_100_volume = segment_sums(volume[index_100], index_100_counts)
+    index_100_weight = segment_sums((weight_kg * quantity * KG_TO_LB * quantity)[index_100], index_100_counts)
+    has_100 = index_100_counts > 0
+    situations = np.where(has_100, "Contains Index 100", "Index 0 Only")
+
+    # Orders without volume or pallets are errors (the single-order functions raise)
+    errors = ~(total_volume > 0) | ~np.isfinite(total_volume)
+    usable = np.where(errors, "", situations)
+    table = allocate(usable.tolist(), np.where(errors, 1.0, total_volume), total_weight,
+                     index_100_volume, index_100_weight)
+    table = adjust_low_height(table, np.where(errors, 1.0, total_volume), total_weight)
+    errors |= table.counts() == 0
+
+    return {
+        'orders': {
+            'order': keys,
+            'orderSituation': situations,
+            'totalVolume': total_volume,
+            'totalWeight': total_weight,
+            'pallets': table.counts(),
+            'error': np.where(errors, 'Order has nothing to palletize', None)
+        },
+        'pallets': dict({
+            'order': table.order,
+            'palletType': np.where(table.long, 'Long', 'Standard'),
+            'originalHeight': table.height,
+            'heightIsLimit': table.limit,
+            'palletWeight': table.weight
+        }, **freight_columns(table))
+    }
+
+
+def calculate_batch(columns, workers=None, chunk_orders=BATCH_CHUNK_ORDERS):
+    """
+    Pallets and freight items for many orders
+
+    Args:
+        columns: Mapping of LINE_COLUMNS names to sequences (a dict of lists,
+            a dict of arrays or a pandas DataFrame), one row per order line
+            with dimensions
+        workers: Processes to split the table across (None or 1: this process)
+        chunk_orders: Orders per chunk when splitting
+
+    Returns:
+        dict: {"orders": per-order columns (order, orderSituation,
+            totalVolume, totalWeight, pallets, error),
+            "pallets": per-pallet columns (order position, palletType,
+            originalHeight, heightIsLimit, palletWeight and the freight item
+            length, width, height, weight, freightClass)}
+    """
+    columns = {name: np.asarray(columns[name]) for name in LINE_COLUMNS}
+    if not workers or workers <= 1:
+        return _calculate(columns)
+
+    chunks = _split(columns, chunk_orders)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_calculate, chunks))
+    return _concatenate(results)
+
+
+def _split(columns, chunk_orders):
+    """Split line columns into chunks of whole orders, in first-seen order"""
+    keys, first, inverse = np.unique(columns['order'], return_index=True, return_inverse=True)
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(keys))
+    chunk = rank[inverse.ravel()] // max(1, chunk_orders)
+    return [{name: values[chunk == i] for name, values in columns.items()} for i in range(int(chunk.max()) + 1)]
+
+
+def _concatenate(results):
+    """Join chunk results, renumbering pallet order positions"""
+    offsets = np.cumsum([0] + [len(result['orders']['order']) for result in results])
+    merged = {}
+    for part in ('orders', 'pallets'):
+        merged[part] = {name: np.concatenate([result[part][name] for result in results])
+                        for name in results[0][part]}
+    merged['pallets']['order'] = np.concatenate([result['pallets']['order'] + offset
+                                                 for result, offset in zip(results, offsets)])
+    return merged
+
+
+def order_results(result):
+    """
+    Per-order pallets and freight items from a calculate_batch result
+
+    Returns:
+        list: (pallets, freight_items) per order, as adjust_low_height_pallets
+            and build_freight_items return them (None, None for orders with
+            an error)
+    """
+    orders = result['orders']
+    pallets = result['pallets']
+    n_orders = len(orders['order'])
+    table = PalletTable(pallets['order'], pallets['palletType'] == 'Long', pallets['originalHeight'],
+                        pallets['heightIsLimit'], pallets['palletWeight'], n_orders)
+    pallet_lists = table.to_lists()
+
+    items = [{
+        'Length': length,
+        'Width': width,
+        'Height': height,
+        'Weight': weight,
+        'Stackable': False,
+        'Hazmat': False,
+        'FreightClass': freight_class
+    } for length, width, height, weight, freight_class in zip(
+        pallets['length'].tolist(), pallets['width'].tolist(), pallets['height'].tolist(),
+        pallets['weight'].tolist(), pallets['freightClass'].tolist())]
+    offsets = table.offsets().tolist()
+
+    results = []
+    for i in range(n_orders):
+        if orders['error'][i] is not None:
+            results.append((None, None))
+        else:
+            results.append((pallet_lists[i], items[offsets[i]:offsets[i + 1]]))
+    return results
+
+
+def read_lines_csv(path):
+    """Line columns from a CSV with the LINE_COLUMNS headers"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return {name: [row[name] if name == 'order' else float(row[name] or 'nan') for row in rows]
+            for name in LINE_COLUMNS}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pallets and freight classes for a CSV of order lines')
+    parser.add_argument('path', help=f"CSV with columns {', '.join(LINE_COLUMNS)}")
+    parser.add_argument('--workers', type=int, default=1, help='Processes to use')
+    args = parser.parse_args(argv)
+
+    result = calculate_batch(read_lines_csv(args.path), workers=args.workers)
+    orders = result['orders']
+    pallets = result['pallets']
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['order', 'orderSituation', 'pallet', 'palletType', 'length', 'width', 'height',
+                     'weight', 'freightClass', 'error'])
+    offsets = np.concatenate(([0], np.cumsum(orders['pallets']))).tolist()
+    for i, key in enumerate(orders['order'].tolist()):
+        if orders['error'][i] is not None:
+            writer.writerow([key, orders['orderSituation'][i], '', '', '', '', '', '', '', orders['error'][i]])
+            continue
+        for number, at in enumerate(range(offsets[i], offsets[i + 1]), start=1):
+            writer.writerow([key, orders['orderSituation'][i], number, pallets['palletType'][at],
+                             pallets['length'][at], pallets['width'][at], pallets['height'][at],
+                             pallets['weight'][at], pallets['freightClass'][at], ''])
+
+
+if __name__ == '__main__':
+    main()
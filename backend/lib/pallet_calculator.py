@@ -3,6 +3,8 @@ Pallet Calculation Logic
 Ported from development/main.py lines 582-760
 """
 
+from .order_lines import KG_TO_LB, column_sum
+
 # Pallet specifications
 STANDARD_PALLET_LENGTH = 48
 STANDARD_PALLET_WIDTH = 40
@@ -18,12 +20,15 @@ PALLET_HEIGHT_LIMIT = 60  # Maximum pallet height (in inches)
 PALLET_WEIGHT_LIMIT = 2200  # Maximum pallet weight (in lbs)
 
 
-def determine_order_situation(products_df):
+def determine_order_situation(products):
     """
     Determine if order contains Index 100 products
     Ported from development/main.py lines 596-604
+    
+    Args:
+        products: List of OrderLine with dimensions
     """
-    if 100 in products_df['Index'].values:
+    if any(line.index == 100 for line in products):
         return "Contains Index 100"
     else:
         return "Index 0 Only"
@@ -35,22 +40,47 @@ def calculate_pallets(selected_sales_order, order_situation):
     Ported from development/main.py lines 606-760
     
     Args:
-        selected_sales_order: DataFrame with product information
+        selected_sales_order: List of OrderLine with dimensions
         order_situation: String indicating order type
         
     Returns:
         tuple: (pallets list, total_weight, total_volume)
     """
-    pallets = []
-    
     # Calculate total volume and weight
-    total_volume = (selected_sales_order['Length'] * 
-                    selected_sales_order['Width'] * 
-                    selected_sales_order['Height'] * 
-                    selected_sales_order['quantity']).sum()
-    total_weight = (selected_sales_order['weight(kg)'] * 
-                    selected_sales_order['quantity'] * 
-                    2.20462).sum()  # Convert to lbs
+    total_volume = column_sum([line.volume for line in selected_sales_order])
+    total_weight = column_sum([line.weight_lb for line in selected_sales_order])  # Convert to lbs
+
+    index_100_volume = index_100_weight = 0.0
+    if order_situation == "Contains Index 100":
+        index_100_products = [line for line in selected_sales_order if line.index == 100]
+        index_100_volume = column_sum([line.volume for line in index_100_products])
+        # Line weight in lbs times quantity again, as in the original script
+        index_100_weight = column_sum([line.weight_kg * line.quantity * KG_TO_LB * line.quantity
+                                       for line in index_100_products])
+
+    pallets = allocate_pallets(order_situation, total_volume, total_weight, index_100_volume, index_100_weight)
+    return pallets, total_weight, total_volume
+
+
+def allocate_pallets(order_situation, total_volume, total_weight, index_100_volume, index_100_weight):
+    """
+    Allocate pallets for an order's totals (the loops behind calculate_pallets)
+    
+    pallet_engine (batch recalculation only) computes the same pallets
+    arithmetically for many orders at once and falls back to this function
+    for edge cases.
+    
+    Args:
+        order_situation: String indicating order type
+        total_volume: Total order volume (cubic inches)
+        total_weight: Total order weight (lbs)
+        index_100_volume: Volume of the Index 100 lines
+        index_100_weight: Weight assigned to the Index 100 lines
+        
+    Returns:
+        list: Pallet dictionaries with Type, Height, Weight
+    """
+    pallets = []
 
     if order_situation == "Index 0 Only":
         # Situation 1: All Index 0 products
@@ -72,14 +102,6 @@ def calculate_pallets(selected_sales_order, order_situation):
 
     elif order_situation == "Contains Index 100":
         # Situation 3: Contains Index 100 products
-        index_100_products = selected_sales_order[selected_sales_order['Index'] == 100]
-        index_100_volume = (index_100_products['Length'] *
-                            index_100_products['Width'] *
-                            index_100_products['Height'] *
-                            index_100_products['quantity']).sum()
-        index_100_weight = (index_100_products['Weight (lb)'] *
-                            index_100_products['quantity']).sum()
-
         height_100 = index_100_volume / LONG_PALLET_BASE_AREA
         remaining_volume = total_volume - index_100_volume
         remaining_weight = total_weight - index_100_weight
@@ -157,7 +179,7 @@ def calculate_pallets(selected_sales_order, order_situation):
         # Calculate weight based on actual pallet volume
         pallet['Weight'] = (pallet_volume / total_volume) * total_weight
 
-    return pallets, total_weight, total_volume
+    return pallets
 
 
 def adjust_low_height_pallets(pallets, total_volume, total_weight):
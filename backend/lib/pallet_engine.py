@@ -0,0 +1,374 @@
+"""
+Pallet Allocation Engine
+NumPy version of pallet_calculator for recalculating many orders at once
+
+Computes the pallets allocate_pallets and adjust_low_height_pallets build,
+bit for bit, without a Python loop per pallet. Peeling PALLET_HEIGHT_LIMIT
+slices off a height is exact in floating point, so pallet counts, heights
+and the remainders are closed-form. The one sequential quantity, the
+weight left for the last long pallet, is used only to decide how much
+weight the remaining products put on it; it is estimated in closed form
+and trusted only when no comparison downstream is within its error bound.
+Orders that hit such a boundary (or odd input: zero volume, NaN, huge
+values) are handed to the loops in pallet_calculator.
+
+Pallets of many orders are kept as columns (PalletTable), grouped by order.
+The engine has about half a millisecond of fixed cost per call, so a single
+quote (the loops take microseconds per pallet) never comes out ahead; it is
+used for batch recalculation (pallet_batch) only.
+"""
+
+import numpy as np
+
+from .pallet_calculator import (STANDARD_PALLET_BASE_AREA, LONG_PALLET_BASE_AREA, PALLET_HEIGHT_LIMIT,
+                                PALLET_WEIGHT_LIMIT, allocate_pallets, adjust_low_height_pallets)
+
+STANDARD_AREA = float(STANDARD_PALLET_BASE_AREA)
+LONG_AREA = float(LONG_PALLET_BASE_AREA)
+HEIGHT_LIMIT = float(PALLET_HEIGHT_LIMIT)
+WEIGHT_LIMIT = float(PALLET_WEIGHT_LIMIT)
+STANDARD_SLICE = HEIGHT_LIMIT * STANDARD_AREA
+LONG_SLICE = HEIGHT_LIMIT * LONG_AREA
+
+EPS = np.finfo(float).eps
+
+# Above this, subtracting a slice may round; such orders use the loops
+MAX_EXACT = 2.0 ** 40
+
+# Volume-remainder steps computed for weight-bound standard pallets
+TAIL_STEPS = 6
+
+# Earlier pallets a low last pallet may be spread over before the loops take over
+ABSORB_PASSES = 4
+
+SITUATIONS = {"Index 0 Only": 0, "Contains Index 100": 1}
+
+
+class PalletTable:
+    """
+    Pallets of many orders as columns, grouped by order in allocation order
+
+    Attributes:
+        order: Order position of each pallet (non-decreasing)
+        long: True for long pallets, False for standard
+        height: Pallet height (inches)
+        limit: True where the height is PALLET_HEIGHT_LIMIT as the int the
+            loops store (so responses print 60, not 60.0)
+        weight: Pallet weight (lbs)
+        n_orders: Number of orders, including orders without pallets
+    """
+
+    __slots__ = ('order', 'long', 'height', 'limit', 'weight', 'n_orders')
+
+    def __init__(self, order, long, height, limit, weight, n_orders):
+        self.order = order
+        self.long = long
+        self.height = height
+        self.limit = limit
+        self.weight = weight
+        self.n_orders = n_orders
+
+    def __len__(self):
+        return len(self.order)
+
+    def counts(self):
+        """Pallets per order"""
+        return np.bincount(self.order, minlength=self.n_orders)
+
+    def offsets(self):
+        """Start of each order's pallets, plus the end"""
+        return np.concatenate(([0], np.cumsum(self.counts())))
+
+    def base_area(self):
+        return np.where(self.long, LONG_AREA, STANDARD_AREA)
+
+    def to_lists(self):
+        """Pallet dictionaries per order, as pallet_calculator returns them"""
+        types = np.where(self.long, 'Long', 'Standard').tolist()
+        heights = self.height.tolist()
+        for i in np.flatnonzero(self.limit).tolist():
+            heights[i] = PALLET_HEIGHT_LIMIT
+        weights = self.weight.tolist()
+        pallets = [{'Type': t, 'Height': h, 'Weight': w} for t, h, w in zip(types, heights, weights)]
+
+        offsets = self.offsets().tolist()
+        return [pallets[offsets[i]:offsets[i + 1]] for i in range(self.n_orders)]
+
+    @classmethod
+    def from_lists(cls, pallet_lists, orders=None, n_orders=None):
+        """
+        Build a table from pallet dictionary lists
+
+        Args:
+            pallet_lists: One list of pallets per order
+            orders: Order position of each list (defaults to 0, 1, ...)
+            n_orders: Number of orders in the table (defaults to len(pallet_lists))
+        """
+        orders = range(len(pallet_lists)) if orders is None else orders
+        rows = [(order, pallet) for order, pallets in zip(orders, pallet_lists) for pallet in pallets]
+        return cls(
+            np.array([order for order, _ in rows], dtype=np.int64),
+            np.array([pallet['Type'] == 'Long' for _, pallet in rows], dtype=bool),
+            np.array([pallet['Height'] for _, pallet in rows], dtype=float),
+            np.array([type(pallet['Height']) is int and pallet['Height'] == PALLET_HEIGHT_LIMIT
+                      for _, pallet in rows], dtype=bool),
+            np.array([pallet['Weight'] for _, pallet in rows], dtype=float),
+            len(pallet_lists) if n_orders is None else n_orders
+        )
+
+    def merge(self, other):
+        """Table with other's pallets added after this table's pallets of the same order"""
+        order = np.concatenate((self.order, other.order))
+        index = np.argsort(order, kind='stable')
+        return PalletTable(order[index], np.concatenate((self.long, other.long))[index],
+                           np.concatenate((self.height, other.height))[index],
+                           np.concatenate((self.limit, other.limit))[index],
+                           np.concatenate((self.weight, other.weight))[index], self.n_orders)
+
+
+def _slices_above(x, size):
+    """
+    Iterations of `while x > size: x -= size` and what is left of x
+
+    Exact when size is a multiple of x's unit in the last place (see MAX_EXACT).
+    """
+    count = np.where(x > size, np.ceil(x / size) - 1, 0)
+    # The quotient may be off by one; check against the exact remainders
+    count = np.where(x - count * size > size, count + 1, count)
+    count = np.where((count > 0) & (x - (count - 1) * size <= size), count - 1, count)
+    return count.astype(np.int64), x - count * size
+
+
+def _segments(counts):
+    """Owner and position within its segment for counts[i] items per order"""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    return owner, np.arange(len(owner)) - np.repeat(starts, counts)
+
+
+def allocate(order_situation, total_volume, total_weight, index_100_volume, index_100_weight):
+    """
+    allocate_pallets for many orders
+
+    Args:
+        order_situation: Sequence of order situation strings (see determine_order_situation)
+        total_volume, total_weight, index_100_volume, index_100_weight: Sequences
+            of the allocate_pallets arguments, one value per order
+
+    Returns:
+        PalletTable: Pallets (with weights) of every order
+    """
+    situation = np.array([SITUATIONS.get(value, -1) for value in order_situation], dtype=np.int64)
+    tv = np.asarray(total_volume, dtype=float)
+    tw = np.asarray(total_weight, dtype=float)
+    v100 = np.where(situation == 1, np.asarray(index_100_volume, dtype=float), 0.0)
+    w100 = np.where(situation == 1, np.asarray(index_100_weight, dtype=float), 0.0)
+    n = len(situation)
+    has_100 = situation == 1
+    index_0 = situation == 0
+
+    with np.errstate(all='ignore'):
+        fallback = ~(np.isfinite(tv) & np.isfinite(tw) & np.isfinite(v100) & np.isfinite(w100))
+        fallback |= (situation >= 0) & ((tv <= 0) | (np.abs(tv) > MAX_EXACT) | (np.abs(tw) > MAX_EXACT)
+                                        | (np.abs(v100) > MAX_EXACT) | (np.abs(w100) > MAX_EXACT))
+        tv = np.where(fallback, 1.0, tv)
+        tw = np.where(fallback, 0.0, tw)
+        v100 = np.where(fallback, 0.0, v100)
+        w100 = np.where(fallback, 0.0, w100)
+
+        # Index 0 only: full standard pallets, then what is left
+        height_0 = tv / STANDARD_AREA
+        full_0, rest_0 = _slices_above(height_0, HEIGHT_LIMIT)
+
+        # Index 100: long pallets while there is height and weight left
+        height_100 = v100 / LONG_AREA
+        full_long, last_long = _slices_above(height_100, HEIGHT_LIMIT)
+        n_long = np.where(has_100 & (height_100 > 0) & (w100 > 0), full_long + 1, 0)
+        remaining_volume = tv - v100
+        remaining_weight = tw - w100
+
+        # Each long pallet takes weight in proportion to its volume, capped at
+        # the weight limit: a run of capped pallets (exact), then each takes
+        # a share of what is left (a product, estimated)
+        share = (LONG_SLICE / v100)
+        share_last = (last_long * LONG_AREA) / v100
+        # A share rounding to 1 would end the long pallets early
+        fallback |= (n_long > 1) & (share >= 1 - 1e-9)
+        capped = np.zeros(n, dtype=np.int64)
+        several = n_long > 1
+        if several.any():
+            guess = np.floor((w100 - WEIGHT_LIMIT / share) / WEIGHT_LIMIT) + 1
+            capped = np.clip(np.nan_to_num(guess), 0, np.maximum(n_long - 1, 0)).astype(np.int64)
+            for _ in range(2):
+                capped = np.where((capped < n_long - 1) & ((w100 - capped * WEIGHT_LIMIT) * share >= WEIGHT_LIMIT),
+                                  capped + 1, capped)
+                capped = np.where((capped > 0) & ((w100 - (capped - 1) * WEIGHT_LIMIT) * share < WEIGHT_LIMIT),
+                                  capped - 1, capped)
+            fallback |= several & (capped < n_long - 1) & ((w100 - capped * WEIGHT_LIMIT) * share >= WEIGHT_LIMIT)
+            fallback |= several & (capped > 0) & ((w100 - (capped - 1) * WEIGHT_LIMIT) * share < WEIGHT_LIMIT)
+        shared = np.maximum(n_long - 1 - capped, 0)
+        weight_before_last = (w100 - capped * WEIGHT_LIMIT) * np.power(1 - share, shared)
+        last_weight_raw = weight_before_last * share_last
+        last_weight = np.minimum(last_weight_raw, WEIGHT_LIMIT)
+        # Zero when exact; otherwise a bound on the estimate's error
+        error = np.where(shared > 0, last_weight_raw * (shared + 2) * 8 * EPS / np.maximum(1 - share, EPS), 0.0)
+
+        # Top up the last long pallet with the remaining products
+        available_volume = (HEIGHT_LIMIT - last_long) * LONG_AREA
+        volume_to_add = np.minimum(remaining_volume, available_volume)
+        available_weight = WEIGHT_LIMIT - last_weight
+        weight_to_add = np.minimum(remaining_weight, available_weight)
+        top_up = (n_long > 0) & (volume_to_add > 0) & (weight_to_add > 0)
+        uncertain = (n_long > 0) & (error > 0) & (volume_to_add > 0) & (remaining_weight > 0)
+        margin = error + 4 * np.spacing(np.maximum(np.abs(remaining_weight), WEIGHT_LIMIT))
+        fallback |= uncertain & (np.abs(last_weight_raw - WEIGHT_LIMIT) <= margin)
+        fallback |= uncertain & (np.abs(remaining_weight - available_weight) <= margin)
+        left = remaining_weight - available_weight
+        fallback |= uncertain & (left > 0) & (
+            np.abs(left - WEIGHT_LIMIT * np.round(left / WEIGHT_LIMIT)) <= margin)
+        last_long = np.where(top_up, last_long + volume_to_add / LONG_AREA, last_long)
+        remaining_volume = np.where(top_up, remaining_volume - volume_to_add, remaining_volume)
+        remaining_weight = np.where(top_up, remaining_weight - weight_to_add, remaining_weight)
+
+        # Standard pallets: full while the volume lasts, then weight-bound
+        # pallets of what is left of the volume
+        full_volume, rest_volume = _slices_above(remaining_volume, STANDARD_SLICE)
+        full_weight, rest_weight = _slices_above(remaining_weight, WEIGHT_LIMIT)
+        full_volume = np.where(has_100, full_volume, 0)
+        full_weight = np.where(has_100, full_weight, 0)
+        steps = np.maximum(full_volume, full_weight)
+        tail = steps - full_volume
+
+        tail_volumes = [rest_volume]
+        for _ in range(TAIL_STEPS):
+            volume = tail_volumes[-1]
+            tail_volumes.append(volume - (volume / STANDARD_AREA) * STANDARD_AREA)
+        tail_volumes = np.stack(tail_volumes, axis=1)
+        converged = tail_volumes[:, -1] == tail_volumes[:, -2]
+        fallback |= has_100 & (tail >= TAIL_STEPS) & ~converged
+        end_volume = tail_volumes[np.arange(n), np.minimum(tail, TAIL_STEPS)]
+        end_weight = np.where(steps > full_weight, 0.0, rest_weight)
+        last_standard = has_100 & ((end_volume > 0) | (end_weight > 0))
+
+    fallback &= situation >= 0
+    keep = ~fallback
+
+    # Pallets per segment, in allocation order
+    segments = [
+        np.where(keep & has_100, np.maximum(n_long - 1, 0), 0),           # full long
+        np.where(keep & has_100 & (n_long > 0), 1, 0),                     # last long
+        np.where(keep & has_100, full_volume, np.where(keep & index_0 & (height_0 > 0), full_0, 0)),
+        np.where(keep & has_100, tail, 0),                                 # weight-bound standard
+        np.where(keep & (last_standard | (index_0 & (height_0 > 0))), 1, 0)  # last standard
+    ]
+    counts = np.stack(segments, axis=1)
+    starts = np.cumsum(counts.ravel()) - counts.ravel()
+    starts = starts.reshape(counts.shape)
+    total = int(counts.sum())
+
+    order = np.empty(total, dtype=np.int64)
+    long = np.zeros(total, dtype=bool)
+    height = np.empty(total, dtype=float)
+    limit = np.zeros(total, dtype=bool)
+
+    owner, position = _segments(segments[0])
+    at = starts[owner, 0] + position
+    order[at], long[at], height[at], limit[at] = owner, True, HEIGHT_LIMIT, True
+
+    owner, _ = _segments(segments[1])
+    at = starts[owner, 1]
+    order[at], long[at], height[at] = owner, True, last_long[owner]
+
+    owner, position = _segments(segments[2])
+    at = starts[owner, 2] + position
+    order[at], height[at] = owner, HEIGHT_LIMIT
+    # The loops store the int limit unless the volume left divides to exactly 60.0
+    with np.errstate(all='ignore'):
+        left = remaining_volume[owner] - position * STANDARD_SLICE
+        limit[at] = index_0[owner] | (left / STANDARD_AREA > HEIGHT_LIMIT)
+
+    owner, position = _segments(segments[3])
+    at = starts[owner, 3] + position
+    step = np.minimum(position, TAIL_STEPS - 1)
+    order[at], height[at] = owner, tail_volumes[owner, step] / STANDARD_AREA
+
+    owner, _ = _segments(segments[4])
+    at = starts[owner, 4]
+    order[at] = owner
+    height[at] = np.where(index_0[owner], rest_0[owner], end_volume[owner] / STANDARD_AREA)
+
+    # Spread the order's weight by volume (standard base area, as the loops do)
+    capped_height = np.where(height < 96, height, 96.0)
+    weight = (capped_height * STANDARD_AREA / tv[order]) * tw[order]
+    table = PalletTable(order, long, height, limit, weight, n)
+
+    if fallback.any():
+        situations = list(order_situation)
+        totals = (total_volume, total_weight, index_100_volume, index_100_weight)
+        orders = np.flatnonzero(fallback).tolist()
+        lists = [allocate_pallets(situations[i], *(float(column[i]) for column in totals)) for i in orders]
+        table = table.merge(PalletTable.from_lists(lists, orders, n))
+    return table
+
+
+def adjust_low_height(table, total_volume, total_weight):
+    """
+    adjust_low_height_pallets for every order in a table
+
+    Orders without pallets are left empty (the loops raise IndexError).
+
+    Args:
+        table: PalletTable from allocate
+        total_volume, total_weight: Sequences with one value per order
+
+    Returns:
+        PalletTable
+    """
+    tv = np.asarray(total_volume, dtype=float)
+    tw = np.asarray(total_weight, dtype=float)
+    counts = table.counts()
+    offsets = table.offsets()
+    height = table.height.copy()
+    limit = table.limit.copy()
+    area = table.base_area()
+
+    has_last = counts > 0
+    last = np.where(has_last, offsets[1:] - 1, 0)
+    low = has_last & (counts > 1) & (height[last] < 20)
+
+    # Heights at or above 96 are not adjustable; the loops handle such orders
+    tall = np.zeros(table.n_orders, dtype=bool)
+    is_last = np.zeros(len(table), dtype=bool)
+    is_last[last[has_last]] = True
+    np.logical_or.at(tall, table.order[~is_last & ~(height < 96)], True)
+    fallback = low & tall
+
+    # Spread the last pallet over the earlier ones, first to last
+    volume = np.where(low, height[last] * area[last], 0.0)
+    for step in range(ABSORB_PASSES):
+        active = low & ~fallback & (volume > 0) & (step < counts - 1)
+        if not active.any():
+            break
+        at = offsets[:-1][active] + step
+        room = (96 - height[at]) * area[at]
+        added = np.minimum(volume[active], room)
+        height[at] = height[at] + added / area[at]
+        limit[at] = False
+        volume[active] = volume[active] - added
+    fallback |= low & (volume > 0) & (ABSORB_PASSES < counts - 1)
+
+    keep = np.ones(len(table), dtype=bool)
+    keep[last[low & ~fallback & (volume <= 0)]] = False
+    keep &= ~fallback[table.order]
+    order = table.order[keep]
+    height = height[keep]
+    area = area[keep]
+    weight = (height * area / tv[order]) * tw[order]
+    adjusted = PalletTable(order, table.long[keep], height, limit[keep], weight, table.n_orders)
+
+    if fallback.any():
+        orders = np.flatnonzero(fallback).tolist()
+        pallet_lists = table.to_lists()
+        lists = [adjust_low_height_pallets(pallet_lists[i], float(tv[i]), float(tw[i])) for i in orders]
+        adjusted = adjusted.merge(PalletTable.from_lists(lists, orders, table.n_orders))
+    return adjusted
@@ -3,8 +3,29 @@ Product Dimensions Loader
 Ported from development/main.py lines 502-573
 """
 
-import pandas as pd
 import os
+import threading
+
+from .dimension_snapshot import get_snapshot_path, file_digest, read_snapshot
+from .order_lines import NAN, product_type_of
+
+
+# Dimension columns copied onto each order line during the merge
+DIMENSION_COLUMNS = ['Length', 'Width', 'Height', 'weight(kg)', 'Index']
+
+# Workbook headers -> dimension column names
+EXCEL_COLUMNS = {
+    'length(inch)': 'Length',
+    'width(inch)': 'Width',
+    'height(inch)': 'Height',
+    'name': 'name',
+    'Index': 'Index',
+    'weight(kg)': 'weight(kg)'
+}
+
+# Process-wide loaders keyed by workbook path (see get_dimensions_loader)
+_loaders = {}
+_loaders_lock = threading.Lock()
 
 
 class ProductDimensionsLoader:
@@ -14,39 +35,57 @@ class ProductDimensionsLoader:
         self.excel_path = excel_path
         self.assembled_dimensions = None
         self.rta_dimensions = None
+        self.assembled_index = {}
+        self.rta_index = {}
+        self.mtime = None
+        self.version = None
         self.load_dimensions()
     
     def load_dimensions(self):
         """
-        Load product dimensions from Excel file
+        Load product dimensions from the binary snapshot, or the Excel file
+        when the snapshot is missing or stale
         Ported from development/main.py lines 502-533
         """
-        # Load the Excel file
-        sheets = pd.ExcelFile(self.excel_path)
-        
-        # Load assembled dimensions (sheet 0)
-        self.assembled_dimensions = sheets.parse(sheet_name=0).rename(columns={
-            'length(inch)': 'Length',
-            'width(inch)': 'Width',
-            'height(inch)': 'Height',
-            'name': 'name',
-            'Index': 'Index',
-            'weight(kg)': 'weight(kg)'
-        })
-        
-        # Load RTA dimensions (sheet 1)
-        self.rta_dimensions = sheets.parse(sheet_name=1).rename(columns={
-            'length(inch)': 'Length',
-            'width(inch)': 'Width',
-            'height(inch)': 'Height',
-            'name': 'name',
-            'Index': 'Index',
-            'weight(kg)': 'weight(kg)'
-        })
-        
-        # Extract product type (content after "-") and ensure consistent string type
-        self.assembled_dimensions['ProductType'] = self.assembled_dimensions['name'].str.split('-').str[1].astype(str)
-        self.rta_dimensions['ProductType'] = self.rta_dimensions['name'].str.split('-').str[1].astype(str)
+        # Record the mtime before parsing so a concurrent edit triggers a reload
+        self.mtime = os.path.getmtime(self.excel_path)
+        
+        digest = file_digest(self.excel_path)
+        # Workbook content hash, part of the key of anything derived from it
+        self.version = digest.hex()
+        
+        snapshot = read_snapshot(get_snapshot_path(self.excel_path), digest)
+        if snapshot is not None:
+            self.assembled_dimensions, self.rta_dimensions = snapshot
+        else:
+            print(f"Dimension snapshot missing or stale, parsing {self.excel_path}")
+            self.assembled_dimensions, self.rta_dimensions = self.read_excel(self.excel_path)
+        
+        # Extract product type (content after "-")
+        for row in self.assembled_dimensions + self.rta_dimensions:
+            row['ProductType'] = product_type_of(row['name'])
+        
+        # Index both tables by product type for constant-time lookups
+        self.assembled_index = build_dimensions_index(self.assembled_dimensions)
+        self.rta_index = build_dimensions_index(self.rta_dimensions)
+    
+    @staticmethod
+    def read_excel(excel_path):
+        """
+        Parse the assembled and RTA sheets from the Excel file
+        
+        Returns:
+            tuple: (assembled rows, RTA rows) as lists of dicts with renamed
+            columns; empty cells are NaN and blank rows are skipped
+        """
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(excel_path, read_only=True, data_only=True)
+        try:
+            # Assembled dimensions are sheet 0, RTA dimensions sheet 1
+            return read_sheet(workbook.worksheets[0]), read_sheet(workbook.worksheets[1])
+        finally:
+            workbook.close()
     
     def get_dimensions_table(self, needs_assembly):
         """
@@ -57,57 +96,125 @@ class ProductDimensionsLoader:
             needs_assembly: 'yes' or 'no'
             
         Returns:
-            DataFrame with dimensions
+            list of dimension row dicts
         """
         if needs_assembly not in ['yes', 'no']:
             raise ValueError("Invalid input. needs_assembly must be 'yes' or 'no'.")
         
         return self.assembled_dimensions if needs_assembly == 'yes' else self.rta_dimensions
     
-    def merge_dimensions(self, products_df, needs_assembly):
+    def get_dimensions_index(self, needs_assembly):
+        """
+        Get the ProductType -> dimensions dict based on assembly requirement
+        
+        Args:
+            needs_assembly: 'yes' or 'no'
+            
+        Returns:
+            dict mapping ProductType to a dict of DIMENSION_COLUMNS values
+        """
+        if needs_assembly not in ['yes', 'no']:
+            raise ValueError("Invalid input. needs_assembly must be 'yes' or 'no'.")
+        
+        return self.assembled_index if needs_assembly == 'yes' else self.rta_index
+    
+    def merge_dimensions(self, products, needs_assembly):
         """
         Merge product dimensions with product list
         Ported from development/main.py lines 543-573
         
         Args:
-            products_df: DataFrame with product names and quantities
+            products: List of OrderLine with names and quantities
             needs_assembly: 'yes' or 'no'
             
         Returns:
-            DataFrame with merged dimension data
+            list: The same OrderLines with product type and dimensions set
+            (dimensions stay NaN for unknown product types)
         """
-        # Choose the correct dimensions table
-        dimensions_table = self.get_dimensions_table(needs_assembly)
+        # Choose the correct dimensions index
+        dimensions_index = self.get_dimensions_index(needs_assembly)
         
-        # Extract product type (content after "-") and ensure consistent string type
-        products_df['ProductType'] = products_df['name'].str.split('-').str[1].astype(str)
+        # Extract product type (content after "-")
+        for line in products:
+            line.product_type = product_type_of(line.name)
         
         # Debug logging
-        print(f"DEBUG: Available ProductTypes in dimensions ({needs_assembly}): {sorted(dimensions_table['ProductType'].unique())}")
-        print(f"DEBUG: Product ProductTypes from order: {sorted(products_df['ProductType'].unique())}")
+        print(f"DEBUG: Available ProductTypes in dimensions ({needs_assembly}): {sorted(dimensions_index)}")
+        print(f"DEBUG: Product ProductTypes from order: {sorted(set(line.product_type for line in products))}")
         
         # Merge dimensions based on product type
-        merged_df = pd.merge(
-            products_df,
-            dimensions_table[['ProductType', 'Length', 'Width', 'Height', 'weight(kg)', 'Index']],
-            on='ProductType',
-            how='left'
-        )
-        
-        # Ensure 'quantity' column is numeric
-        merged_df['quantity'] = pd.to_numeric(merged_df['quantity'], errors='coerce')
-        
-        # Calculate volume for each product
-        merged_df['Volume (cubic inches)'] = (
-            merged_df['Length'] *
-            merged_df['Width'] *
-            merged_df['Height'] *
-            merged_df['quantity']
-        )
-        
-        # Calculate weight (kg and lbs)
-        merged_df['Weight (kg)'] = merged_df['weight(kg)'] * merged_df['quantity']
-        merged_df['Weight (lb)'] = merged_df['Weight (kg)'] * 2.20462
-        
-        return merged_df
+        for line in products:
+            dimensions = dimensions_index.get(line.product_type)
+            if dimensions is not None:
+                line.length = dimensions['Length']
+                line.width = dimensions['Width']
+                line.height = dimensions['Height']
+                line.weight_kg = dimensions['weight(kg)']
+                line.index = dimensions['Index']
+        
+        return products
+
+
+def read_sheet(worksheet):
+    """
+    Read a dimension sheet into row dicts
+    
+    The first row holds the headers (renamed through EXCEL_COLUMNS).
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, None) or ()
+    columns = [EXCEL_COLUMNS.get(column, column) for column in header]
+    
+    records = []
+    for values in rows:
+        if all(value is None or value == '' for value in values):
+            continue
+        record = {column: NAN for column in ['name'] + DIMENSION_COLUMNS}
+        for column, value in zip(columns, values):
+            if column is not None:
+                record[column] = NAN if value is None or value == '' else value
+        records.append(record)
+    return records
+
+
+def build_dimensions_index(dimensions_table):
+    """
+    Build a ProductType -> dimensions dict from dimension rows
+    
+    Args:
+        dimensions_table: List of row dicts with ProductType and DIMENSION_COLUMNS
+        
+    Returns:
+        dict mapping ProductType to a dict of DIMENSION_COLUMNS values
+    """
+    return {
+        row['ProductType']: {column: row[column] for column in DIMENSION_COLUMNS}
+        for row in dimensions_table
+    }
 
+
+def get_dimensions_loader(excel_path):
+    """
+    Get the process-wide dimensions loader for a workbook
+    
+    The workbook is parsed once per process and shared by every request.
+    It is only re-parsed when the file's mtime changes.
+    
+    Args:
+        excel_path: Path to Product Dimension.xlsx
+        
+    Returns:
+        ProductDimensionsLoader
+    """
+    mtime = os.path.getmtime(excel_path)
+    loader = _loaders.get(excel_path)
+    if loader is not None and loader.mtime == mtime:
+        return loader
+    
+    with _loaders_lock:
+        # Another thread may have reloaded while we waited for the lock
+        loader = _loaders.get(excel_path)
+        if loader is None or loader.mtime != mtime:
+            loader = ProductDimensionsLoader(excel_path)
+            _loaders[excel_path] = loader
+        return loader
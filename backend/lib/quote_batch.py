@@ -0,0 +1,197 @@
+"""
+Batch Quotes
+Quote many orders in one call
+
+Orders are looked up first, then the product details for every order are
+fetched in one deduplicated pass, then each order runs through the quote
+pipeline on a worker pool. All upstream calls go through the same
+process-wide rate limits, connection pools and caches as single quotes.
+"""
+
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import TTLCache
+from .inflow_api import product_cache
+from .quote_pipeline import QuoteError, parse_quote_request, request_key, create_inflow_api, find_order, run_quote_pipeline
+
+
+# Orders quoted concurrently, and the most orders accepted in one request
+BATCH_WORKERS = int(os.environ.get('QUOTE_BATCH_WORKERS', 8))
+BATCH_MAX_ORDERS = int(os.environ.get('QUOTE_BATCH_MAX_ORDERS', 200))
+
+
+def parse_batch_request(data):
+    """
+    Expand a batch request body into one quote request body per order
+
+    Top-level fields other than "orders" are defaults for every order, so a
+    batch sharing a pickup ZIP and date only has to list them once. An order
+    may be given as a bare order number.
+
+    Args:
+        data: Parsed JSON body, e.g.
+            {"pickupZip": "12345", "pickupDate": "...",
+             "orders": ["SO-009537", {"orderNumber": "Quote-010450", "destinationZip": "67890"}]}
+
+    Returns:
+        list: Quote request bodies, in request order
+
+    Raises:
+        ValueError: If "orders" is missing, empty or too long
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    orders = data.get('orders')
+    if not isinstance(orders, list) or not orders:
+        raise ValueError('"orders" must be a non-empty list')
+    if len(orders) > BATCH_MAX_ORDERS:
+        raise ValueError(f'At most {BATCH_MAX_ORDERS} orders can be quoted in one batch')
+
+    defaults = {key: value for key, value in data.items() if key != 'orders'}
+    bodies = []
+    for order in orders:
+        if isinstance(order, str):
+            order = {'orderNumber': order}
+        elif not isinstance(order, dict):
+            order = {}
+        bodies.append(dict(defaults, **order))
+    return bodies
+
+
+def order_product_ids(order):
+    """Product IDs on every line of an order"""
+    return [
+        line['productId'] for line in order.get('lines') or []
+        if isinstance(line, dict) and line.get('productId')
+    ]
+
+
+def _error_status(error):
+    """HTTP status and message for a failed order, as /api/quote reports it"""
+    if isinstance(error, QuoteError):
+        return error.status_code, str(error)
+    if isinstance(error, ValueError):
+        return 400, str(error)
+    traceback.print_exception(type(error), error, error.__traceback__)
+    return 500, f'Internal server error: {str(error)}'
+
+
+def run_quote_batch(data, settings, dimensions_path, flights=None, max_workers=BATCH_WORKERS):
+    """
+    Quote every order in a batch request
+
+    Args:
+        data: Parsed JSON body (see parse_batch_request)
+        settings: Output of load_settings
+        dimensions_path: Path to Product Dimension.xlsx
+        flights: Optional SingleFlight shared with the single-quote endpoint
+        max_workers: Orders looked up / quoted concurrently
+
+    Returns:
+        dict: {"results": [...], "summary": {...}} with one result per order,
+            in request order. A result holds either "quote" or "error" and the
+            HTTP status the single-quote endpoint would have returned.
+
+    Raises:
+        ValueError: If the batch itself is malformed
+    """
+    bodies = parse_batch_request(data)
+
+    # Validate each order on its own so one bad entry does not fail the batch
+    entries = []
+    for body in bodies:
+        try:
+            entries.append({'params': parse_quote_request(body)})
+        except ValueError as e:
+            entries.append({'orderNumber': str(body.get('orderNumber') or ''), 'error': e})
+
+    # Without the shared product cache, a batch-local one still fetches each product once
+    cache = product_cache if product_cache is not None else TTLCache(ttl=None, max_entries=100000)
+    inflow_api = create_inflow_api(settings, product_cache=cache)
+
+    # Identical requests in the batch are quoted once; order numbers are looked up once
+    requests_by_key = {}
+    numbers = {}
+    for entry in entries:
+        params = entry.get('params')
+        if params is not None:
+            requests_by_key.setdefault(request_key(params), params)
+            numbers.setdefault(params['orderNumber'].upper(), params['orderNumber'])
+
+    workers = max(1, min(max_workers, len(requests_by_key) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Step 1: Find every order
+        order_futures = {
+            key: executor.submit(find_order, inflow_api, number)
+            for key, number in numbers.items()
+        }
+        orders = {}
+        for key, future in order_futures.items():
+            try:
+                orders[key] = future.result()
+            except Exception as e:
+                orders[key] = e
+
+        # Step 2: Fetch the product details of every order in one deduplicated pass
+        product_ids = []
+        for order in orders.values():
+            if not isinstance(order, Exception):
+                product_ids.extend(order_product_ids(order))
+        product_ids = list(dict.fromkeys(product_ids))
+        inflow_api.fetch_product_details(product_ids)
+
+        # Step 3: Quote each distinct request (product lookups now hit the cache)
+        def quote(key, params):
+            order = orders[params['orderNumber'].upper()]
+            if isinstance(order, Exception):
+                raise order
+
+            def run():
+                return run_quote_pipeline(params, settings, dimensions_path,
+                                          inflow_api=inflow_api, order=order)
+
+            if flights is None:
+                return run()
+            return flights.do(key, run)[0]
+
+        quote_futures = {
+            key: executor.submit(quote, key, params)
+            for key, params in requests_by_key.items()
+        }
+        outcomes = {}
+        for key, future in quote_futures.items():
+            try:
+                outcomes[key] = future.result()
+            except Exception as e:
+                outcomes[key] = e
+
+    results = []
+    for entry in entries:
+        params = entry.get('params')
+        if params is None:
+            outcome = entry['error']
+            order_number = entry['orderNumber']
+        else:
+            outcome = outcomes[request_key(params)]
+            order_number = params['orderNumber']
+
+        if isinstance(outcome, Exception):
+            status, message = _error_status(outcome)
+            results.append({'orderNumber': order_number, 'status': status, 'error': message})
+        else:
+            results.append({'orderNumber': order_number, 'status': 200, 'quote': outcome})
+
+    succeeded = sum(1 for result in results if result['status'] == 200)
+    return {
+        'results': results,
+        'summary': {
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'uniqueOrders': len(numbers),
+            'uniqueProducts': len(product_ids)
+        }
+    }
@@ -0,0 +1,626 @@
+"""
+Quote Pipeline
+Order -> products -> pallets -> freight items -> C.H. Robinson quote flow,
+shared by the Flask app and the Netlify function
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import TTLCache
+from .inflow_api import InflowAPI
+from .order_lines import product_type_of
+from .product_dimensions import get_dimensions_loader
+from .pallet_calculator import determine_order_situation, calculate_pallets, adjust_low_height_pallets
+from .pallet_packing import PACKING_MODES, PALLET_PACKING, pack_pallets
+from .pallet_search import search_pallets
+from .freight import build_freight_items, get_city_state_from_zip, fetch_chr_quotes, lookup_zip_offline
+from .chr_auth import CHRobinsonAuth
+from .quote_service import select_optimal_quote
+from .zip_database import get_zip_database
+from . import http_client, metrics, timing
+
+# Pallet plans by order composition, so recurring kits skip steps 3-5
+# (0 disables the cache)
+PALLET_PLAN_CACHE_SIZE = int(os.environ.get('PALLET_PLAN_CACHE_SIZE', 1000))
+
+plan_cache = TTLCache(ttl=None, max_entries=PALLET_PLAN_CACHE_SIZE) if PALLET_PLAN_CACHE_SIZE > 0 else None
+
+
+class QuoteError(Exception):
+    """A quote that cannot be produced, with the HTTP status to report"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_quote_request(data):
+    """
+    Validate and normalize a quote request body
+
+    Args:
+        data: Parsed JSON body
+
+    Returns:
+        dict: Normalized request parameters
+
+    Raises:
+        ValueError: If a required field is missing or invalid
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        raise ValueError('Request body must be a JSON object')
+    params = {
+        'orderNumber': text_field(data, 'orderNumber'),
+        'needsAssembly': text_field(data, 'needsAssembly') or 'no',
+        'pickupZip': text_field(data, 'pickupZip'),
+        'destinationZip': text_field(data, 'destinationZip'),
+        'deliveryType': data.get('deliveryType', 'Commercial'),
+        'liftgateService': data.get('liftgateService', 'no'),
+        'pickupDate': data.get('pickupDate', ''),
+        # "cartons" packs the actual cartons instead of pouring the order's volume,
+        # "cheapest" picks the configuration with the lowest estimated cost
+        'palletPacking': (text_field(data, 'palletPacking') or PALLET_PACKING).lower(),
+        # Return per-step timings with the quote
+        'includeTimings': data.get('includeTimings') in (True, 'yes', 'true')
+    }
+
+    # Validate inputs
+    if not params['orderNumber']:
+        raise ValueError('Order/Quote number is required')
+    if len(params['pickupZip']) != 5 or not params['pickupZip'].isdigit():
+        raise ValueError('Invalid pickup ZIP code')
+    if len(params['destinationZip']) != 5 or not params['destinationZip'].isdigit():
+        raise ValueError('Invalid destination ZIP code')
+    if not params['pickupDate']:
+        raise ValueError('Pickup date is required')
+    if params['needsAssembly'] not in ('yes', 'no'):
+        raise ValueError("needsAssembly must be 'yes' or 'no'")
+    if params['palletPacking'] not in PACKING_MODES:
+        raise ValueError(f"palletPacking must be one of: {', '.join(PACKING_MODES)}")
+
+    return params
+
+
+def text_field(data, name):
+    """
+    A request field as a stripped string ('' when missing; numbers are accepted)
+
+    Raises:
+        ValueError: If the field is not a string or a number
+    """
+    value = data.get(name)
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str):
+        raise ValueError(f'{name} must be a string')
+    return value.strip()
+
+
+def request_key(params):
+    """Canonical key for a normalized request (order numbers are case-insensitive)"""
+    return json.dumps(dict(params, orderNumber=params['orderNumber'].upper()), sort_keys=True)
+
+
+def load_settings():
+    """
+    Read API credentials from the environment
+
+    Raises:
+        QuoteError: If a required variable is missing
+    """
+    settings = {
+        'inflow_company_id': os.environ.get('INFLOW_COMPANY_ID'),
+        'inflow_api_key': os.environ.get('INFLOW_API_KEY'),
+        'chr_client_id': os.environ.get('CHR_CLIENT_ID'),
+        'chr_client_secret': os.environ.get('CHR_CLIENT_SECRET'),
+        'chr_customer_code': os.environ.get('CHR_CUSTOMER_CODE'),
+        'chr_environment': os.environ.get('CHR_ENVIRONMENT', 'sandbox')
+    }
+    if not all(settings.values()):
+        raise QuoteError('Missing required environment variables', 500)
+    return settings
+
+
+def create_inflow_api(settings, **kwargs):
+    """Build an inFlow client from load_settings output"""
+    return InflowAPI(settings['inflow_company_id'], settings['inflow_api_key'], **kwargs)
+
+
+def create_chr_auth(settings):
+    """Build a C.H. Robinson auth client from load_settings output"""
+    return CHRobinsonAuth(settings['chr_client_id'], settings['chr_client_secret'],
+                          settings['chr_environment'])
+
+
+def warm_up(dimensions_path):
+    """
+    Do the work a first request would otherwise pay for: load the product
+    dimensions, open the ZIP database and create the HTTP session (which
+    imports requests)
+
+    A step that fails is logged and skipped; the first request that needs
+    it retries and reports the error.
+
+    Args:
+        dimensions_path: Path to Product Dimension.xlsx
+
+    Returns:
+        dict: Milliseconds spent per step
+    """
+    steps = [
+        ('dimensions', lambda: get_dimensions_loader(dimensions_path)),
+        ('zipDatabase', get_zip_database),
+        ('httpSession', http_client.get_session)
+    ]
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+        timings[name] = round((time.perf_counter() - start) * 1000, 2)
+    return timings
+
+
+def find_order(inflow_api, order_number):
+    """
+    Fetch an order or quote from inFlow
+
+    Returns:
+        dict: The inFlow sales order
+
+    Raises:
+        QuoteError: If the order cannot be found
+    """
+    order = inflow_api.search_todays_orders(order_number)
+
+    if order is None:
+        raise QuoteError(f'Order/Quote "{order_number}" not found in inFlow', 404)
+
+    return order
+
+
+def run_quote_pipeline(params, settings, dimensions_path, inflow_api=None, order=None,
+                       on_event=None, chr_auth=None):
+    """
+    Produce a freight quote for one order
+
+    Args:
+        params: Output of parse_quote_request
+        settings: Output of load_settings
+        dimensions_path: Path to Product Dimension.xlsx
+        inflow_api: InflowAPI to use (defaults to a new client from settings)
+        order: Order already fetched with find_order (skips step 1)
+        on_event: Optional callback(event, data) called as each stage finishes:
+            "order", "products", "pallets", "quote" (once per carrier) and
+            "selectedQuote"
+        chr_auth: CHRobinsonAuth to use (defaults to a new client from settings)
+
+    Returns:
+        dict: Response body (orderSummary, products, pallets, quotes, selectedQuote,
+            and timings when params['includeTimings'] is set)
+
+    Raises:
+        QuoteError: If the order cannot be quoted
+    """
+    outcome = 'error'
+    quote_trace = None
+    try:
+        with timing.trace('quote', orderNumber=params['orderNumber']) as quote_trace:
+            response = _run_steps(params, settings, dimensions_path, inflow_api, chr_auth, order,
+                                  on_event or (lambda event, data: None))
+        outcome = 'ok'
+    except QuoteError:
+        outcome = 'rejected'
+        raise
+    finally:
+        record_quote_metrics(outcome, quote_trace)
+
+    # Only when requested; the trace is always logged
+    if params.get('includeTimings'):
+        response['timings'] = quote_trace.to_dict()
+    return response
+
+
+def record_quote_metrics(outcome, quote_trace):
+    """Count a finished quote and feed its step durations into the stage latency histogram"""
+    metrics.quotes.inc(outcome=outcome)
+    if quote_trace is None:
+        return
+    timings = quote_trace.to_dict()
+    for span in timings['spans']:
+        if span['name'] != 'http':
+            metrics.quote_stage_latency.observe(span['durationMs'] / 1000, stage=span['name'])
+    metrics.quote_stage_latency.observe(timings['totalMs'] / 1000, stage='total')
+
+
+def _run_steps(params, settings, dimensions_path, inflow_api, chr_auth, order, emit):
+    """The pipeline steps behind run_quote_pipeline, each timed as a span"""
+    order_number = params['orderNumber']
+
+    # Initialize API clients
+    inflow_api = inflow_api or create_inflow_api(settings)
+    chr_auth = chr_auth or create_chr_auth(settings)
+
+    # ZIP lookups and the C.H. Robinson token run while inFlow is queried
+    with UpstreamPrefetch(params, chr_auth) as prefetch:
+        # Get the shared product dimensions (parsed once per process)
+        with timing.span('load_dimensions'):
+            dimensions_loader = get_dimensions_loader(dimensions_path)
+
+        # Step 1: Fetch order or quote from inFlow
+        if order is None:
+            with timing.span('fetch_order'):
+                order = find_order(inflow_api, order_number)
+        emit('order', {'orderNumber': order_number})
+
+        # Step 2: Process products
+        with timing.span('process_products'):
+            products = inflow_api.process_order_products(order)
+
+        # Steps 3-5: Merge dimensions, calculate pallets, build freight items
+        products_list, freight_items, pallets_list, total_weight, total_volume = plan_order(
+            products, dimensions_loader, params)
+        emit('products', products_list)
+        emit('pallets', pallets_list)
+
+        # Step 6: Get location info from ZIP codes (started with the prefetch)
+        with timing.span('zip_lookup'):
+            pickup, destination = prefetch.locations()
+        pickup_info, delivery_info = shipment_locations(params, pickup, destination)
+
+        # Step 7: Get shipping quotes from C.H. Robinson
+        with timing.span('chr_quotes') as chr_span:
+            prefetch.wait_for_token()
+            quotes, quotes_from_cache = fetch_chr_quotes(
+                chr_auth, freight_items, pickup_info, delivery_info, *chr_quote_options(params, settings)
+            )
+            chr_span['cached'] = quotes_from_cache
+
+    # Steps 8-9: Select optimal quote and format response
+    return finish_quote(order_number, products_list, pallets_list, total_weight, total_volume,
+                        quotes, quotes_from_cache, emit)
+
+
+class UpstreamPrefetch:
+    """
+    The upstream calls of a quote that do not depend on the order: both ZIP
+    lookups and the C.H. Robinson token
+
+    They start as soon as the request is validated and run on worker threads
+    while the order and products are fetched; the pipeline joins them before
+    requesting rates. ZIPs in the bundled database and a cached token are
+    answered inline, so the common case starts no threads.
+    """
+
+    def __init__(self, params, chr_auth):
+        self.zip_codes = (params['pickupZip'], params['destinationZip'])
+        self._executor = None
+        self._locations = {}
+        self._remote = {}
+        self._token = None
+
+        for zip_code in self.zip_codes:
+            location = lookup_zip_offline(zip_code)
+            if location is not None:
+                self._locations[zip_code] = location
+            elif zip_code not in self._remote:
+                self._remote[zip_code] = self._submit(get_city_state_from_zip, zip_code)
+
+        if chr_auth.cached_token() is None:
+            self._token = self._submit(chr_auth.get_token)
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix='quote-prefetch')
+        return self._executor.submit(timing.bind(fn), *args)
+
+    def locations(self):
+        """
+        Wait for the ZIP lookups
+
+        Returns:
+            tuple: (pickup, destination), each as from get_city_state_from_zip
+        """
+        for zip_code, future in self._remote.items():
+            self._locations[zip_code] = future.result()
+        return tuple(self._locations[zip_code] for zip_code in self.zip_codes)
+
+    def wait_for_token(self):
+        """
+        Wait for the token fetch
+
+        A failed fetch is only logged: the quote request fetches the token
+        again (if the rates are not cached) and reports the error.
+        """
+        if self._token is None:
+            return
+        try:
+            self._token.result()
+        except Exception as e:
+            print(f"C.H. Robinson token prefetch failed: {e}")
+
+    def close(self):
+        """Stop waiting for calls still running (e.g. when the order was not found)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def prepare_products(products, dimensions_loader, needs_assembly):
+    """
+    Merge dimensions onto the order lines and keep the ones that have them
+
+    Returns:
+        tuple: (order lines with dimensions, products list for the response)
+
+    Raises:
+        QuoteError: If no product has dimensions
+    """
+    if not products:
+        raise QuoteError('No valid products found in this order')
+
+    with timing.span('merge_dimensions'):
+        products = dimensions_loader.merge_dimensions(products, needs_assembly)
+
+    missing_products = [
+        {'name': line.name, 'ProductType': line.product_type}
+        for line in products if not line.has_dimensions
+    ]
+
+    # Debug logging
+    print(f"DEBUG: Products before merge: {[{'name': line.name} for line in products]}")
+    print(f"DEBUG: Products after merge: {[{'name': line.name, 'ProductType': line.product_type, 'Length': line.length} for line in products]}")
+    print(f"DEBUG: Products with NaN Length: {missing_products}")
+
+    # Filter out products without dimensions
+    valid_products = [line for line in products if line.has_dimensions]
+
+    if not valid_products:
+        # Enhanced error message with debug info
+        error_msg = f'No products with valid dimensions found. Products without dimensions: {missing_products}'
+        print(f"DEBUG: {error_msg}")
+        raise QuoteError(error_msg)
+
+    # Products and pallets are formatted as soon as they exist so they can be streamed
+    products_list = []
+    for line in valid_products:
+        products_list.append({
+            'name': line.name,
+            'quantity': float(line.quantity),
+            'length': float(line.length),
+            'width': float(line.width),
+            'height': float(line.height),
+            'weight': float(line.weight_kg),
+            'index': int(line.index)
+        })
+    return valid_products, products_list
+
+
+def plan_pallets(valid_products, packing='volume'):
+    """
+    Calculate pallets and the freight items sent to C.H. Robinson
+
+    Args:
+        valid_products: Order lines with dimensions
+        packing: "volume", "cartons" (falls back to "volume" when the
+            cartons cannot be packed within the time budget) or "cheapest"
+
+    Returns:
+        tuple: (freight items, pallets list for the response, total weight,
+            total volume, packing fallback); packing fallback is True when
+            carton packing gave up (e.g. on the time budget), so the plan
+            may differ on another run
+    """
+    packing_fallback = False
+    with timing.span('calculate_pallets'):
+        order_situation = determine_order_situation(valid_products)
+        pallets, total_weight, total_volume = calculate_pallets(valid_products, order_situation)
+
+        # Adjust low-height pallets
+        pallets = adjust_low_height_pallets(pallets, total_volume, total_weight)
+
+    if packing == 'cartons':
+        with timing.span('pack_pallets') as pack_span:
+            packed_pallets = pack_pallets(valid_products)
+            packing_fallback = pack_span['fallback'] = packed_pallets is None
+        if packed_pallets is not None:
+            pallets = packed_pallets
+    elif packing == 'cheapest':
+        with timing.span('search_pallets') as search_span:
+            configurations = search_pallets(valid_products, pallets, total_volume, total_weight)
+            search_span['configuration'] = configurations[0]['label']
+        pallets = configurations[0]['pallets']
+
+    with timing.span('build_freight_items'):
+        freight_items = build_freight_items(pallets)
+
+    pallets_list = []
+    for pallet, freight_item in zip(pallets, freight_items):
+        pallets_list.append({
+            'length': freight_item['Length'],
+            'width': freight_item['Width'],
+            'height': freight_item['Height'],
+            'weight': freight_item['Weight'],
+            'freightClass': freight_item['FreightClass'],
+            'stackable': freight_item['Stackable'],
+            'hazmat': freight_item['Hazmat'],
+            'palletType': pallet['Type'],
+            'originalHeight': pallet['Height']
+        })
+    return freight_items, pallets_list, total_weight, total_volume, packing_fallback
+
+
+def plan_order(products, dimensions_loader, params):
+    """
+    Steps 3-5 (prepare_products and plan_pallets), or the plan of an earlier
+    order with the same composition from plan_cache
+
+    Returns:
+        tuple: (products list, freight items, pallets list, total weight, total volume)
+
+    Raises:
+        QuoteError: If no product has dimensions
+    """
+    cache_key = None
+    if plan_cache is not None and products:
+        cache_key = plan_key(products, params['needsAssembly'], params['palletPacking'], dimensions_loader.version)
+        plan = plan_cache.get(cache_key)
+        if plan is not None:
+            line_dimensions, freight_items, pallets_list, total_weight, total_volume = plan
+            products_list = [dict(name=line.name, **dimensions)
+                             for line, dimensions in zip(products, line_dimensions) if dimensions is not None]
+            return (products_list, [dict(item) for item in freight_items], [dict(pallet) for pallet in pallets_list],
+                    total_weight, total_volume)
+
+    valid_products, products_list = prepare_products(products, dimensions_loader, params['needsAssembly'])
+    freight_items, pallets_list, total_weight, total_volume, packing_fallback = plan_pallets(
+        valid_products, params['palletPacking'])
+
+    # A packing that ran out of time is not cached: the next order could pack in time
+    if cache_key is not None and not packing_fallback:
+        # Dimensions of each line (None without), to rebuild the products list on a hit
+        entries = iter(products_list)
+        line_dimensions = [
+            {key: value for key, value in next(entries).items() if key != 'name'} if line.has_dimensions else None
+            for line in products
+        ]
+        plan_cache.set(cache_key, (line_dimensions, [dict(item) for item in freight_items],
+                                   [dict(pallet) for pallet in pallets_list], total_weight, total_volume))
+    return products_list, freight_items, pallets_list, total_weight, total_volume
+
+
+def plan_key(products, needs_assembly, packing, dimensions_version):
+    """
+    Cache key for the plan of an order: a hash of its (ProductType, quantity)
+    lines, the assembly flag, the packing mode and the dimension workbook
+    version (so a workbook change invalidates every plan)
+
+    Lines keep their order: totals are summed in line order, so the same
+    kit listed in another order could differ in the last bit.
+    """
+    composition = [[product_type_of(line.name), float(line.quantity)] for line in products]
+    payload = json.dumps([dimensions_version, needs_assembly, packing, composition])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def shipment_locations(params, pickup, destination):
+    """
+    Pickup and delivery location dicts from (city, state) lookups
+
+    Raises:
+        QuoteError: If either ZIP could not be resolved
+    """
+    pickup_city, pickup_state = pickup
+    dest_city, dest_state = destination
+    if not pickup_city or not dest_city:
+        raise QuoteError('Invalid ZIP code. Could not determine city/state.')
+
+    pickup_info = {'zip': params['pickupZip'], 'city': pickup_city, 'state': pickup_state}
+    delivery_info = {'zip': params['destinationZip'], 'city': dest_city, 'state': dest_state}
+    return pickup_info, delivery_info
+
+
+def chr_quote_options(params, settings):
+    """(ship date, residential, liftgate, customer code) arguments for fetch_chr_quotes"""
+    is_residential = params['deliveryType'] == 'Residential'
+    needs_liftgate = params['liftgateService'] == 'yes'
+    return params['pickupDate'], is_residential, needs_liftgate, settings['chr_customer_code']
+
+
+def finish_quote(order_number, products_list, pallets_list, total_weight, total_volume,
+                 quotes, quotes_from_cache, emit):
+    """
+    Select the optimal quote and build the response body
+
+    Raises:
+        QuoteError: If C.H. Robinson returned no quotes
+    """
+    if not quotes:
+        raise QuoteError('No shipping quotes available for this route')
+
+    # Convert quotes to camelCase for frontend compatibility
+    quotes_camelcase = []
+    for q in quotes:
+        quotes_camelcase.append({
+            'carrier': q.get('carrier', 'Unknown'),
+            'totalCost': q.get('total_cost', 0),
+            'service': q.get('service', 'N/A'),
+            'mode': q.get('mode', 'N/A'),
+            'distance': q.get('distance', 'N/A')
+        })
+        emit('quote', quotes_camelcase[-1])
+
+    # Step 8: Select optimal quote
+    with timing.span('select_quote'):
+        selected_quote = select_optimal_quote(quotes)
+    emit('selectedQuote', selected_quote)
+
+    # Step 9: Format response
+    return {
+        'orderSummary': {
+            'orderNumber': order_number,
+            'totalProducts': len(products_list),
+            'totalWeight': float(total_weight),
+            'totalVolume': float(total_volume)
+        },
+        'products': products_list,
+        'pallets': pallets_list,
+        'quotes': quotes_camelcase,
+        'selectedQuote': selected_quote,
+        'quotesFromCache': quotes_from_cache
+    }
+
+
+def stream_quote_pipeline(params, settings, dimensions_path):
+    """
+    Run the quote pipeline, yielding its stage events as they happen
+
+    The pipeline runs on a worker thread; events are handed over through a
+    queue so the caller can write each one to the client immediately.
+
+    Yields:
+        tuple: (event, data) for each stage (see run_quote_pipeline), then
+            ("result", response body) or ("error", {"error", "status"})
+    """
+    events = queue.Queue()
+    done = object()
+
+    def run():
+        try:
+            result = run_quote_pipeline(params, settings, dimensions_path,
+                                        on_event=lambda event, data: events.put((event, data)))
+            events.put(('result', result))
+        except QuoteError as e:
+            events.put(('error', {'error': str(e), 'status': e.status_code}))
+        except ValueError as e:
+            events.put(('error', {'error': str(e), 'status': 400}))
+        except Exception as e:
+            print(f"Error processing quote: {str(e)}")
+            traceback.print_exc()
+            events.put(('error', {'error': f'Internal server error: {str(e)}', 'status': 500}))
+        finally:
+            events.put(done)
+
+    threading.Thread(target=run, name='quote-stream', daemon=True).start()
+    while True:
+        item = events.get()
+        if item is done:
+            return
+        yield item
@@ -0,0 +1,64 @@
+"""
+Server Metrics
+HTTP request and cache metrics shared by the Flask and ASGI apps
+"""
+
+from . import metrics
+from .freight import quote_cache, remote_zip_cache
+from .inflow_api import product_cache
+from .quote_pipeline import plan_cache
+
+
+# Request metrics (served at /metrics)
+http_requests = metrics.Counter(
+    'freight_http_requests_total', 'HTTP requests by endpoint, method and status',
+    ['endpoint', 'method', 'status'])
+http_latency = metrics.Histogram(
+    'freight_http_request_duration_seconds', 'HTTP request latency (streams included)',
+    ['endpoint'])
+http_in_flight = metrics.Gauge(
+    'freight_http_requests_in_flight', 'HTTP requests currently being served')
+
+
+def record_request(endpoint, method, status, seconds):
+    """Record a finished request (call once its body has been sent)"""
+    http_in_flight.dec()
+    http_latency.observe(seconds, endpoint=endpoint)
+    http_requests.inc(endpoint=endpoint, method=method, status=status)
+
+
+def cache_stats():
+    caches = {'inflow_products': product_cache, 'chr_quotes': quote_cache, 'zip_remote': remote_zip_cache,
+              'pallet_plans': plan_cache}
+    return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+
+def cache_samples(field):
+    return lambda: [({'cache': name}, stats[field]) for name, stats in cache_stats().items()]
+
+
+def cache_hit_ratios():
+    samples = []
+    for name, stats in cache_stats().items():
+        lookups = stats['hits'] + stats['misses']
+        samples.append(({'cache': name}, stats['hits'] / lookups if lookups else 0))
+    return samples
+
+
+def register_cache_metrics(quote_flights):
+    """
+    Register the cache and quote-coalescing gauges (once per process)
+
+    Args:
+        quote_flights: The app's SingleFlight / AsyncSingleFlight for /api/quote
+    """
+    metrics.CallbackMetric('freight_cache_hits_total', 'Cache hits', ['cache'],
+                           cache_samples('hits'), metric_type='counter')
+    metrics.CallbackMetric('freight_cache_misses_total', 'Cache misses', ['cache'],
+                           cache_samples('misses'), metric_type='counter')
+    metrics.CallbackMetric('freight_cache_entries', 'Entries held in memory', ['cache'],
+                           cache_samples('size'))
+    metrics.CallbackMetric('freight_cache_hit_ratio', 'Hits / lookups since start', ['cache'],
+                           cache_hit_ratios)
+    metrics.CallbackMetric('freight_quote_flights_in_flight', 'Distinct quote pipelines running for /api/quote',
+                           callback=lambda: [({}, quote_flights.in_flight())])
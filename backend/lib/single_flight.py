@@ -0,0 +1,113 @@
+"""
+Single-flight Request Coalescing
+Concurrent calls with the same key share one execution
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time
+
+    The first caller for a key runs the function. Callers that arrive
+    while it is running wait and receive the same result (or exception).
+    Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() for key, or wait for the call already in flight
+
+        Args:
+            key: Hashable key identifying identical work
+            fn: Zero-argument callable
+
+        Returns:
+            tuple: (result, True if the result came from another caller's run)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self):
+        """Number of distinct calls currently running"""
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop
+
+    The call runs as its own task, so a caller that goes away (e.g. a client
+    disconnect cancels its request) does not cancel the work the other
+    callers are waiting on.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        """
+        Await fn() for key, or the call already in flight
+
+        Args:
+            key: Hashable key identifying identical work
+            fn: Zero-argument coroutine function
+
+        Returns:
+            tuple: (result, True if the result came from another caller's run)
+        """
+        import asyncio
+
+        task = self._tasks.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the error as retrieved even if every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self):
+        """Number of distinct calls currently running"""
+        return len(self._tasks)
@@ -0,0 +1,231 @@
+"""
+Offline ZIP Code Database
+Bundled ZIP -> (city, state) lookups without a network call
+
+File layout (little-endian, memory-mapped):
+    header   magic, entry count, city count, state count
+    zips     uint32[entries], sorted
+    cities   uint16[entries], index into the city table
+    states   uint8[entries], index into the state table
+    state table   2-byte state codes
+    city table    uint32[cities + 1] offsets, then UTF-8 names
+
+Rebuild from GeoNames (the dataset behind api.zippopotam.us) or a CSV with
+zip, city and state columns:
+    python -m lib.zip_database [US.zip | US.txt | zips.csv]
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+
+ZIP_DB_MAGIC = b'SQZIPDB1'
+HEADER_FORMAT = struct.Struct('<8sIII')
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent / 'data' / 'us_zip_codes.bin'
+GEONAMES_US_URL = 'https://download.geonames.org/export/zip/US.zip'
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+class ZipDatabase:
+    """Read-only view over a memory-mapped ZIP database file"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, city_count, state_count = HEADER_FORMAT.unpack_from(self._mm, 0)
+        if magic != ZIP_DB_MAGIC:
+            raise ValueError(f"Not a ZIP database: {path}")
+
+        view = memoryview(self._mm)
+        offset = HEADER_FORMAT.size
+        self._zips = view[offset:offset + 4 * count].cast('I')
+        offset += 4 * count
+        self._city_ids = view[offset:offset + 2 * count].cast('H')
+        offset += 2 * count
+        self._state_ids = view[offset:offset + count]
+        offset += count
+        states = bytes(view[offset:offset + 2 * state_count]).decode('ascii')
+        self._states = [states[i:i + 2] for i in range(0, len(states), 2)]
+        offset += 2 * state_count
+        # Pad to 4 bytes so the offsets array can be cast in place
+        offset += -offset % 4
+        self._city_offsets = view[offset:offset + 4 * (city_count + 1)].cast('I')
+        self._city_blob = offset + 4 * (city_count + 1)
+        self._city_cache = {}
+
+    def __len__(self):
+        return len(self._zips)
+
+    def lookup(self, zip_code):
+        """
+        Look up a 5-digit ZIP code
+
+        Returns:
+            tuple: (city, state) or (None, None) if the ZIP is unknown
+        """
+        try:
+            key = int(zip_code)
+        except (TypeError, ValueError):
+            return None, None
+
+        i = bisect_left(self._zips, key)
+        if i == len(self._zips) or self._zips[i] != key:
+            return None, None
+        return self._city(self._city_ids[i]), self._states[self._state_ids[i]]
+
+    def _city(self, city_id):
+        city = self._city_cache.get(city_id)
+        if city is None:
+            start = self._city_blob + self._city_offsets[city_id]
+            end = self._city_blob + self._city_offsets[city_id + 1]
+            city = self._mm[start:end].decode('utf-8')
+            self._city_cache[city_id] = city
+        return city
+
+
+def get_zip_database(path=DEFAULT_DB_PATH):
+    """
+    Get the process-wide ZIP database (opened on first use)
+
+    Returns:
+        ZipDatabase, or None if the file is missing or unreadable
+    """
+    path = str(path)
+    if path not in _databases:
+        with _databases_lock:
+            if path not in _databases:
+                try:
+                    _databases[path] = ZipDatabase(path)
+                except (OSError, ValueError) as e:
+                    print(f"ZIP database unavailable ({path}): {e}")
+                    _databases[path] = None
+    return _databases[path]
+
+
+def lookup_zip(zip_code, path=DEFAULT_DB_PATH):
+    """Look up (city, state) in the bundled database, or (None, None)"""
+    database = get_zip_database(path)
+    if database is None:
+        return None, None
+    return database.lookup(zip_code)
+
+
+def write_zip_database(path, records):
+    """
+    Write a ZIP database file
+
+    Args:
+        path: Output file path
+        records: Iterable of (zip, city, state); the first record for a ZIP wins
+    """
+    by_zip = {}
+    for zip_code, city, state in records:
+        zip_code = str(zip_code).strip().zfill(5)
+        if len(zip_code) == 5 and zip_code.isdigit() and city and state:
+            by_zip.setdefault(int(zip_code), (city.strip(), state.strip().upper()))
+
+    zips = array('I', sorted(by_zip))
+    city_names, city_ids = [], {}
+    state_codes, state_ids = [], {}
+    cities = array('H')
+    states = bytearray()
+    for key in zips:
+        city, state = by_zip[key]
+        if city not in city_ids:
+            city_ids[city] = len(city_names)
+            city_names.append(city)
+        if state not in state_ids:
+            state_ids[state] = len(state_codes)
+            state_codes.append(state)
+        cities.append(city_ids[city])
+        states.append(state_ids[state])
+
+    if len(city_names) > 0xFFFF or len(state_codes) > 0xFF:
+        raise ValueError("Too many distinct cities or states for the ZIP database format")
+
+    blob = bytearray()
+    offsets = array('I', [0])
+    for city in city_names:
+        blob += city.encode('utf-8')
+        offsets.append(len(blob))
+
+    if sys.byteorder != 'little':
+        for values in (zips, cities, offsets):
+            values.byteswap()
+
+    body = bytearray(HEADER_FORMAT.pack(ZIP_DB_MAGIC, len(zips), len(city_names), len(state_codes)))
+    body += zips.tobytes() + cities.tobytes() + states
+    body += ''.join(code.ljust(2)[:2] for code in state_codes).encode('ascii')
+    body += b'\0' * (-len(body) % 4)
+    body += offsets.tobytes() + blob
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return len(zips)
+
+
+def read_source_records(source):
+    """
+    Read (zip, city, state) records from a GeoNames dump or a CSV file
+
+    Args:
+        source: URL or path to a GeoNames US.zip / US.txt, or a CSV with
+            zip, city and state columns
+
+    Returns:
+        list of (zip, city, state) tuples
+    """
+    # Only needed when rebuilding, so lookups do not pay for these imports
+    import csv
+    import io
+    import zipfile
+    from urllib.request import urlopen
+
+    if source.startswith(('http://', 'https://')):
+        with urlopen(source, timeout=60) as response:
+            data = response.read()
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+
+    if source.endswith('.zip'):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            data = archive.read('US.txt')
+    text = data.decode('utf-8')
+
+    if source.endswith('.csv'):
+        reader = csv.DictReader(io.StringIO(text))
+        return [(row['zip'], row['city'], row['state']) for row in reader]
+
+    # GeoNames: country, postal code, place name, admin name1, admin code1, ...
+    records = []
+    for line in text.splitlines():
+        fields = line.split('\t')
+        if len(fields) > 4 and fields[0] == 'US':
+            records.append((fields[1], fields[2], fields[4]))
+    return records
+
+
+def main(argv=None):
+    """Rebuild the bundled ZIP database"""
+    args = argv if argv is not None else sys.argv[1:]
+    source = args[0] if args else GEONAMES_US_URL
+    output = args[1] if len(args) > 1 else str(DEFAULT_DB_PATH)
+    count = write_zip_database(output, read_source_records(source))
+    print(f"Wrote {output} ({count} ZIP codes, {os.path.getsize(output)} bytes)")
+
+
+if __name__ == '__main__':
+    main()
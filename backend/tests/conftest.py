@@ -0,0 +1,6 @@
+"""Make the backend's lib package importable when pytest runs from the repo root"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
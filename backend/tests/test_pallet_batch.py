@@ -0,0 +1,101 @@
+"""
+calculate_batch must give what calculate_pallets, adjust_low_height_pallets
+and build_freight_items give for each order, field by field and bit for bit,
+in this process and split across worker processes.
+"""
+
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from lib import pallet_batch  # noqa: E402
+from lib.freight import build_freight_items  # noqa: E402
+from lib.order_lines import OrderLine  # noqa: E402
+from lib.pallet_calculator import adjust_low_height_pallets, calculate_pallets, determine_order_situation  # noqa: E402
+
+NAN = float('nan')
+
+
+def random_line(rng, number):
+    index = 100 if rng.random() < 0.2 else 0
+    length = rng.uniform(60, 97) if index == 100 else rng.uniform(4, 48)
+    dimensions = [length, rng.uniform(1, 40), rng.uniform(0.5, 45), rng.uniform(0.2, 90)]
+    # Blank cells in the dimension sheet come through as NaN
+    if rng.random() < 0.05:
+        dimensions[rng.randrange(4)] = NAN
+    quantity = float(rng.choice([0, 1, 2, 3, 5, 10, 25, 60, 150, 400]))
+    return OrderLine(f'SW-P{number}', quantity, f'P{number}', *dimensions, index)
+
+
+def random_orders(seed, count):
+    rng = random.Random(seed)
+    orders = {}
+    for number in range(count):
+        size = rng.choice([1, 2, 7, 8, 9, 16, 17, 129, 200]) if rng.random() < 0.2 else rng.randint(1, 12)
+        orders[f'SO-{number}'] = [random_line(rng, rng.randrange(50)) for _ in range(size)]
+    return orders
+
+
+def single_order(lines):
+    """(situation, totals, pallets, freight items) from the single-order functions; None if they raise"""
+    try:
+        order_situation = determine_order_situation(lines)
+        pallets, total_weight, total_volume = calculate_pallets(lines, order_situation)
+        pallets = adjust_low_height_pallets(pallets, total_volume, total_weight)
+        return order_situation, total_volume, total_weight, pallets, build_freight_items(pallets)
+    except Exception:
+        return None
+
+
+def same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return type(a) is type(b) and a == b
+
+
+def same_dicts(expected, actual):
+    return len(expected) == len(actual) and all(
+        a.keys() == b.keys() and all(same_value(a[key], b[key]) for key in a) for a, b in zip(expected, actual))
+
+
+def assert_batch_matches(orders, workers):
+    result = pallet_batch.calculate_batch(pallet_batch.lines_to_columns(orders), workers=workers, chunk_orders=40)
+    assert list(result['orders']['order']) == list(orders)
+
+    per_order = pallet_batch.order_results(result)
+    for position, (key, lines) in enumerate(orders.items()):
+        expected = single_order(lines)
+        pallets, freight_items = per_order[position]
+        if expected is None:
+            assert pallets is None and freight_items is None, key
+            continue
+        order_situation, total_volume, total_weight, expected_pallets, expected_items = expected
+        assert result['orders']['orderSituation'][position] == order_situation, key
+        assert same_value(float(result['orders']['totalVolume'][position]), total_volume), key
+        assert same_value(float(result['orders']['totalWeight'][position]), total_weight), key
+        assert same_dicts(expected_pallets, pallets), key
+        assert same_dicts(expected_items, freight_items), key
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_single_order_functions(seed):
+    assert_batch_matches(random_orders(seed, 400), workers=1)
+
+
+def test_matches_across_workers():
+    assert_batch_matches(random_orders(10, 300), workers=3)
+
+
+def test_index_100_and_nan_lines():
+    orders = {
+        'LONG': [OrderLine('SW-CROWN8', 12.0, 'CROWN8', 96.85, 5.0, 3.0, 4.0, 100)],
+        'MIXED': [OrderLine('SW-CROWN8', 3.0, 'CROWN8', 96.85, 5.0, 3.0, 4.0, 100),
+                  OrderLine('SW-B15', 40.0, 'B15', 24.4, 15.3, 35.4, 23.0, 0)],
+        'NAN': [OrderLine('SW-B15', 2.0, 'B15', 24.4, 15.3, NAN, 23.0, 0),
+                OrderLine('SW-W3042', 4.0, 'W3042', 31.1, 30.3, 42.9, NAN, 0)],
+        'FULL': [OrderLine('SW-BOX', 2.0, 'BOX', 48.0, 40.0, 60.0, 453.59237 * 2.2, 0)],
+    }
+    assert_batch_matches(orders, workers=1)
@@ -0,0 +1,120 @@
+"""
+pallet_engine must give the same pallets as the loops in pallet_calculator,
+bit for bit (types included), on random orders and on the floating-point
+boundaries where it hands orders back to the loops.
+"""
+
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from lib import pallet_engine  # noqa: E402
+from lib.pallet_calculator import (LONG_PALLET_BASE_AREA, PALLET_HEIGHT_LIMIT, PALLET_WEIGHT_LIMIT,  # noqa: E402
+                                   STANDARD_PALLET_BASE_AREA, adjust_low_height_pallets, allocate_pallets)
+
+STANDARD_SLICE = PALLET_HEIGHT_LIMIT * STANDARD_PALLET_BASE_AREA
+LONG_SLICE = PALLET_HEIGHT_LIMIT * LONG_PALLET_BASE_AREA
+
+
+def loop_pallets(order_situation, total_volume, total_weight, index_100_volume, index_100_weight):
+    """(allocated, adjusted) pallets from the loops; None where the loops raise"""
+    try:
+        allocated = allocate_pallets(order_situation, total_volume, total_weight, index_100_volume,
+                                     index_100_weight)
+    except Exception:
+        return None, None
+    copies = [dict(pallet) for pallet in allocated]
+    try:
+        adjusted = adjust_low_height_pallets(allocated, total_volume, total_weight)
+    except Exception:
+        adjusted = None
+    return copies, adjusted
+
+
+def same_pallets(expected, actual):
+    if len(expected) != len(actual):
+        return False
+    for a, b in zip(expected, actual):
+        for key in ('Type', 'Height', 'Weight'):
+            if isinstance(a[key], float) and isinstance(b[key], float) and math.isnan(a[key]) and math.isnan(b[key]):
+                continue
+            if type(a[key]) is not type(b[key]) or a[key] != b[key]:
+                return False
+    return True
+
+
+def assert_parity(orders):
+    columns = [list(column) for column in zip(*orders)]
+    table = pallet_engine.allocate(*columns)
+    allocated = table.to_lists()
+    adjusted = pallet_engine.adjust_low_height(table, columns[1], columns[2]).to_lists()
+
+    for i, order in enumerate(orders):
+        expected_allocated, expected_adjusted = loop_pallets(*order)
+        if expected_allocated is None:
+            continue
+        assert same_pallets(expected_allocated, allocated[i]), order
+        if expected_adjusted is None:
+            # The loops raise on orders without pallets; the engine leaves them empty
+            assert adjusted[i] == [], order
+        else:
+            assert same_pallets(expected_adjusted, adjusted[i]), order
+
+
+def random_order(rng):
+    order_situation = rng.choice(["Index 0 Only", "Contains Index 100"])
+    total_volume = rng.random() * 10 ** rng.uniform(3, 8)
+    total_weight = rng.random() * 10 ** rng.uniform(1, 6)
+    if order_situation == "Index 0 Only":
+        return order_situation, total_volume, total_weight, 0.0, 0.0
+    index_100_volume = total_volume * rng.choice([rng.random(), rng.random() ** 4, 1.0, 0.0])
+    index_100_weight = rng.choice([total_weight * rng.random(), total_weight * rng.uniform(1, 50), 0.0])
+    return order_situation, total_volume, total_weight, index_100_volume, index_100_weight
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_orders(seed):
+    rng = random.Random(seed)
+    assert_parity([random_order(rng) for _ in range(2000)])
+
+
+def test_whole_slices():
+    """Volumes and weights that fill pallets exactly, and the next float either side"""
+    orders = []
+    for count in (1, 2, 3, 7, 20):
+        for total_volume in (count * STANDARD_SLICE, count * LONG_SLICE):
+            for volume in (total_volume, np.nextafter(total_volume, 0), np.nextafter(total_volume, math.inf)):
+                volume = float(volume)
+                for total_weight in (count * PALLET_WEIGHT_LIMIT, count * PALLET_WEIGHT_LIMIT + 1e-9, 100.0):
+                    orders.append(("Index 0 Only", volume, total_weight, 0.0, 0.0))
+                    orders.append(("Contains Index 100", volume, total_weight, volume, total_weight))
+                    orders.append(("Contains Index 100", volume, total_weight, LONG_SLICE, PALLET_WEIGHT_LIMIT))
+    assert_parity(orders)
+
+
+def test_low_last_pallet():
+    """Last pallets just under and over the 20 in low-height threshold"""
+    orders = []
+    for count in (1, 2, 5):
+        for height in (19.0, 19.999999, 20.0, 20.000001, 0.5):
+            total_volume = count * STANDARD_SLICE + height * STANDARD_PALLET_BASE_AREA
+            orders.append(("Index 0 Only", total_volume, 500.0 * (count + 1), 0.0, 0.0))
+            long_volume = count * LONG_SLICE + height * LONG_PALLET_BASE_AREA
+            orders.append(("Contains Index 100", long_volume, 800.0 * (count + 1), long_volume, 800.0 * (count + 1)))
+    assert_parity(orders)
+
+
+def test_odd_input():
+    """Zero volume (the loops raise; the engine leaves the order empty), NaN and large totals"""
+    orders = [
+        ("Index 0 Only", 0.0, 0.0, 0.0, 0.0),
+        ("Index 0 Only", 0.0, 100.0, 0.0, 0.0),
+        ("Contains Index 100", STANDARD_SLICE, 0.0, 0.0, 0.0),
+        ("Contains Index 100", math.nan, 100.0, 0.0, 0.0),
+        ("Index 0 Only", 1e9, 1e6, 0.0, 0.0),
+        ("Contains Index 100", 1000.0, 10.0, 1000.0, 10.0),
+    ]
+    assert_parity(orders)
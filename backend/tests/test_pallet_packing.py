@@ -0,0 +1,91 @@
+"""
+pack_pallets must keep every pallet within the height and weight limits,
+place every carton exactly once, and pack known orders as a person would.
+"""
+
+import random
+
+import pytest
+
+from lib.order_lines import KG_TO_LB, OrderLine
+from lib.pallet_calculator import PALLET_WEIGHT_LIMIT
+from lib.pallet_packing import PALLET_PACKING_HEIGHT_LIMIT, pack_pallets
+
+# 3DB21, assembled: 26.8 x 21.3 x 35.4 in, 37 kg
+DB21 = (26.77165354, 21.3, 35.43307087, 37.0)
+
+
+def order_line(name, quantity, length, width, height, weight_kg, index=0):
+    return OrderLine(name, float(quantity), name, length, width, height, weight_kg, index)
+
+
+def random_order(rng):
+    lines = []
+    for number in range(rng.randint(1, 12)):
+        index = 100 if rng.random() < 0.15 else 0
+        length = rng.uniform(60, 96.8) if index == 100 else rng.uniform(4, 46)
+        lines.append(order_line(f'P{number}', rng.randint(1, 12), length, rng.uniform(1, 40), rng.uniform(0.5, 50),
+                                rng.uniform(0.5, 120), index))
+    return lines
+
+
+def assert_packed(lines, pallets):
+    assert pallets
+    for pallet in pallets:
+        assert pallet['Type'] in ('Standard', 'Long')
+        assert 0 < pallet['Height'] <= PALLET_PACKING_HEIGHT_LIMIT + 1e-9
+        assert 0 < pallet['Weight'] <= PALLET_WEIGHT_LIMIT + 1e-9
+
+    # Every carton's weight is counted once
+    order_weight = sum(line.quantity * line.weight_kg * KG_TO_LB for line in lines)
+    assert sum(pallet['Weight'] for pallet in pallets) == pytest.approx(order_weight)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_random_orders_within_limits(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        lines = random_order(rng)
+        pallets = pack_pallets(lines, time_budget_ms=10000)
+        assert_packed(lines, pallets)
+
+
+@pytest.mark.parametrize('quantity', [1, 7, 30, 113])
+def test_carton_count_conserved(quantity):
+    """With one carton size the pallet weights give the cartons placed"""
+    pallets = pack_pallets([order_line('3DB21', quantity, *DB21)], time_budget_ms=10000)
+    cartons = sum(pallet['Weight'] for pallet in pallets) / (DB21[3] * KG_TO_LB)
+    assert cartons == pytest.approx(quantity)
+
+
+def test_heavy_cartons_split_by_weight():
+    lines = [order_line('SAFE', 5, 20, 20, 10, 450)]
+    pallets = pack_pallets(lines, time_budget_ms=10000)
+    assert_packed(lines, pallets)
+    assert len(pallets) == 3
+
+
+def test_two_3db21_side_by_side():
+    pallets = pack_pallets([order_line('3DB21', 2, *DB21)], time_budget_ms=10000)
+    assert len(pallets) == 1
+    assert pallets[0]['Type'] == 'Standard'
+    assert pallets[0]['Weight'] == pytest.approx(2 * DB21[3] * KG_TO_LB)
+
+
+def test_four_3db21_lie_down_in_two_layers():
+    """Upright, a second layer would pass 60 in; lying down two layers fit"""
+    pallets = pack_pallets([order_line('3DB21', 4, *DB21)], time_budget_ms=10000)
+    assert len(pallets) == 1
+    assert pallets[0]['Height'] == pytest.approx(2 * DB21[0])
+
+
+def test_index_100_on_long_pallets():
+    lines = [order_line('CROWN8', 3, 96.85, 5, 3, 4, 100), order_line('B15', 2, 24.4, 15.3, 35.4, 23)]
+    pallets = pack_pallets(lines, time_budget_ms=10000)
+    assert_packed(lines, pallets)
+    assert [pallet['Type'] for pallet in pallets] == ['Long']
+
+
+def test_unpackable_order_falls_back():
+    assert pack_pallets([order_line('NODIMS', 1, float('nan'), 10, 10, 5)]) is None
+    assert pack_pallets([order_line('HUGE', 1, 200, 100, 100, 5)]) is None
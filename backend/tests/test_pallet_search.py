@@ -0,0 +1,106 @@
+"""
+search_pallets must return the same configurations as an exhaustive
+enumeration (its pruning may only skip configurations that cannot make the
+cut), cheapest first, at most limit of them, with the calculate_pallets
+pallets always considered.
+"""
+
+import math
+import random
+import time
+
+import pytest
+
+from lib.freight import build_freight_items
+from lib.order_lines import OrderLine, column_sum
+from lib.pallet_calculator import adjust_low_height_pallets, calculate_pallets, determine_order_situation
+from lib.pallet_search import PalletSearch, freight_cost, search_pallets
+
+
+class ExhaustiveSearch(PalletSearch):
+    """PalletSearch without pruning: every configuration is evaluated"""
+
+    def lower_bound(self, n_long, n_standard):
+        return -math.inf
+
+
+def random_order(rng):
+    lines = []
+    for number in range(rng.randint(1, 10)):
+        index = 100 if rng.random() < 0.25 else 0
+        length = rng.uniform(60, 97) if index == 100 else rng.uniform(4, 48)
+        lines.append(OrderLine(f'SW-P{number}', float(rng.randint(1, 40)), f'P{number}', length,
+                               rng.uniform(1, 40), rng.uniform(0.5, 45), rng.uniform(0.2, 90), index))
+    return lines
+
+
+def plan(lines):
+    pallets, total_weight, total_volume = calculate_pallets(lines, determine_order_situation(lines))
+    return adjust_low_height_pallets(pallets, total_volume, total_weight), total_volume, total_weight
+
+
+def exhaustive_results(lines, pallets, total_volume, total_weight, limit):
+    """search_pallets, with ExhaustiveSearch"""
+    search = ExhaustiveSearch(total_volume, total_weight,
+                              column_sum([line.volume for line in lines if line.index == 100]))
+    freight_items = build_freight_items(pallets)
+    search.add('calculate_pallets', freight_cost(freight_items), pallets, freight_items, limit)
+    search.run(limit)
+    return search.results()
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('limit', [1, 3, 8])
+def test_pruning_keeps_the_cheapest(seed, limit):
+    rng = random.Random(seed)
+    for _ in range(30):
+        lines = random_order(rng)
+        pallets, total_volume, total_weight = plan(lines)
+        results = search_pallets(lines, pallets, total_volume, total_weight, limit)
+        expected = exhaustive_results(lines, pallets, total_volume, total_weight, limit)
+
+        assert [result['cost'] for result in results] == [result['cost'] for result in expected]
+        assert len(results) <= limit
+        assert [result['cost'] for result in results] == sorted(result['cost'] for result in results)
+
+        # The calculate_pallets pallets are returned unless limit cheaper ones were found
+        labels = [result['label'] for result in results]
+        baseline_cost = freight_cost(build_freight_items(pallets))
+        assert 'calculate_pallets' in labels or (len(results) == limit and results[-1]['cost'] <= baseline_cost)
+
+
+def test_lower_bound_is_a_bound():
+    """No configuration costs less than the bound used to prune it"""
+    rng = random.Random(42)
+    for _ in range(30):
+        lines = random_order(rng)
+        _, total_volume, total_weight = plan(lines)
+        search = ExhaustiveSearch(total_volume, total_weight,
+                                  column_sum([line.volume for line in lines if line.index == 100]))
+        search.run(1000)
+        for cost, _, label, pallets, _ in search.candidates:
+            n_long = sum(pallet['Type'] == 'Long' for pallet in pallets)
+            assert -cost >= PalletSearch.lower_bound(search, n_long, len(pallets) - n_long) - 1e-9, label
+
+
+def test_results_capped_at_limit():
+    lines = [OrderLine('SW-B15', 60.0, 'B15', 24.4, 15.3, 35.4, 23.0, 0),
+             OrderLine('SW-CROWN8', 10.0, 'CROWN8', 96.85, 5.0, 3.0, 4.0, 100)]
+    pallets, total_volume, total_weight = plan(lines)
+    for limit in (1, 2, 5):
+        results = search_pallets(lines, pallets, total_volume, total_weight, limit)
+        assert len(results) == limit
+        assert len({result['label'] for result in results}) == limit
+        for result in results:
+            assert result['freightItems'] == build_freight_items(result['pallets'])
+            assert result['cost'] == pytest.approx(freight_cost(result['freightItems']))
+
+
+def test_search_takes_milliseconds():
+    rng = random.Random(7)
+    orders = [plan(lines) + (lines,) for lines in (random_order(rng) for _ in range(100))]
+    start = time.perf_counter()
+    for pallets, total_volume, total_weight, lines in orders:
+        search_pallets(lines, pallets, total_volume, total_weight)
+    # Typically about a millisecond per order; the bound leaves room for slow machines
+    assert (time.perf_counter() - start) / len(orders) < 0.02
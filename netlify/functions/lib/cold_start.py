@@ -0,0 +1,218 @@
+"""
+Cold Start Tools
+Build the precomputed data bundle shipped with the quote function, and
+measure what a cold start costs
+
+The bundle is the dimension snapshot, the ZIP database and compiled
+bytecode for the function's own modules. The Lambda filesystem is read-only,
+so without bytecode every cold start compiles quote.py and lib/ from source.
+
+Run from netlify/functions:
+    python -m lib.cold_start bundle [--strict]
+    python -m lib.cold_start report [--runs 5] [--top 15] [--json]
+
+The report imports quote.py in fresh interpreters (without writing
+bytecode, so it measures what is on disk) and times the import and each
+warm-up step. Keep the --json output per release to track cold-start cost.
+"""
+
+import argparse
+import compileall
+import json
+import os
+import py_compile
+import subprocess
+import sys
+from pathlib import Path
+from statistics import median
+
+
+FUNCTION_DIR = Path(__file__).parent.parent
+
+# Modules compiled into the bundle
+BYTECODE_PATHS = ['quote.py', 'lib']
+
+# Run in a fresh interpreter by report(); prints one JSON line
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import quote
+import_ms = (time.perf_counter() - start) * 1000
+warm_up_ms = quote.warm_up(quote.DIMENSIONS_PATH)
+print(json.dumps({"importMs": import_ms, "warmUpMs": warm_up_ms}))
+'''
+
+
+def build_bundle(function_dir=FUNCTION_DIR):
+    """
+    Refresh the precomputed data shipped with the function
+
+    Rebuilds the dimension snapshot when the workbook changed, checks the
+    ZIP database is present and compiles bytecode when the build
+    interpreter is the runtime's Python version (AWS_LAMBDA_PYTHON_VERSION;
+    bytecode for any other version would never be loaded). Problems are
+    reported, not raised: the function still works without the bundle,
+    only its cold starts are slower.
+
+    Returns:
+        bool: True if every part of the bundle is in place
+    """
+    from .dimension_snapshot import compile_snapshot, file_digest, get_snapshot_path, read_snapshot
+    from .zip_database import DEFAULT_DB_PATH, ZipDatabase
+
+    function_dir = Path(function_dir)
+    ok = True
+
+    excel_path = function_dir / 'data' / 'Product Dimension.xlsx'
+    snapshot_path = get_snapshot_path(excel_path)
+    if read_snapshot(snapshot_path, file_digest(excel_path)) is not None:
+        print(f"Dimension snapshot up to date: {snapshot_path}")
+    else:
+        try:
+            compile_snapshot(str(excel_path))
+            print(f"Rebuilt dimension snapshot: {snapshot_path}")
+        except Exception as e:
+            print(f"WARNING: could not rebuild {snapshot_path}: {e}")
+            ok = False
+
+    try:
+        print(f"ZIP database: {len(ZipDatabase(DEFAULT_DB_PATH))} ZIP codes")
+    except (OSError, ValueError) as e:
+        print(f"WARNING: ZIP database unavailable ({DEFAULT_DB_PATH}): {e}")
+        ok = False
+
+    build_version = f'{sys.version_info[0]}.{sys.version_info[1]}'
+    runtime_version = os.environ.get('AWS_LAMBDA_PYTHON_VERSION')
+    if runtime_version and runtime_version != build_version:
+        print(f"WARNING: not compiling bytecode: the build runs Python {build_version}, "
+              f"the function runs {runtime_version}")
+        return False
+
+    # Hash-checked bytecode stays valid when packaging rewrites file mtimes
+    mode = py_compile.PycInvalidationMode.CHECKED_HASH
+    for name in BYTECODE_PATHS:
+        path = str(function_dir / name)
+        if os.path.isdir(path):
+            compiled = compileall.compile_dir(path, quiet=1, force=True, invalidation_mode=mode)
+        else:
+            compiled = compileall.compile_file(path, quiet=1, force=True, invalidation_mode=mode)
+        if not compiled:
+            print(f"WARNING: could not compile {path}")
+            ok = False
+    print(f"Compiled bytecode for Python {build_version}")
+
+    return ok
+
+
+def parse_importtime(stderr):
+    """
+    Self time per module from `python -X importtime` output
+
+    Returns:
+        dict: module name -> microseconds
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[0])
+    return times
+
+
+def group_name(module):
+    """Report group for a module: lib modules individually, others by top-level package"""
+    parts = module.split('.')
+    return '.'.join(parts[:2]) if parts[0] == 'lib' else parts[0]
+
+
+def report(runs=5, top=15, function_dir=FUNCTION_DIR):
+    """
+    Measure a cold start of the quote function
+
+    Args:
+        runs: Fresh interpreters to start (the report uses medians)
+        top: Import groups to list, slowest first
+        function_dir: Directory holding quote.py
+
+    Returns:
+        dict: {"python", "runs", "importMs", "warmUpMs", "totalMs", "imports"}
+    """
+    env = dict(os.environ, QUOTE_PRELOAD='no', QUOTE_TIMING_LOG='no')
+    samples = []
+    group_samples = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-B', '-X', 'importtime', '-c', _PROBE],
+            cwd=str(function_dir), env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        groups = {}
+        for module, micros in parse_importtime(result.stderr).items():
+            group = group_name(module)
+            groups[group] = groups.get(group, 0) + micros
+        for group, micros in groups.items():
+            group_samples.setdefault(group, []).append(micros / 1000)
+
+    import_ms = median(sample['importMs'] for sample in samples)
+    warm_up_ms = {
+        step: round(median(sample['warmUpMs'][step] for sample in samples), 2)
+        for step in samples[0]['warmUpMs']
+    }
+    imports = sorted(
+        ({'module': group, 'ms': round(median(values), 2)} for group, values in group_samples.items()),
+        key=lambda item: item['ms'], reverse=True
+    )
+    return {
+        'python': sys.version.split()[0],
+        'runs': runs,
+        'importMs': round(import_ms, 2),
+        'warmUpMs': warm_up_ms,
+        'totalMs': round(import_ms + sum(warm_up_ms.values()), 2),
+        'imports': imports[:top]
+    }
+
+
+def print_report(result):
+    """Print a report() result as a table"""
+    print(f"Python {result['python']}, median of {result['runs']} cold starts")
+    print(f"  {'import quote':<28}{result['importMs']:>10.2f} ms")
+    for step, ms in result['warmUpMs'].items():
+        print(f"  {'warm_up: ' + step:<28}{ms:>10.2f} ms")
+    print(f"  {'total':<28}{result['totalMs']:>10.2f} ms")
+    print("Slowest imports (self time, includes the interpreter's own start-up imports)")
+    for item in result['imports']:
+        print(f"  {item['module']:<28}{item['ms']:>10.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    bundle_parser = commands.add_parser('bundle', help='Rebuild the precomputed data bundle')
+    bundle_parser.add_argument('--strict', action='store_true',
+                               help='Exit with an error if part of the bundle is missing')
+    report_parser = commands.add_parser('report', help='Measure cold-start cost')
+    report_parser.add_argument('--runs', type=int, default=5)
+    report_parser.add_argument('--top', type=int, default=15)
+    report_parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bundle':
+        # A missing part only slows cold starts, so by default it does not fail the deploy
+        complete = build_bundle()
+        if not complete:
+            print("WARNING: the bundle is incomplete; the function still works, its cold starts are slower")
+        sys.exit(1 if args.strict and not complete else 0)
+
+    result = report(runs=args.runs, top=args.top)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,37 @@ Freight Class Calculation and C.H. Robinson Integration
 Ported from development/main.py lines 767-1030
 """
 
-import requests
+import hashlib
+import json
+import os
+
+from . import http_client, metrics
+from .cache import TTLCache
+from .zip_database import lookup_zip
 
 
 # Standard and long pallet dimensions
 STANDARD_PALLET_DIMENSIONS = {"length": 48, "width": 40}
 LONG_PALLET_DIMENSIONS = {"length": 96, "width": 48}
 
+# Query api.zippopotam.us for ZIPs missing from the bundled database
+ZIP_REMOTE_FALLBACK = os.environ.get('ZIP_REMOTE_FALLBACK', 'yes').lower() in ('1', 'true', 'yes')
+
+# Remote ZIP results, so an unknown ZIP is fetched at most once a day
+remote_zip_cache = TTLCache(ttl=86400, max_entries=1000)
+
+# Rate quotes for identical C.H. Robinson payloads (TTL of 0 disables the cache;
+# set CHR_QUOTE_CACHE_DB to a file path to share quotes across workers)
+CHR_QUOTE_CACHE_TTL = float(os.environ.get('CHR_QUOTE_CACHE_TTL', 900))
+CHR_QUOTE_CACHE_SIZE = int(os.environ.get('CHR_QUOTE_CACHE_SIZE', 500))
+CHR_QUOTE_CACHE_DB = os.environ.get('CHR_QUOTE_CACHE_DB')
+
+quote_cache = (
+    TTLCache(ttl=CHR_QUOTE_CACHE_TTL, max_entries=CHR_QUOTE_CACHE_SIZE,
+             db_path=CHR_QUOTE_CACHE_DB, table='chr_quotes')
+    if CHR_QUOTE_CACHE_TTL > 0 else None
+)
+
 # Freight class mapping based on density
 FREIGHT_CLASS_MAP = [
     (50, 50),
@@ -102,24 +126,74 @@ def get_city_state_from_zip(zip_code):
     Get city and state from ZIP code
     Ported from development/main.py lines 853-866
     
+    Looks the ZIP up in the bundled database first. ZIPs it does not know
+    fall back to api.zippopotam.us unless ZIP_REMOTE_FALLBACK is off.
+    
     Args:
         zip_code: 5-digit ZIP code string
         
     Returns:
         tuple: (city, state) or (None, None) if not found
     """
+    location = lookup_zip_offline(zip_code)
+    if location is not None:
+        return location
+    
     try:
-        response = requests.get(f"http://api.zippopotam.us/us/{zip_code}")
-        if response.status_code == 200:
-            data = response.json()
-            city = data['places'][0]['place name']
-            state = data['places'][0]['state abbreviation']
-            return city, state
-        else:
-            print(f"Error: Unable to fetch data for ZIP code {zip_code}")
-            return None, None
+        return read_zip_response(zip_code, http_client.get(zip_api_url(zip_code)))
     except Exception as e:
         print(f"An error occurred: {e}")
+        metrics.zip_lookups.inc(source='miss')
+        return None, None
+
+
+def lookup_zip_offline(zip_code):
+    """
+    Resolve a ZIP code from the bundled database or the remote-result cache
+    
+    Returns:
+        tuple: (city, state), (None, None) if the ZIP is unknown and the
+        remote fallback is off, or None if api.zippopotam.us should be asked
+    """
+    city, state = lookup_zip(zip_code)
+    if city:
+        metrics.zip_lookups.inc(source='bundled')
+        return city, state
+    
+    if not ZIP_REMOTE_FALLBACK:
+        print(f"Error: ZIP code {zip_code} not in ZIP database")
+        metrics.zip_lookups.inc(source='miss')
+        return None, None
+    
+    cached = remote_zip_cache.get(zip_code)
+    if cached is not None:
+        metrics.zip_lookups.inc(source='remote_cache')
+        return tuple(cached)
+    return None
+
+
+def zip_api_url(zip_code):
+    """api.zippopotam.us URL for a US ZIP code"""
+    return f"http://api.zippopotam.us/us/{zip_code}"
+
+
+def read_zip_response(zip_code, response):
+    """
+    Read an api.zippopotam.us response, caching a found ZIP
+    
+    Returns:
+        tuple: (city, state) or (None, None) if not found
+    """
+    if response.status_code == 200:
+        data = response.json()
+        city = data['places'][0]['place name']
+        state = data['places'][0]['state abbreviation']
+        remote_zip_cache.set(zip_code, (city, state))
+        metrics.zip_lookups.inc(source='remote')
+        return city, state
+    else:
+        print(f"Error: Unable to fetch data for ZIP code {zip_code}")
+        metrics.zip_lookups.inc(source='miss')
         return None, None
 
 
@@ -243,6 +317,96 @@ def parse_chr_quote_response(response_data):
     return quotes
 
 
+def quote_cache_key(base_url, payload):
+    """
+    Canonical cache key for a C.H. Robinson quote request
+    
+    Args:
+        base_url: C.H. Robinson API base URL (sandbox and production differ)
+        payload: Request payload from build_chr_quote_request
+        
+    Returns:
+        str: SHA-256 of the payload serialized with sorted keys
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{base_url}|{canonical}".encode('utf-8')).hexdigest()
+
+
+def fetch_chr_quotes(chr_auth, freight_items, pickup_info, delivery_info, 
+                     ship_date, is_residential, needs_liftgate, customer_code,
+                     cache=None):
+    """
+    Get shipping quotes from C.H. Robinson, using the quote cache when possible
+    
+    Takes the same arguments as get_chr_quotes, plus:
+        cache: TTLCache to use (defaults to the module quote_cache)
+        
+    Returns:
+        tuple: (parsed quotes, True if served from cache)
+    """
+    cache = quote_cache if cache is None else cache
+    
+    payload, cache_key, cached = prepare_chr_quote_request(
+        chr_auth, freight_items, pickup_info, delivery_info, ship_date,
+        is_residential, needs_liftgate, customer_code, cache
+    )
+    if cached is not None:
+        return cached, True
+    
+    # Make API request
+    url = f"{chr_auth.base_url}/v1/quotes"
+    response = http_client.post(url, json=payload, headers=chr_auth.get_headers())
+    
+    # The shared token may have been revoked early; fetch a fresh one and retry once
+    if response.status_code == 401:
+        chr_auth.invalidate_token()
+        response = http_client.post(url, json=payload, headers=chr_auth.get_headers())
+    
+    return read_chr_quote_response(response, cache, cache_key), False
+
+
+def prepare_chr_quote_request(chr_auth, freight_items, pickup_info, delivery_info,
+                              ship_date, is_residential, needs_liftgate, customer_code, cache):
+    """
+    Build the C.H. Robinson payload and look it up in the quote cache
+    
+    Returns:
+        tuple: (payload, cache key, cached quotes or None)
+    """
+    payload = build_chr_quote_request(
+        freight_items, pickup_info, delivery_info, ship_date,
+        is_residential, needs_liftgate, customer_code
+    )
+    
+    cache_key = quote_cache_key(chr_auth.base_url, payload)
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return payload, cache_key, [dict(quote) for quote in cached]
+    return payload, cache_key, None
+
+
+def read_chr_quote_response(response, cache, cache_key):
+    """
+    Parse a C.H. Robinson quote response and cache the quotes
+    
+    Returns:
+        list: Parsed quotes
+        
+    Raises:
+        Exception: If C.H. Robinson returned an error
+    """
+    if response.status_code == 201:
+        data = response.json()
+        quotes = parse_chr_quote_response(data)
+        # Empty results are not cached so a transient gap is retried next time
+        if cache is not None and quotes:
+            cache.set(cache_key, [dict(quote) for quote in quotes])
+        return quotes
+    else:
+        raise Exception(f"C.H. Robinson API error {response.status_code}: {response.text}")
+
+
 def get_chr_quotes(chr_auth, freight_items, pickup_info, delivery_info, 
                    ship_date, is_residential, needs_liftgate, customer_code):
     """
@@ -261,22 +425,8 @@ def get_chr_quotes(chr_auth, freight_items, pickup_info, delivery_info,
     Returns:
         list: Parsed quotes
     """
-    # Build request payload
-    payload = build_chr_quote_request(
-        freight_items, pickup_info, delivery_info, ship_date,
-        is_residential, needs_liftgate, customer_code
+    quotes, _ = fetch_chr_quotes(
+        chr_auth, freight_items, pickup_info, delivery_info,
+        ship_date, is_residential, needs_liftgate, customer_code
     )
-    
-    # Get authentication headers
-    headers = chr_auth.get_headers()
-    
-    # Make API request
-    url = f"{chr_auth.base_url}/v1/quotes"
-    response = requests.post(url, json=payload, headers=headers)
-    
-    if response.status_code == 201:
-        data = response.json()
-        return parse_chr_quote_response(data)
-    else:
-        raise Exception(f"C.H. Robinson API error {response.status_code}: {response.text}")
-
+    return quotes
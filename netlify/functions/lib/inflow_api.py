@@ -3,15 +3,61 @@ inFlow API Client
 Ported from development/main.py lines 91-498
 """
 
-import requests
+import os
+import threading
 import time
-import pandas as pd
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import http_client, metrics, timing
+from .cache import TTLCache
+from .order_index import OrderIndex
+from .order_lines import OrderLine, group_sum, to_number
+from .rate_limiter import TokenBucket, backoff_delay, parse_retry_after
+
+
+# Concurrent product-detail fetches per order (1 = sequential)
+PRODUCT_FETCH_WORKERS = int(os.environ.get('INFLOW_PRODUCT_FETCH_WORKERS', 8))
+
+# Pages fetched concurrently by the search_todays_orders pagination fallback (1 = sequential)
+SEARCH_PAGE_WINDOW = int(os.environ.get('INFLOW_SEARCH_PAGE_WINDOW', 3))
+
+# Process-wide cap on in-flight inFlow requests, shared by every InflowAPI
+# instance so concurrent quotes draw from one rate budget
+INFLOW_MAX_IN_FLIGHT = int(os.environ.get('INFLOW_MAX_IN_FLIGHT', 8))
+_inflow_slots = threading.BoundedSemaphore(INFLOW_MAX_IN_FLIGHT)
+
+# Client-side rate limit shared by every inFlow call in the process
+INFLOW_RATE_LIMIT_RPS = float(os.environ.get('INFLOW_RATE_LIMIT_RPS', 5))
+INFLOW_RATE_LIMIT_BURST = float(os.environ.get('INFLOW_RATE_LIMIT_BURST', 10))
+inflow_rate_limiter = TokenBucket(INFLOW_RATE_LIMIT_RPS, INFLOW_RATE_LIMIT_BURST)
+
+# Retry backoff: first delay and ceiling in seconds (jittered, doubling per attempt)
+RETRY_BACKOFF_BASE = float(os.environ.get('INFLOW_RETRY_BACKOFF_BASE', 2))
+RETRY_BACKOFF_CAP = float(os.environ.get('INFLOW_RETRY_BACKOFF_CAP', 60))
+
+# Product detail cache (name/SKU rarely change). TTL of 0 disables it;
+# set INFLOW_PRODUCT_CACHE_DB to a file path to keep entries across restarts.
+PRODUCT_CACHE_TTL = float(os.environ.get('INFLOW_PRODUCT_CACHE_TTL', 86400))
+PRODUCT_CACHE_SIZE = int(os.environ.get('INFLOW_PRODUCT_CACHE_SIZE', 5000))
+PRODUCT_CACHE_DB = os.environ.get('INFLOW_PRODUCT_CACHE_DB')
+
+product_cache = (
+    TTLCache(ttl=PRODUCT_CACHE_TTL, max_entries=PRODUCT_CACHE_SIZE,
+             db_path=PRODUCT_CACHE_DB, table='inflow_products')
+    if PRODUCT_CACHE_TTL > 0 else None
+)
+
+
+# Optional local order-number index (see lib/order_index.py)
+ORDER_INDEX_DB = os.environ.get('ORDER_INDEX_DB')
+order_index = OrderIndex(ORDER_INDEX_DB) if ORDER_INDEX_DB else None
 
 
 class InflowAPI:
     """Client for inFlow Inventory API"""
     
-    def __init__(self, company_id, api_key, api_version='2025-06-24'):
+    def __init__(self, company_id, api_key, api_version='2025-06-24', product_cache=product_cache,
+                 order_index=order_index):
         self.company_id = company_id
         self.api_key = api_key
         self.base_url = f"https://cloudapi.inflowinventory.com/{company_id}"
@@ -21,63 +67,104 @@ class InflowAPI:
             'Accept': f'application/json;version={api_version}',
             'X-OverrideAllowNegativeInventory': 'TRUE'
         }
+        self.product_cache = product_cache
+        self.order_index = order_index
     
-    def fetch_with_retries(self, url, timeout=60, max_attempts=5):
+    def _get(self, url, timeout=None):
+        """GET an inFlow URL under the shared rate limit and in-flight slots"""
+        inflow_rate_limiter.acquire()
+        with _inflow_slots:
+            return http_client.get(url, headers=self.headers, timeout=timeout)
+    
+    def fetch_with_retries(self, url, timeout=60, max_attempts=5, retry_errors=True):
         """
         Fetch with retry mechanism for rate limiting and timeouts
         Ported from development/main.py lines 92-128
+        
+        A 429 pauses the shared rate limiter for the Retry-After period (or a
+        jittered exponential backoff), so every concurrent caller backs off
+        together. Other failures back off exponentially with jitter.
+        
+        Args:
+            url: inFlow URL
+            timeout: Request timeout in seconds
+            max_attempts: Maximum attempts before giving up
+            retry_errors: Retry non-429 error statuses (otherwise return them)
         """
         attempt = 0
-        wait_time_timeout = 10  # Initial timeout wait seconds
-        wait_time_429 = 20      # Initial 429 wait seconds
 
         while attempt < max_attempts:
             attempt += 1
             try:
-                resp = requests.get(url, headers=self.headers, timeout=timeout)
-                
-                if resp.status_code == 429:
-                    print(f"Rate limited (429). Waiting {wait_time_429} seconds...")
-                    time.sleep(wait_time_429)
-                    wait_time_429 += 10
-                    continue
-                    
-                if resp.status_code == 200:
+                resp = self._get(url, timeout=timeout)
+                delay = self.retry_delay(resp, attempt, max_attempts, retry_errors)
+                if delay is None:
                     return resp
-                else:
-                    print(f"HTTP {resp.status_code}: {resp.text}")
-                    if attempt < max_attempts:
-                        time.sleep(wait_time_timeout)
-                        wait_time_timeout += attempt * 10
                         
-            except requests.exceptions.Timeout:
+            except http_client.Timeout:
                 print(f"Timeout on attempt {attempt}/{max_attempts}")
-                if attempt < max_attempts:
-                    time.sleep(wait_time_timeout)
-                    wait_time_timeout += attempt * 10
+                delay = self.error_delay('timeout', attempt, max_attempts)
                     
             except Exception as e:
                 print(f"Error on attempt {attempt}/{max_attempts}: {e}")
-                if attempt < max_attempts:
-                    time.sleep(wait_time_timeout)
-                    wait_time_timeout += attempt * 10
+                delay = self.error_delay('error', attempt, max_attempts)
+            
+            if delay:
+                time.sleep(delay)
         
         raise Exception(f"Failed to fetch data after {max_attempts} attempts")
     
+    def retry_delay(self, resp, attempt, max_attempts, retry_errors):
+        """
+        Decide what fetch_with_retries does with a response
+        
+        Returns:
+            None to return the response, otherwise seconds to sleep before
+            the next attempt (0 after a 429: the paused rate limiter does the waiting)
+        """
+        if resp.status_code == 429:
+            wait_time = parse_retry_after(resp.headers.get('Retry-After'))
+            if wait_time is None:
+                wait_time = backoff_delay(attempt, RETRY_BACKOFF_BASE, RETRY_BACKOFF_CAP)
+            print(f"Rate limited (429). Waiting {wait_time:.1f} seconds...")
+            metrics.inflow_rate_limited.inc()
+            if attempt < max_attempts:
+                metrics.inflow_retries.inc(reason='429')
+            inflow_rate_limiter.pause(wait_time)
+            return 0
+            
+        if resp.status_code == 200 or not retry_errors:
+            return None
+        
+        print(f"HTTP {resp.status_code}: {resp.text}")
+        return self.error_delay('status', attempt, max_attempts)
+    
+    def error_delay(self, reason, attempt, max_attempts):
+        """Count a failed attempt and return the backoff before the next one (0 after the last)"""
+        if attempt >= max_attempts:
+            return 0
+        metrics.inflow_retries.inc(reason=reason)
+        return backoff_delay(attempt, RETRY_BACKOFF_BASE, RETRY_BACKOFF_CAP)
+    
     def fetch_single_order_from_api(self, sales_order_id):
         """
         Fetch a single order by ID
         Ported from development/main.py lines 130-143
+        
+        Returns:
+            dict: The inFlow sales order (with lines)
         """
-        url = f"{self.base_url}/sales-orders/{sales_order_id}?include=lines,customer"
-        response = self.fetch_with_retries(url, timeout=60, max_attempts=5)
+        response = self.fetch_with_retries(self.order_url(sales_order_id), timeout=60, max_attempts=5)
         
         if response.status_code == 200:
-            json_data = response.json()
-            return pd.json_normalize([json_data])
+            return response.json()
         else:
             raise Exception(f"Failed to fetch order {sales_order_id}")
     
+    def order_url(self, sales_order_id):
+        """URL of one order, with its lines"""
+        return f"{self.base_url}/sales-orders/{sales_order_id}?include=lines,customer"
+    
     def search_todays_orders(self, order_number):
         """
         Search for an order or quote by order number
@@ -86,145 +173,358 @@ class InflowAPI:
         
         Note: inFlow uses the same /sales-orders endpoint for both orders and quotes,
         differentiated by the isQuote field (true for quotes, false for sales orders)
+        
+        When an order index is configured, indexed numbers are fetched by ID
+        in one call, and every order seen while searching is added to it.
+        
+        Returns:
+            dict: The inFlow sales order (with lines), or None if not found
         """
+        # Try the local order index first (one call when the number is known)
+        if self.order_index is not None:
+            order = self.find_indexed_order(order_number)
+            if order is not None:
+                return order
+        
         # Try using orderNumber filter directly (most efficient)
-        url = (
+        try:
+            print(f"Searching for order/quote: {order_number}")
+            response = self.fetch_with_retries(self.order_search_url(order_number), timeout=60, max_attempts=5)
+            
+            order = self.match_filtered_orders(response, order_number)
+            if order is not None:
+                return order
+        except Exception as e:
+            print(f"Error with filtered search: {e}")
+        
+        # Fallback: Search through recent orders if filter doesn't work
+        print(f"Filter search didn't find order/quote, trying pagination...")
+        order = self.search_order_pages(order_number, range(0, 1000, 100))
+        if order is not None:
+            return order
+        
+        print(f"Order/quote {order_number} not found after exhaustive search")
+        return None
+    
+    def order_search_url(self, order_number):
+        """URL of the filtered order-number search"""
+        return (
             f"{self.base_url}/sales-orders"
             f"?count=100&include=lines,customer"
             f"&filter[orderNumber]={order_number}"
         )
+    
+    def match_filtered_orders(self, response, order_number):
+        """
+        Pick the order out of a filtered search response
+        
+        Returns:
+            dict: The order, or None if the response does not contain it
+        """
+        if response.status_code != 200:
+            print(f"Filter search failed, status={response.status_code}")
+            return None
+        
+        orders = response.json()
+        print(f"Response type: {type(orders)}, length: {len(orders) if isinstance(orders, list) else 'N/A'}")
+        
+        # Handle both single object and array responses
+        if isinstance(orders, dict):
+            # Single order returned
+            if orders.get('orderNumber', '').upper() == order_number.upper():
+                is_quote = orders.get('isQuote', False)
+                doc_type = 'quote' if is_quote else 'sales order'
+                print(f"Found {doc_type} {order_number} (single result)")
+                self.remember_orders([orders])
+                return orders
+        elif isinstance(orders, list):
+            # Filter might return exact match or similar matches
+            for order in orders:
+                if order.get('orderNumber', '').upper() == order_number.upper():
+                    is_quote = order.get('isQuote', False)
+                    doc_type = 'quote' if is_quote else 'sales order'
+                    print(f"Found {doc_type} {order_number} in results")
+                    self.remember_orders([order])
+                    return order
+        return None
+    
+    def search_order_pages(self, order_number, skips, window=SEARCH_PAGE_WINDOW):
+        """
+        Scan pages of recent orders for an order number
+        
+        Keeps up to `window` pages in flight (under the shared rate limiter).
+        As soon as one page finds the order, pages that have not started are
+        cancelled. No new pages are started after an empty or failed page.
+        
+        Args:
+            order_number: Order or quote number
+            skips: Page offsets to scan, in order
+            window: Pages fetched concurrently (1 = one page at a time)
+            
+        Returns:
+            dict: The order, or None if no page contains it
+        """
+        found = threading.Event()
+        search_page = timing.bind(self._search_order_page)
+        remaining = iter(skips)
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=max(1, window))
+        
+        def submit_next():
+            skip = next(remaining, None)
+            if skip is None:
+                return False
+            pending.add(executor.submit(search_page, order_number, skip, found))
+            return True
         
         try:
-            print(f"Searching for order/quote: {order_number}")
-            response = self.fetch_with_retries(url, timeout=60, max_attempts=5)
+            exhausted = False
+            while len(pending) < max(1, window) and submit_next():
+                pass
             
-            if response.status_code == 200:
-                orders = response.json()
-                print(f"Response type: {type(orders)}, length: {len(orders) if isinstance(orders, list) else 'N/A'}")
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    status, order = future.result()
+                    if status == 'found':
+                        return order
+                    if status == 'end':
+                        exhausted = True
                 
-                # Handle both single object and array responses
-                if isinstance(orders, dict):
-                    # Single order returned
-                    if orders.get('orderNumber', '').upper() == order_number.upper():
-                        is_quote = orders.get('isQuote', False)
-                        doc_type = 'quote' if is_quote else 'sales order'
-                        print(f"Found {doc_type} {order_number} (single result)")
-                        return pd.json_normalize([orders])
-                elif isinstance(orders, list):
-                    # Array of orders
-                    if len(orders) > 0:
-                        # Filter might return exact match or similar matches
-                        for order in orders:
-                            if order.get('orderNumber', '').upper() == order_number.upper():
-                                is_quote = order.get('isQuote', False)
-                                doc_type = 'quote' if is_quote else 'sales order'
-                                print(f"Found {doc_type} {order_number} in results")
-                                return pd.json_normalize([order])
-            else:
-                print(f"Filter search failed, status={response.status_code}")
+                while not exhausted and len(pending) < max(1, window) and submit_next():
+                    pass
+            
+            return None
+        finally:
+            # Stop pages that are still queued or waiting on the rate limiter
+            found.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def _search_order_page(self, order_number, skip, found):
+        """
+        Fetch one page of the pagination fallback
+        
+        Returns:
+            tuple: (status, order) where status is 'found', 'miss', 'end'
+            (no more pages) or 'cancelled'
+        """
+        if found.is_set():
+            return 'cancelled', None
+        
+        try:
+            response = self.fetch_with_retries(self.order_page_url(skip), timeout=60, max_attempts=5)
+            return self.read_order_page(response, order_number, skip)
         except Exception as e:
-            print(f"Error with filtered search: {e}")
+            print(f"Error searching at skip={skip}: {e}")
+            return 'miss', None
+    
+    def order_page_url(self, skip):
+        """URL of one page of recent orders"""
+        return (
+            f"{self.base_url}/sales-orders"
+            f"?count=100&include=lines,customer&skip={skip}"
+        )
+    
+    def read_order_page(self, response, order_number, skip):
+        """
+        Look for an order in one page of the pagination fallback
         
-        # Fallback: Search through recent orders if filter doesn't work
-        print(f"Filter search didn't find order/quote, trying pagination...")
-        for skip in range(0, 1000, 100):
-            url = (
-                f"{self.base_url}/sales-orders"
-                f"?count=100&include=lines,customer&skip={skip}"
-            )
+        Returns:
+            tuple: (status, order) where status is 'found', 'miss' or 'end'
+        """
+        if response.status_code != 200:
+            print(f"Search failed at skip={skip}, status={response.status_code}")
+            return 'end', None
+        
+        orders = response.json()
+        if isinstance(orders, list):
+            if len(orders) == 0:
+                print(f"No more orders at skip={skip}")
+                return 'end', None
             
-            try:
-                response = self.fetch_with_retries(url, timeout=60, max_attempts=5)
-                
-                if response.status_code == 200:
-                    orders = response.json()
-                    if isinstance(orders, list):
-                        if len(orders) == 0:
-                            print(f"No more orders at skip={skip}")
-                            break
-                        
-                        for order in orders:
-                            if order.get('orderNumber', '').upper() == order_number.upper():
-                                is_quote = order.get('isQuote', False)
-                                doc_type = 'quote' if is_quote else 'sales order'
-                                print(f"Found {doc_type} {order_number} at skip={skip}")
-                                return pd.json_normalize([order])
-                else:
-                    print(f"Search failed at skip={skip}, status={response.status_code}")
-                    break
-                    
-            except Exception as e:
-                print(f"Error searching at skip={skip}: {e}")
-                continue
+            self.remember_orders(orders)
+            for order in orders:
+                if order.get('orderNumber', '').upper() == order_number.upper():
+                    is_quote = order.get('isQuote', False)
+                    doc_type = 'quote' if is_quote else 'sales order'
+                    print(f"Found {doc_type} {order_number} at skip={skip}")
+                    return 'found', order
+        return 'miss', None
+    
+    def find_indexed_order(self, order_number):
+        """
+        Fetch an order through the local order index
         
-        print(f"Order/quote {order_number} not found after exhaustive search")
-        return pd.DataFrame()
+        Returns:
+            dict: The order, or None if it is not indexed or the indexed ID
+            no longer matches
+        """
+        sales_order_id = self.order_index.lookup(order_number)
+        if not sales_order_id:
+            return None
+        
+        try:
+            order = self.fetch_single_order_from_api(sales_order_id)
+        except Exception as e:
+            print(f"Indexed order {order_number} could not be fetched: {e}")
+            order = None
+        
+        return self.check_indexed_order(order, order_number)
+    
+    def check_indexed_order(self, order, order_number):
+        """Return an order fetched through the index, or drop the stale entry and return None"""
+        if isinstance(order, dict) and str(order.get('orderNumber', '')).upper() == order_number.upper():
+            print(f"Found {order_number} via order index")
+            return order
+        
+        # Stale entry (deleted or renumbered order); fall back to searching
+        self.order_index.remove(order_number)
+        return None
+    
+    def remember_orders(self, orders):
+        """Add orders seen while searching to the order index (if configured)"""
+        if self.order_index is None:
+            return
+        try:
+            self.order_index.record_orders(orders)
+        except Exception as e:
+            print(f"Could not update order index: {e}")
     
     def get_product_details(self, product_id):
         """
         Get product details by product ID
         Ported from development/main.py lines 473-484
-        """
-        url = f"{self.base_url}/products/{product_id}?include=category"
-        response = requests.get(url, headers=self.headers)
         
-        if response.status_code != 200:
-            # Retry on rate limit
-            attempts = 0
-            while response.status_code == 429 and attempts < 5:
-                time.sleep(40)
-                response = requests.get(url, headers=self.headers)
-                attempts += 1
-                if response.status_code == 200:
-                    break
+        Results are served from product_cache when available.
+        
+        Returns:
+            dict: The inFlow product
+        """
+        json_data = self.cached_product(product_id)
+        if json_data is not None:
+            return json_data
         
+        url = f"{self.base_url}/products/{product_id}?include=category"
+        # Retry rate limits and timeouts, but fail fast on other errors (e.g. 404)
+        response = self.fetch_with_retries(url, timeout=None, max_attempts=6, retry_errors=False)
+        return self.read_product(response, product_id)
+    
+    def cached_product(self, product_id):
+        """Product details from product_cache, or None"""
+        if self.product_cache is None:
+            return None
+        return self.product_cache.get(f"{self.company_id}:{product_id}")
+    
+    def read_product(self, response, product_id):
+        """Product details from a product response, cached on success"""
         if response.status_code == 200:
             json_data = response.json()
-            return pd.json_normalize([json_data])
+            if self.product_cache is not None:
+                self.product_cache.set(f"{self.company_id}:{product_id}", json_data)
+            return json_data
         else:
             raise Exception(f"Failed to fetch product {product_id}")
     
-    def process_order_products(self, order_df):
+    def fetch_product_details(self, product_ids, max_workers=PRODUCT_FETCH_WORKERS):
         """
-        Process order to extract product list with quantities
-        Ported from development/main.py lines 466-498
+        Fetch details for many products concurrently
+        
+        Duplicate IDs are fetched once. Products that fail to fetch are
+        logged and skipped.
         
+        Args:
+            product_ids: Iterable of inFlow product IDs
+            max_workers: Maximum concurrent fetches (1 = sequential)
+            
         Returns:
-            DataFrame with columns: productId, name, quantity
+            list: One product dict per fetched product, in first-seen order
         """
-        # Expand lines to get detailed product list
-        df_product_uuid = order_df.explode('lines')
-        df_product_uuid = pd.json_normalize(df_product_uuid['lines'])
-        df_product_uuid['quantity'] = pd.to_numeric(
-            df_product_uuid['quantity.standardQuantity'], errors='coerce'
-        )
+        unique_ids = list(dict.fromkeys(product_ids))
+        if not unique_ids:
+            return []
         
-        # Get product SKUs
-        df_product_sku = pd.DataFrame()
-        for product_id in df_product_uuid['productId']:
+        def fetch(product_id):
             try:
-                product_details = self.get_product_details(product_id)
-                df_product_sku = pd.concat([df_product_sku, product_details], ignore_index=True)
+                return self.get_product_details(product_id)
             except Exception as e:
                 print(f"Error fetching product {product_id}: {e}")
+                return None
         
-        # Merge product SKU and quantities
-        df_product_sku = df_product_sku[['productId', 'name']]
-        df_product_uuid['quantity'] = pd.to_numeric(df_product_uuid['quantity'], errors='coerce')
-        df_product_uuid = df_product_uuid[['productId', 'quantity']].groupby('productId', as_index=False).agg({
-            'quantity': 'sum',
-        })
+        workers = max(1, min(max_workers, len(unique_ids)))
+        if workers == 1:
+            results = [fetch(product_id) for product_id in unique_ids]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(timing.bind(fetch), unique_ids))
         
-        selected_sales_order = pd.merge(df_product_uuid, df_product_sku, on="productId", how="inner")
-        selected_sales_order = selected_sales_order[['name', 'quantity']]
+        return [details for details in results if details is not None]
+    
+    def process_order_products(self, order):
+        """
+        Process order to extract product list with quantities
+        Ported from development/main.py lines 466-498
+        
+        Args:
+            order: inFlow sales order dict (with lines)
+            
+        Returns:
+            list: OrderLine (name, quantity) per product, ordered by productId
+        """
+        quantities = order_quantities(order)
+        
+        # Get product SKUs (each product fetched once, in parallel)
+        product_details = self.fetch_product_details(quantities)
+        return build_order_lines(quantities, product_details)
+
+
+def order_quantities(order):
+    """
+    Collect quantities per product from an order's lines
+    
+    Returns:
+        dict: productId -> list of line quantities (NaN when invalid)
+    """
+    quantities = {}
+    for line in order.get('lines') or []:
+        if not isinstance(line, dict) or line.get('productId') is None:
+            continue
+        quantity = line.get('quantity')
+        standard_quantity = quantity.get('standardQuantity') if isinstance(quantity, dict) else None
+        quantities.setdefault(line['productId'], []).append(to_number(standard_quantity))
+    return quantities
+
+
+def build_order_lines(quantities, product_details):
+    """
+    Merge product SKUs and summed quantities into order lines
+    
+    Args:
+        quantities: Output of order_quantities
+        product_details: Product dicts (products that failed to fetch are dropped)
+        
+    Returns:
+        list: OrderLine (name, quantity) per product, ordered by productId
+    """
+    names = {details.get('productId'): details.get('name') for details in product_details}
+    
+    selected_sales_order = []
+    for product_id in sorted(quantities):
+        if product_id not in names:
+            continue
+        name = names[product_id]
+        quantity = group_sum(quantities[product_id])
         
         # Filter out test products (starting with 'z' or 'Z')
-        selected_sales_order = selected_sales_order[
-            ~selected_sales_order['name'].str.startswith(('z', 'Z'), na=False)
-        ]
+        if isinstance(name, str) and name.startswith(('z', 'Z')):
+            continue
         
         # Filter out zero quantity items
-        selected_sales_order = selected_sales_order[~(selected_sales_order['quantity'] == 0)]
+        if quantity == 0:
+            continue
         
-        return selected_sales_order
-
+        selected_sales_order.append(OrderLine(name, quantity))
+    
+    return selected_sales_order
@@ -0,0 +1,205 @@
+"""
+Local Order Index
+SQLite map of inFlow order/quote numbers to salesOrderId
+
+search_todays_orders looks numbers up here first and fetches the order by
+ID in a single call. The index is filled as orders are found and kept
+current by an incremental sync that walks orders newest-modified first and
+stops at the last sync's watermark.
+
+Run a sync manually (uses INFLOW_COMPANY_ID / INFLOW_API_KEY / ORDER_INDEX_DB):
+    python -m lib.order_index
+"""
+
+import os
+import sys
+import threading
+import time
+
+
+# Field used to walk orders newest-modified first
+MODIFIED_FIELD = 'lastModifiedDateTime'
+
+# Orders fetched per sync page, and the page limit for one sync run
+SYNC_PAGE_SIZE = 100
+SYNC_MAX_PAGES = int(os.environ.get('ORDER_INDEX_SYNC_MAX_PAGES', 50))
+
+
+class OrderIndex:
+    """Order number -> salesOrderId index stored in SQLite"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS orders ('
+            'order_number TEXT PRIMARY KEY, sales_order_id TEXT NOT NULL, modified TEXT)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)')
+
+    def _connection(self):
+        """One SQLite connection per thread"""
+        # Imported here so importing this module stays cheap when no index is configured
+        import sqlite3
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, order_number):
+        """
+        Look up an order number (case-insensitive)
+
+        Returns:
+            str: salesOrderId, or None if the number is not indexed
+        """
+        row = self._connection().execute(
+            'SELECT sales_order_id FROM orders WHERE order_number = ?',
+            (order_number.strip().upper(),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def record_orders(self, orders):
+        """
+        Add or update orders in the index
+
+        Args:
+            orders: Iterable of inFlow sales order dicts
+        """
+        rows = [
+            (order['orderNumber'].strip().upper(), order['salesOrderId'], order.get(MODIFIED_FIELD))
+            for order in orders
+            if order.get('orderNumber') and order.get('salesOrderId')
+        ]
+        if rows:
+            self._connection().executemany(
+                'INSERT OR REPLACE INTO orders (order_number, sales_order_id, modified) VALUES (?, ?, ?)',
+                rows
+            )
+
+    def remove(self, order_number):
+        """Drop an order number (e.g. when its order was deleted)"""
+        self._connection().execute(
+            'DELETE FROM orders WHERE order_number = ?', (order_number.strip().upper(),)
+        )
+
+    def get_state(self, key):
+        row = self._connection().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key, value):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value)
+        )
+
+    def sync(self, inflow_api, max_pages=SYNC_MAX_PAGES):
+        """
+        Pull orders modified since the last sync into the index
+
+        The watermark only moves when the walk reaches the previous one (or
+        the last order): a run cut short by max_pages keeps the old
+        watermark, so the next run covers the orders it did not get to.
+        The first sync has no watermark and starts it from the newest
+        order; older orders are indexed as search_todays_orders finds them.
+
+        Args:
+            inflow_api: InflowAPI instance
+            max_pages: Page limit for this run (the first sync stops here)
+
+        Returns:
+            int: Number of orders recorded
+        """
+        with self._sync_lock:
+            watermark = self.get_state('watermark')
+            newest = None
+            recorded = 0
+            complete = False
+
+            for page in range(max_pages):
+                url = (
+                    f"{inflow_api.base_url}/sales-orders"
+                    f"?count={SYNC_PAGE_SIZE}&skip={page * SYNC_PAGE_SIZE}"
+                    f"&sort={MODIFIED_FIELD}&sortDesc=true"
+                )
+                orders = inflow_api.fetch_with_retries(url, timeout=60, max_attempts=5).json()
+                if not isinstance(orders, list) or not orders:
+                    complete = True
+                    break
+
+                if newest is None:
+                    newest = orders[0].get(MODIFIED_FIELD)
+
+                # Orders at or before the watermark were recorded by the previous sync
+                fresh = [
+                    order for order in orders
+                    if not watermark or not order.get(MODIFIED_FIELD) or order[MODIFIED_FIELD] > watermark
+                ]
+                self.record_orders(fresh)
+                recorded += len(fresh)
+                if len(fresh) < len(orders) or len(orders) < SYNC_PAGE_SIZE:
+                    complete = True
+                    break
+
+            if not complete and watermark:
+                print(f"Order index sync stopped after {max_pages} pages before reaching the watermark; "
+                      f"keeping it at {watermark}")
+            elif newest and (not watermark or newest > watermark):
+                self.set_state('watermark', newest)
+            self.set_state('last_sync', str(time.time()))
+
+        print(f"Order index sync recorded {recorded} orders")
+        return recorded
+
+
+def start_background_sync(order_index, inflow_api_factory, interval):
+    """
+    Sync the index every `interval` seconds on a daemon thread
+
+    When several workers share one index file, a worker skips its turn if
+    another synced within the interval.
+
+    Args:
+        order_index: OrderIndex instance
+        inflow_api_factory: Callable returning an InflowAPI (or None if not configured)
+        interval: Seconds between syncs
+
+    Returns:
+        threading.Thread
+    """
+    def run():
+        while True:
+            try:
+                last_sync = float(order_index.get_state('last_sync') or 0)
+                inflow_api = inflow_api_factory()
+                if inflow_api is not None and time.time() - last_sync >= interval:
+                    order_index.sync(inflow_api)
+            except Exception as e:
+                print(f"Order index sync failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='order-index-sync', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    """Run one incremental sync using credentials from the environment"""
+    from .inflow_api import InflowAPI
+
+    db_path = os.environ.get('ORDER_INDEX_DB')
+    company_id = os.environ.get('INFLOW_COMPANY_ID')
+    api_key = os.environ.get('INFLOW_API_KEY')
+    if not all([db_path, company_id, api_key]):
+        print("ORDER_INDEX_DB, INFLOW_COMPANY_ID and INFLOW_API_KEY must be set")
+        sys.exit(1)
+
+    OrderIndex(db_path).sync(InflowAPI(company_id, api_key))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+"""
+Pallet Packing
+Builds pallets from the actual cartons of an order
+
+calculate_pallets treats an order as a volume poured onto the pallet
+footprint. pack_pallets places each unit's carton (Length, Width, Height
+per unit from the dimension sheet) instead, in layers: cartons are taken
+in size order, each layer is filled in shelves across the footprint and
+shorter cartons are stacked on the ones below them up to the layer
+height. For every layer, shelves along either side, cartons upright or
+lying on either side (ROTATIONS) and the few tallest layer heights are
+tried, and the layer holding the most carton volume per inch of height is
+kept. Layers are stacked until PALLET_PACKING_HEIGHT_LIMIT or
+PALLET_WEIGHT_LIMIT would be exceeded. Each of PACKING_ORDERS is tried and
+the packing with the fewest (then lowest) pallets is kept.
+
+As in calculate_pallets, Index 100 cartons go on long pallets; the other
+cartons share their layers and top up the last long pallet before
+standard pallets are started. Cartons too long for a standard pallet go
+on long pallets too.
+
+Packing gives up after PALLET_PACKING_TIME_BUDGET_MS (or on cartons it
+cannot place) and returns None; the caller then uses the volume
+calculation, so quote latency stays bounded.
+"""
+
+import math
+import os
+import time
+
+from .order_lines import KG_TO_LB, is_missing
+from .pallet_calculator import (LONG_PALLET_LENGTH, LONG_PALLET_WIDTH, PALLET_HEIGHT_LIMIT, PALLET_WEIGHT_LIMIT,
+                                STANDARD_PALLET_LENGTH, STANDARD_PALLET_WIDTH)
+
+# "volume" (calculate_pallets), "cartons" (pack_pallets) or "cheapest"
+# (pallet_search); requests can override it
+PACKING_MODES = ('volume', 'cartons', 'cheapest')
+PALLET_PACKING = os.environ.get('PALLET_PACKING', 'volume').lower()
+
+# Time allowed for packing one order before falling back to the volume calculation
+PALLET_PACKING_TIME_BUDGET_MS = float(os.environ.get('PALLET_PACKING_TIME_BUDGET_MS', 50))
+
+# Orders with more units than this are not packed
+PALLET_PACKING_MAX_CARTONS = int(os.environ.get('PALLET_PACKING_MAX_CARTONS', 2000))
+
+# Orders cartons are packed in: tallest first, largest footprint first
+PACKING_ORDERS = (
+    lambda group: (group[2], group[0] * group[1]),
+    lambda group: (group[0] * group[1], group[2])
+)
+
+# Ways a layer's cartons are turned: upright (as grouped) or lying on
+# either side (indexes into the group's length, width, height)
+ROTATIONS = ((0, 1, 2), (0, 2, 1), (1, 2, 0))
+
+# Layer heights tried for each layer (the tallest cartons that still fit)
+PACKING_LAYER_HEIGHTS = 3
+
+# Stacked height allowed on a packed pallet (inches, pallet deck excluded)
+PALLET_PACKING_HEIGHT_LIMIT = float(os.environ.get('PALLET_PACKING_HEIGHT_LIMIT', PALLET_HEIGHT_LIMIT))
+
+# Inches a carton may extend past the pallet edges (8 ft moldings are 96.85 in)
+PALLET_PACKING_OVERHANG = float(os.environ.get('PALLET_PACKING_OVERHANG', 2))
+
+
+class PackingError(Exception):
+    """The order cannot be packed carton by carton"""
+    pass
+
+
+def pack_pallets(selected_sales_order, time_budget_ms=None):
+    """
+    Pack an order's cartons onto pallets
+
+    Args:
+        selected_sales_order: List of OrderLine with dimensions
+        time_budget_ms: Milliseconds allowed (defaults to PALLET_PACKING_TIME_BUDGET_MS)
+
+    Returns:
+        list: Pallet dictionaries with Type, Height, Weight (as from
+            adjust_low_height_pallets), or None if the order could not be
+            packed within the budget
+    """
+    if time_budget_ms is None:
+        time_budget_ms = PALLET_PACKING_TIME_BUDGET_MS
+    deadline = time.perf_counter() + time_budget_ms / 1000
+
+    best = None
+    try:
+        long_groups, standard_groups = carton_groups(selected_sales_order)
+        for sort_key in PACKING_ORDERS:
+            try:
+                pallets = pack_groups(sorted(long_groups, key=sort_key, reverse=True),
+                                      sorted(standard_groups, key=sort_key, reverse=True), deadline)
+            except PackingError:
+                # Out of time: keep the best packing found so far
+                if best is None:
+                    raise
+                break
+            if best is None or pallet_cost(pallets) < pallet_cost(best):
+                best = pallets
+
+    except PackingError as e:
+        print(f"Carton packing skipped, using volume calculation: {e}")
+        return None
+
+    return best
+
+
+def pack_groups(long_groups, standard_groups, deadline):
+    """
+    Pack carton groups (in the order given) onto pallets
+
+    Returns:
+        list: Pallet dictionaries with Type, Height, Weight
+
+    Raises:
+        PackingError: If a carton does not fit an empty pallet or time runs out
+    """
+    long_groups = [list(group) for group in long_groups]
+    standard_groups = [list(group) for group in standard_groups]
+
+    pallets = []
+    # Other cartons share the layers of the long pallets, and top up the last one
+    stack_pallets(pallets, long_groups + standard_groups, 'Long', deadline, required=long_groups)
+    stack_pallets(pallets, [group for group in standard_groups if group[4]], 'Standard', deadline)
+    return pallets
+
+
+def pallet_cost(pallets):
+    """Sort key for packings: fewest pallets, then least total height"""
+    return len(pallets), sum(pallet['Height'] for pallet in pallets)
+
+
+def carton_groups(selected_sales_order):
+    """
+    Cartons of an order, grouped by size
+
+    Returns:
+        tuple: (long pallet groups, standard pallet groups), each a list of
+            [length, width, height, weight, count]
+
+    Raises:
+        PackingError: If a carton has no usable dimensions, fits no pallet,
+            or the order has more than PALLET_PACKING_MAX_CARTONS units
+    """
+    groups = {}
+    total_units = 0
+    for line in selected_sales_order:
+        units = math.ceil(line.quantity) if line.quantity > 0 else 0
+        if not units:
+            continue
+        total_units += units
+        if total_units > PALLET_PACKING_MAX_CARTONS:
+            raise PackingError(f'more than {PALLET_PACKING_MAX_CARTONS} cartons')
+
+        dimensions = (line.length, line.width, line.height)
+        if any(is_missing(value) or value <= 0 for value in dimensions) or is_missing(line.weight_kg):
+            raise PackingError(f'incomplete dimensions for {line.name}')
+
+        length, width, height = orient_carton(*dimensions)
+        is_long = line.index == 100 or not fits_footprint(length, width, STANDARD_PALLET_LENGTH,
+                                                           STANDARD_PALLET_WIDTH)
+        key = (is_long, length, width, height, line.weight_kg * KG_TO_LB)
+        groups[key] = groups.get(key, 0) + units
+
+    long_groups = []
+    standard_groups = []
+    for (is_long, length, width, height, weight), count in groups.items():
+        (long_groups if is_long else standard_groups).append([length, width, height, weight, count])
+    return long_groups, standard_groups
+
+
+def orient_carton(length, width, height):
+    """
+    Upright orientation of a carton, or the lowest one that fits a long pallet
+
+    Returns:
+        tuple: (length, width, height)
+
+    Raises:
+        PackingError: If the carton fits no pallet in any orientation
+    """
+    orientations = [(length, width, height)] + sorted(
+        [(length, height, width), (width, height, length)], key=lambda dims: dims[2])
+    for oriented in orientations:
+        if oriented[2] <= PALLET_PACKING_HEIGHT_LIMIT and fits_footprint(oriented[0], oriented[1], LONG_PALLET_LENGTH,
+                                                                 LONG_PALLET_WIDTH):
+            return oriented
+    raise PackingError(f'a {length} x {width} x {height} carton fits no pallet')
+
+
+def fits_footprint(length, width, footprint_length, footprint_width, overhang=None):
+    """True if a carton fits the footprint (plus overhang), turned either way"""
+    if overhang is None:
+        overhang = PALLET_PACKING_OVERHANG
+    footprint_length += overhang
+    footprint_width += overhang
+    return ((length <= footprint_length and width <= footprint_width)
+            or (width <= footprint_length and length <= footprint_width))
+
+
+def stack_pallets(pallets, groups, pallet_type, deadline, required=None):
+    """
+    Start new pallets of one type until every carton in required (defaults
+    to groups) is placed
+
+    Raises:
+        PackingError: If a carton does not fit an empty pallet or time runs out
+    """
+    if pallet_type == 'Long':
+        footprint = (LONG_PALLET_LENGTH, LONG_PALLET_WIDTH)
+    else:
+        footprint = (STANDARD_PALLET_LENGTH, STANDARD_PALLET_WIDTH)
+
+    if required is None:
+        required = groups
+    while any(group[4] for group in required):
+        pallet = {'Type': pallet_type, 'Height': 0, 'Weight': 0}
+        fill_pallet(pallet, groups, footprint[0], footprint[1], deadline)
+        if pallet['Height'] == 0:
+            raise PackingError('a carton is too heavy for one pallet')
+        pallets.append(pallet)
+
+
+def fill_pallet(pallet, groups, footprint_length, footprint_width, deadline):
+    """
+    Stack layers onto a pallet until no remaining carton fits on top
+
+    Each layer is built with shelves along either side of the footprint,
+    with cartons upright or lying down, and the densest of these (most
+    carton volume per inch of height) is kept. Placed cartons are taken out
+    of groups.
+    """
+    while groups:
+        if time.perf_counter() > deadline:
+            raise PackingError('time budget exceeded')
+        max_height = PALLET_PACKING_HEIGHT_LIMIT - pallet['Height']
+        best = None
+        for rotation in ROTATIONS:
+            for layer_height in layer_heights(groups, footprint_length, footprint_width, max_height, rotation):
+                for length, width in ((footprint_length, footprint_width), (footprint_width, footprint_length)):
+                    layer = build_layer(groups, length, width, layer_height, PALLET_WEIGHT_LIMIT - pallet['Weight'],
+                                        rotation)
+                    if layer[0] and (best is None or layer_density(layer) > layer_density(best)):
+                        best = layer
+        if best is None:
+            return
+        layer_height, layer_weight, _, placed = best
+        pallet['Height'] += layer_height
+        pallet['Weight'] += layer_weight
+        for group, count in zip(groups, placed):
+            group[4] -= count
+        groups[:] = [group for group in groups if group[4]]
+
+
+def layer_heights(groups, footprint_length, footprint_width, max_height, rotation):
+    """The PACKING_LAYER_HEIGHTS tallest carton heights (as rotated) under max_height"""
+    heights = set()
+    for group in groups:
+        oriented = rotate_carton(group, rotation, footprint_length, footprint_width)
+        if oriented is not None and oriented[2] <= max_height:
+            heights.add(oriented[2])
+    return sorted(heights, reverse=True)[:PACKING_LAYER_HEIGHTS]
+
+
+def layer_density(layer):
+    """Sort key for layers: carton volume per inch of height, then volume"""
+    layer_height, _, layer_volume, _ = layer
+    return layer_volume / layer_height, layer_volume
+
+
+def rotate_carton(group, rotation, footprint_length, footprint_width):
+    """
+    A group's carton turned by rotation (see ROTATIONS)
+
+    Returns:
+        tuple: (length, width, height), or None if the footprint does not fit
+    """
+    oriented = (group[rotation[0]], group[rotation[1]], group[rotation[2]])
+    if not fits_footprint(oriented[0], oriented[1], footprint_length, footprint_width):
+        return None
+    return oriented
+
+
+def build_layer(groups, footprint_length, footprint_width, max_height, max_weight, rotation=ROTATIONS[0]):
+    """
+    Fill one layer of the footprint from groups, in order
+
+    Cartons up to max_height tall are placed. A carton goes on top of one
+    already placed when its footprint fits and the stack stays under
+    max_height, otherwise on the floor: in
+    shelves running along the footprint length. A new shelf is as deep as
+    the orientation of its first carton that fills the shelf best with the
+    cartons of that size still to place. Every carton is turned by
+    rotation; cartons whose footprint then does not fit are skipped.
+
+    groups are not changed.
+
+    Returns:
+        tuple: (layer height (the tallest stack), layer weight, layer volume,
+            cartons placed per group); height 0 if nothing fits
+    """
+    layer_height = 0
+    layer_weight = 0
+    layer_volume = 0
+    placed_counts = [0] * len(groups)
+    stacks = []  # [length, width, height] of each carton on the floor and what is on it
+    shelves = []  # [used length, depth]
+    used_depth = 0
+
+    for index, group in enumerate(groups):
+        weight, count = group[3:]
+        oriented = rotate_carton(group, rotation, footprint_length, footprint_width)
+        if oriented is None:
+            continue
+        length, width, height = oriented
+        if height > max_height:
+            continue
+
+        # Stacks and shelves only fill up, so one that cannot take this size
+        # of carton never will: each search resumes where the last one failed
+        first_stack = first_shelf = 0
+        while placed_counts[index] < count and layer_weight + weight <= max_weight:
+            placed = False
+            while first_stack < len(stacks):
+                stack = stacks[first_stack]
+                if stack[2] + height <= max_height and fits_footprint(length, width, stack[0], stack[1], 0):
+                    stack[2] += height
+                    layer_height = max(layer_height, stack[2])
+                    placed = True
+                    break
+                first_stack += 1
+
+            while not placed and first_shelf < len(shelves):
+                shelf = shelves[first_shelf]
+                # Turn the carton to use the least shelf length
+                fits = [along for along, across in ((length, width), (width, length))
+                        if shelf[0] + along <= footprint_length + PALLET_PACKING_OVERHANG and across <= shelf[1]]
+                if fits:
+                    shelf[0] += min(fits)
+                    stacks.append([length, width, height])
+                    layer_height = max(layer_height, height)
+                    placed = True
+                else:
+                    first_shelf += 1
+
+            if not placed:
+                depth = shelf_depth(length, width, count - placed_counts[index], footprint_length,
+                                    footprint_width - used_depth)
+                if depth is None:
+                    break
+                along = min(along for along, across in ((length, width), (width, length)) if across <= depth)
+                shelves.append([along, depth])
+                stacks.append([length, width, height])
+                layer_height = max(layer_height, height)
+                used_depth += depth
+
+            layer_weight += weight
+            layer_volume += length * width * height
+            placed_counts[index] += 1
+
+    return layer_height, layer_weight, layer_volume, placed_counts
+
+
+def shelf_depth(length, width, count, footprint_length, footprint_width):
+    """
+    Depth for a new shelf of count cartons, or None if none fits
+
+    Each orientation's depth is tried and the one covering the largest
+    share of its shelf (length x depth) is kept, the shallower on a tie.
+    """
+    footprint_length += PALLET_PACKING_OVERHANG
+    footprint_width += PALLET_PACKING_OVERHANG
+    best = None
+    for depth in sorted({length, width}):
+        if depth > footprint_width:
+            continue
+        # Cartons fill the shelf turned whichever way uses the least length
+        along = min(side for side, across in ((length, width), (width, length)) if across <= depth)
+        if along > footprint_length:
+            continue
+        shelf_count = min(count, int(footprint_length // along))
+        coverage = shelf_count * length * width / (footprint_length * depth)
+        if best is None or coverage > best[0]:
+            best = (coverage, depth)
+    return best[1] if best else None
@@ -0,0 +1,199 @@
+"""
+Pallet Search
+Cost-aware search over pallet configurations
+
+calculate_pallets gives one configuration, but the C.H. Robinson price
+depends on how many pallets ship and on each pallet's freight class. This
+module enumerates other configurations of the same order - how many long
+and standard pallets, how much Index 0 volume goes on the long ones, and
+whether heights are split evenly or pallets are filled to the limit - and
+ranks them with a local cost model:
+
+    cost = sum(billed pallet weight / 100 * freight class / 100)
+
+(hundredweight at a rate proportional to class, a proxy for LTL class
+rates). Pallet weights follow the volume, as in the final redistribution
+of calculate_pallets, and Index 100 volume stays on long pallets.
+
+Costs per pallet type are memoized within a search (configurations share
+them) and configurations whose lower bound cannot beat the cheapest found
+so far are skipped, so a typical order is searched in about a millisecond.
+"""
+
+import heapq
+import math
+import os
+
+from .freight import FREIGHT_CLASS_MAP, build_freight_items
+from .order_lines import column_sum
+from .pallet_calculator import (LONG_PALLET_BASE_AREA, PALLET_HEIGHT_LIMIT, PALLET_WEIGHT_LIMIT,
+                                STANDARD_PALLET_BASE_AREA)
+
+# Pallets tried beyond the fewest that hold the order, per pallet type
+PALLET_SEARCH_EXTRA_PALLETS = int(os.environ.get('PALLET_SEARCH_EXTRA_PALLETS', 2))
+
+# Orders needing more pallets than this are not searched
+PALLET_SEARCH_MAX_PALLETS = int(os.environ.get('PALLET_SEARCH_MAX_PALLETS', 30))
+
+# Configurations returned by search_pallets
+PALLET_SEARCH_RESULTS = int(os.environ.get('PALLET_SEARCH_RESULTS', 3))
+
+BASE_AREAS = {'Long': LONG_PALLET_BASE_AREA, 'Standard': STANDARD_PALLET_BASE_AREA}
+
+# Pallet weight and height added by build_freight_items
+PALLET_TARE = {'Long': 100, 'Standard': 50}
+PALLET_DECK_HEIGHT = 5
+
+LOWEST_FREIGHT_CLASS = min(freight_class for _, freight_class in FREIGHT_CLASS_MAP)
+
+
+def freight_cost(freight_items):
+    """Estimated relative cost of freight items (see the module docstring)"""
+    return sum(item['Weight'] / 100 * item['FreightClass'] / 100 for item in freight_items)
+
+
+def search_pallets(selected_sales_order, pallets, total_volume, total_weight, limit=None):
+    """
+    Cheapest pallet configurations for an order
+
+    Args:
+        selected_sales_order: List of OrderLine with dimensions
+        pallets: The order's pallets from adjust_low_height_pallets (always a candidate)
+        total_volume: Total order volume (cubic inches)
+        total_weight: Total order weight (lbs)
+        limit: Configurations to return (defaults to PALLET_SEARCH_RESULTS)
+
+    Returns:
+        list: Up to limit dicts with label, cost, pallets (Type, Height,
+            Weight) and freightItems, cheapest first
+    """
+    if limit is None:
+        limit = PALLET_SEARCH_RESULTS
+
+    search = PalletSearch(total_volume, total_weight,
+                          column_sum([line.volume for line in selected_sales_order if line.index == 100]))
+    freight_items = build_freight_items(pallets)
+    search.add('calculate_pallets', freight_cost(freight_items), pallets, freight_items, limit)
+    if total_volume > 0 and total_weight > 0:
+        search.run(limit)
+    return search.results()
+
+
+class PalletSearch:
+    """Branch-and-bound search over pallet counts, volume splits and height splits"""
+
+    def __init__(self, total_volume, total_weight, index_100_volume):
+        self.total_volume = total_volume
+        self.total_weight = total_weight
+        self.index_100_volume = index_100_volume
+        self.density = total_weight / total_volume if total_volume > 0 else 0
+
+        # Tallest pallet of each type within the height and weight limits
+        self.capacity = {}
+        for pallet_type, base_area in BASE_AREAS.items():
+            height = PALLET_HEIGHT_LIMIT
+            if self.density > 0:
+                height = min(height, PALLET_WEIGHT_LIMIT / (self.density * base_area))
+            self.capacity[pallet_type] = height * base_area
+
+        self.candidates = []  # heap of (-cost, -order, label, pallets, freight items)
+        self.labels = set()
+        self.memo = {}
+        self.evaluated = 0
+
+    def add(self, label, cost, pallets, freight_items, limit):
+        if label in self.labels:
+            return
+        self.labels.add(label)
+        entry = (-cost, -len(self.labels), label, pallets, freight_items)
+        if len(self.candidates) < limit:
+            heapq.heappush(self.candidates, entry)
+        elif entry > self.candidates[0]:
+            heapq.heapreplace(self.candidates, entry)
+
+    def results(self):
+        return [{'label': label, 'cost': -cost, 'pallets': pallets, 'freightItems': freight_items}
+                for cost, _, label, pallets, freight_items in sorted(self.candidates, reverse=True)]
+
+    def run(self, limit):
+        """Evaluate every configuration that could enter the cheapest limit"""
+        min_long = math.ceil(self.index_100_volume / self.capacity['Long'])
+        all_long = math.ceil(self.total_volume / self.capacity['Long'])
+        if min(all_long, min_long + math.ceil(self.total_volume / self.capacity['Standard'])) > PALLET_SEARCH_MAX_PALLETS:
+            return
+
+        for n_long in range(min_long, all_long + PALLET_SEARCH_EXTRA_PALLETS + 1):
+            long_volume = min(self.total_volume, n_long * self.capacity['Long'])
+            min_standard = math.ceil((self.total_volume - long_volume) / self.capacity['Standard'])
+            for n_standard in range(min_standard, min_standard + PALLET_SEARCH_EXTRA_PALLETS + 1):
+                if n_long + n_standard > PALLET_SEARCH_MAX_PALLETS:
+                    break
+                # The bound grows with the pallet count, so more standard pallets cannot do better
+                if len(self.candidates) == limit and self.lower_bound(n_long, n_standard) >= -self.candidates[0][0]:
+                    break
+                for long_volume in self.long_volumes(n_long, n_standard):
+                    self.evaluate(n_long, n_standard, long_volume, limit)
+
+    def lower_bound(self, n_long, n_standard):
+        """Cost if every pallet got the lowest freight class (billed weights are rounded)"""
+        weight = (self.total_weight + n_long * (PALLET_TARE['Long'] - 0.5)
+                  + n_standard * (PALLET_TARE['Standard'] - 0.5))
+        return weight / 100 * LOWEST_FREIGHT_CLASS / 100
+
+    def long_volumes(self, n_long, n_standard):
+        """Volumes to put on the long pallets: Index 100 only, or filled first"""
+        if n_standard == 0:
+            return [self.total_volume]
+        if n_long == 0:
+            return [0] if self.index_100_volume == 0 else []
+        return sorted({self.index_100_volume, min(self.total_volume, n_long * self.capacity['Long'])})
+
+    def evaluate(self, n_long, n_standard, long_volume, limit):
+        parts = [('Long', long_volume, n_long), ('Standard', self.total_volume - long_volume, n_standard)]
+        options = []
+        for pallet_type, volume, count in parts:
+            if count == 0:
+                if volume > 0:
+                    return
+                options.append([(0, '', [], [])])
+                continue
+            type_options = self.type_options(pallet_type, volume, count)
+            if not type_options:
+                return
+            options.append(type_options)
+
+        for long_option in options[0]:
+            for standard_option in options[1]:
+                self.evaluated += 1
+                label = ' + '.join(option[1] for option in (long_option, standard_option) if option[1])
+                self.add(label, long_option[0] + standard_option[0], long_option[2] + standard_option[2],
+                         long_option[3] + standard_option[3], limit)
+
+    def type_options(self, pallet_type, volume, count):
+        """
+        Pallets of one type holding volume, split evenly or filled to capacity
+
+        Returns:
+            list: (cost, label, pallets, freight items) per valid split
+        """
+        key = (pallet_type, volume, count)
+        if key in self.memo:
+            return self.memo[key]
+
+        base_area = BASE_AREAS[pallet_type]
+        capacity = self.capacity[pallet_type]
+        splits = []
+        if 0 < volume <= count * capacity * (1 + 1e-12):
+            splits.append(('even', [volume / count / base_area] * count))
+            remainder = volume - (count - 1) * capacity
+            if count > 1 and remainder > 0:
+                splits.append(('fill', [capacity / base_area] * (count - 1) + [remainder / base_area]))
+
+        options = []
+        for split, heights in splits:
+            pallets = [{'Type': pallet_type, 'Height': height, 'Weight': height * base_area * self.density}
+                       for height in heights]
+            freight_items = build_freight_items(pallets)
+            options.append((freight_cost(freight_items), f'{count} {pallet_type} ({split})', pallets, freight_items))
+        self.memo[key] = options
+        return options
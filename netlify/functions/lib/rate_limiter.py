@@ -0,0 +1,119 @@
+"""
+Client-side Rate Limiting
+Token bucket shared by every call to an upstream, plus retry backoff helpers
+"""
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Tokens refill at `rate` per second up to `burst`. Each request takes one
+    token and blocks until one is available. pause() holds back every caller,
+    so a 429 slows the whole process down instead of each thread hammering
+    the limit on its own.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate: Sustained requests per second
+            burst: Maximum requests allowed back to back
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            wait = self._take()
+            if wait is None:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire() for coroutines: waits on the event loop instead of blocking it"""
+        import asyncio
+
+        while True:
+            wait = self._take()
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+
+    def _take(self):
+        """Take a token if one is available; otherwise return the seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return None
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            # Resume with an empty bucket so callers restart at the sustained rate
+            self.tokens = 0.0
+            self.updated = self.blocked_until
+
+
+def parse_retry_after(value):
+    """
+    Parse a Retry-After header
+
+    Args:
+        value: Header value (delay in seconds or an HTTP date), may be None
+
+    Returns:
+        float: Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP dates are rare (most 429s send seconds); email is slow to import
+    from email.utils import parsedate_to_datetime
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0):
+    """
+    Exponential backoff with jitter
+
+    Returns a delay between half and all of min(cap, base * 2^(attempt-1)),
+    so retries from concurrent callers spread out instead of landing together.
+
+    Args:
+        attempt: 1-based attempt number that just failed
+        base: Delay after the first failure
+        cap: Maximum delay
+
+    Returns:
+        float: Seconds to wait
+    """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
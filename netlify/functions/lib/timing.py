@@ -0,0 +1,137 @@
+"""
+Quote Timing
+Lightweight timing spans for one quote request
+
+run_quote_pipeline opens a trace; each pipeline step and every outbound
+HTTP call records a span into it. When no trace is active, span() costs one
+context-variable lookup. Finished traces are logged as one JSON line and can
+be returned to the caller.
+
+Worker threads do not inherit the active trace. Wrap functions handed to a
+thread pool with bind() so their spans land in the request's trace.
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Log one JSON line per finished trace ("no" to disable)
+TIMING_LOG = os.environ.get('QUOTE_TIMING_LOG', 'yes').lower() != 'no'
+
+_current = contextvars.ContextVar('quote_trace', default=None)
+
+
+class Trace:
+    """Spans recorded for one request"""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.finished = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        """
+        Time a block of work
+
+        Yields a dict of fields; values added inside the block (e.g. an HTTP
+        status) are recorded with the span.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields.setdefault('error', type(e).__name__)
+            raise
+        finally:
+            self.record(name, start, time.perf_counter(), **fields)
+
+    def record(self, name, start, end, **fields):
+        """Add a span measured with time.perf_counter()"""
+        span = {
+            'name': name,
+            'startMs': round((start - self.started) * 1000, 2),
+            'durationMs': round((end - start) * 1000, 2)
+        }
+        span.update(fields)
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        if self.finished is None:
+            self.finished = time.perf_counter()
+
+    def to_dict(self):
+        """Timings block for a response: total and spans in start order"""
+        end = self.finished if self.finished is not None else time.perf_counter()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['startMs'])
+        return {
+            'totalMs': round((end - self.started) * 1000, 2),
+            'spans': spans
+        }
+
+    def log(self):
+        """Print the trace as one structured log line"""
+        line = {'event': 'quote_timing', 'trace': self.name}
+        line.update(self.fields)
+        line.update(self.to_dict())
+        print(json.dumps(line, default=str))
+
+
+@contextmanager
+def trace(name, **fields):
+    """
+    Make a new trace current for the duration of the block
+
+    Yields:
+        Trace
+    """
+    current = Trace(name, **fields)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        current.finish()
+        if TIMING_LOG:
+            current.log()
+
+
+def current_trace():
+    """The active Trace, or None"""
+    return _current.get()
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a block in the active trace (no-op without one)"""
+    current = _current.get()
+    if current is None:
+        yield fields
+        return
+    with current.span(name, **fields) as span_fields:
+        yield span_fields
+
+
+def bind(fn):
+    """Wrap fn so it records into the caller's trace when run on another thread"""
+    current = _current.get()
+    if current is None:
+        return fn
+
+    def run(*args, **kwargs):
+        token = _current.set(current)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+
+    return run
@@ -1,11 +1,22 @@
 """
 Netlify Serverless Function for Freight Quote Processing
 Main orchestration endpoint that combines all business logic
+
+Cold starts: module-level state (settings, API clients, dimension data, ZIP
+database, HTTP session) is created once per container and reused by warm
+invocations. With QUOTE_PRELOAD on (the default) it is created while the
+container initializes instead of inside the first request. Run
+`python -m lib.cold_start report` to measure the cost.
 """
 
+import time
+
+_import_started = time.perf_counter()
+
 import json
 import os
 import sys
+import threading
 from pathlib import Path
 
 # Add lib directory to path
@@ -14,12 +25,50 @@ lib_path = str(current_dir / 'lib')
 if lib_path not in sys.path:
     sys.path.insert(0, lib_path)
 
-from lib.inflow_api import InflowAPI
-from lib.product_dimensions import ProductDimensionsLoader
-from lib.pallet_calculator import determine_order_situation, calculate_pallets, adjust_low_height_pallets
-from lib.freight import build_freight_items, get_city_state_from_zip, get_chr_quotes
-from lib.chr_auth import CHRobinsonAuth
-from lib.quote_service import select_optimal_quote
+from lib.quote_pipeline import (QuoteError, parse_quote_request, load_settings,
+                                create_inflow_api, create_chr_auth, run_quote_pipeline, warm_up)
+
+# Product dimension workbook (loaded once per process)
+DIMENSIONS_PATH = str(current_dir / 'data' / 'Product Dimension.xlsx')
+
+# Warm up while the container initializes ("no" to defer the work to the first request)
+PRELOAD = os.environ.get('QUOTE_PRELOAD', 'yes').lower() != 'no'
+
+# (settings, InflowAPI, CHRobinsonAuth), created once per container (see get_clients)
+_clients = None
+_clients_lock = threading.Lock()
+
+
+def get_clients():
+    """
+    Get the container's settings and API clients, creating them on first use
+    
+    Raises:
+        QuoteError: If a required environment variable is missing
+    """
+    global _clients
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                settings = load_settings()
+                _clients = (settings, create_inflow_api(settings), create_chr_auth(settings))
+    return _clients
+
+
+def preload():
+    """Create the clients and warm the lib caches, logging what it cost"""
+    import_ms = round((time.perf_counter() - _import_started) * 1000, 2)
+    timings = warm_up(DIMENSIONS_PATH)
+    try:
+        get_clients()
+    except QuoteError as e:
+        # Reported to the caller by the first request
+        print(f"Warm-up skipped clients: {e}")
+    print(json.dumps({'event': 'quote_cold_start', 'importMs': import_ms, 'warmUpMs': timings}))
+
+
+if PRELOAD:
+    preload()
 
 
 def handler(event, context):
@@ -35,7 +84,9 @@ def handler(event, context):
         "destinationZip": "67890",
         "deliveryType": "Commercial" or "Residential",
         "liftgateService": "yes" or "no",
-        "pickupDate": "2024-01-15T08:00:00"
+        "pickupDate": "2024-01-15T08:00:00",
+        "includeTimings": true (optional, adds per-step "timings" to the response)
+        "palletPacking": "volume", "cartons" or "cheapest" (optional, defaults to PALLET_PACKING)
     }
     
     Returns:
@@ -65,164 +116,14 @@ def handler(event, context):
         }
     
     try:
-        # Parse request body
-        body = json.loads(event.get('body', '{}'))
-        
-        # Extract parameters
-        order_number = body.get('orderNumber', '').strip()
-        needs_assembly = body.get('needsAssembly', 'no')
-        pickup_zip = body.get('pickupZip', '').strip()
-        destination_zip = body.get('destinationZip', '').strip()
-        delivery_type = body.get('deliveryType', 'Commercial')
-        liftgate_service = body.get('liftgateService', 'no')
-        pickup_date = body.get('pickupDate', '')
-        
-        # Validate inputs
-        if not order_number:
-            raise ValueError("Order/Quote number is required")
-        if len(pickup_zip) != 5 or not pickup_zip.isdigit():
-            raise ValueError("Invalid pickup ZIP code")
-        if len(destination_zip) != 5 or not destination_zip.isdigit():
-            raise ValueError("Invalid destination ZIP code")
-        if not pickup_date:
-            raise ValueError("Pickup date is required")
-        
-        # Get environment variables
-        inflow_company_id = os.environ.get('INFLOW_COMPANY_ID')
-        inflow_api_key = os.environ.get('INFLOW_API_KEY')
-        chr_client_id = os.environ.get('CHR_CLIENT_ID')
-        chr_client_secret = os.environ.get('CHR_CLIENT_SECRET')
-        chr_customer_code = os.environ.get('CHR_CUSTOMER_CODE')
-        chr_environment = os.environ.get('CHR_ENVIRONMENT', 'sandbox')
-        
-        if not all([inflow_company_id, inflow_api_key, chr_client_id, chr_client_secret, chr_customer_code]):
-            raise ValueError("Missing required environment variables")
-        
-        # Initialize API clients
-        inflow_api = InflowAPI(inflow_company_id, inflow_api_key)
-        chr_auth = CHRobinsonAuth(chr_client_id, chr_client_secret, chr_environment)
-        
-        # Load product dimensions
-        dimensions_path = str(current_dir / 'data' / 'Product Dimension.xlsx')
-        dimensions_loader = ProductDimensionsLoader(dimensions_path)
-        
-        # Step 1: Fetch order or quote from inFlow
-        order_df = inflow_api.search_todays_orders(order_number)
+        # Parse and validate request body
+        params = parse_quote_request(json.loads(event.get('body') or '{}'))
+        settings, inflow_api, chr_auth = get_clients()
         
-        if order_df.empty:
-            return {
-                'statusCode': 404,
-                'headers': headers,
-                'body': json.dumps({'error': f'Order/Quote "{order_number}" not found in inFlow'})
-            }
-        
-        # Step 2: Process products
-        products_df = inflow_api.process_order_products(order_df)
-        
-        if products_df.empty:
-            return {
-                'statusCode': 400,
-                'headers': headers,
-                'body': json.dumps({'error': 'No valid products found in this order'})
-            }
-        
-        # Step 3: Merge dimensions
-        products_with_dims = dimensions_loader.merge_dimensions(products_df, needs_assembly)
-        
-        # Filter out products without dimensions
-        valid_products = products_with_dims[products_with_dims['Length'].notna()].copy()
-        
-        if valid_products.empty:
-            return {
-                'statusCode': 400,
-                'headers': headers,
-                'body': json.dumps({'error': 'No products with valid dimensions found'})
-            }
-        
-        # Step 4: Calculate pallets
-        order_situation = determine_order_situation(valid_products)
-        pallets, total_weight, total_volume = calculate_pallets(valid_products, order_situation)
-        
-        # Adjust low-height pallets
-        pallets = adjust_low_height_pallets(pallets, total_volume, total_weight)
-        
-        # Step 5: Build freight items
-        freight_items = build_freight_items(pallets)
-        
-        # Step 6: Get location info from ZIP codes
-        pickup_city, pickup_state = get_city_state_from_zip(pickup_zip)
-        dest_city, dest_state = get_city_state_from_zip(destination_zip)
-        
-        if not pickup_city or not dest_city:
-            return {
-                'statusCode': 400,
-                'headers': headers,
-                'body': json.dumps({'error': 'Invalid ZIP code. Could not determine city/state.'})
-            }
-        
-        pickup_info = {'zip': pickup_zip, 'city': pickup_city, 'state': pickup_state}
-        delivery_info = {'zip': destination_zip, 'city': dest_city, 'state': dest_state}
-        
-        # Step 7: Get shipping quotes from C.H. Robinson
-        is_residential = delivery_type == 'Residential'
-        needs_liftgate = liftgate_service == 'yes'
-        
-        quotes = get_chr_quotes(
-            chr_auth, freight_items, pickup_info, delivery_info,
-            pickup_date, is_residential, needs_liftgate, chr_customer_code
-        )
-        
-        if not quotes:
-            return {
-                'statusCode': 400,
-                'headers': headers,
-                'body': json.dumps({'error': 'No shipping quotes available for this route'})
-            }
-        
-        # Step 8: Select optimal quote
-        selected_quote = select_optimal_quote(quotes)
-        
-        # Step 9: Format response
-        # Convert products DataFrame to list of dicts
-        products_list = []
-        for _, row in valid_products.iterrows():
-            products_list.append({
-                'name': row['name'],
-                'quantity': float(row['quantity']),
-                'length': float(row['Length']),
-                'width': float(row['Width']),
-                'height': float(row['Height']),
-                'weight': float(row['weight(kg)']),
-                'index': int(row['Index'])
-            })
-        
-        # Format pallets with type information
-        pallets_list = []
-        for i, (pallet, freight_item) in enumerate(zip(pallets, freight_items)):
-            pallets_list.append({
-                'length': freight_item['Length'],
-                'width': freight_item['Width'],
-                'height': freight_item['Height'],
-                'weight': freight_item['Weight'],
-                'freightClass': freight_item['FreightClass'],
-                'stackable': freight_item['Stackable'],
-                'hazmat': freight_item['Hazmat'],
-                'palletType': pallet['Type'],
-                'originalHeight': pallet['Height']
-            })
-        
-        response_data = {
-            'orderSummary': {
-                'orderNumber': order_number,
-                'totalProducts': len(products_list),
-                'totalWeight': float(total_weight),
-                'totalVolume': float(total_volume)
-            },
-            'products': products_list,
-            'pallets': pallets_list,
-            'quotes': quotes,
-            'selectedQuote': selected_quote
-        }
+        # Lambda runs one invocation per container at a time, so there is
+        # nothing to coalesce here (see SingleFlight in the backend apps)
+        response_data = run_quote_pipeline(params, settings, DIMENSIONS_PATH,
+                                           inflow_api=inflow_api, chr_auth=chr_auth)
         
         return {
             'statusCode': 200,
@@ -230,6 +131,12 @@ def handler(event, context):
             'body': json.dumps(response_data)
         }
         
+    except QuoteError as e:
+        return {
+            'statusCode': e.status_code,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
     except ValueError as e:
         return {
             'statusCode': 400,
@@ -4,7 +4,9 @@
 
 const CONFIG = {
     // API endpoint for Railway backend
-    apiEndpoint: 'https://sunique-freight-api-production.up.railway.app/api/quote'
+    apiEndpoint: 'https://sunique-freight-api-production.up.railway.app/api/quote',
+    // Streaming variant (newline-delimited JSON stage events)
+    streamEndpoint: 'https://sunique-freight-api-production.up.railway.app/api/quote/stream'
 };
 
 // ============================================
@@ -28,6 +30,75 @@ async function getFreightQuote(formData) {
     return await response.json();
 }
 
+/**
+ * Request a quote from the streaming endpoint, calling onEvent(event, data)
+ * for each pipeline stage as it finishes. Resolves with the final result.
+ * Falls back to getFreightQuote when streaming is unavailable (no endpoint,
+ * or a browser without readable response bodies).
+ */
+async function getFreightQuoteStream(formData, onEvent) {
+    let response;
+    try {
+        response = await fetch(CONFIG.streamEndpoint, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(formData)
+        });
+    } catch (error) {
+        console.warn('Streaming unavailable, using standard request:', error);
+        return getFreightQuote(formData);
+    }
+    
+    if (response.status === 404 || response.status === 405 || !response.body) {
+        return getFreightQuote(formData);
+    }
+    
+    if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || `Server error: ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    const handleLine = (line) => {
+        if (!line.trim()) return null;
+        const message = JSON.parse(line);
+        if (message.event === 'error') {
+            throw new Error(message.data.error || 'An error occurred while processing your quote');
+        }
+        if (message.event === 'result') {
+            return message.data;
+        }
+        onEvent(message.event, message.data);
+        return null;
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+        
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        if (done && buffer) {
+            lines.push(buffer);
+            buffer = '';
+        }
+        
+        for (const line of lines) {
+            const result = handleLine(line);
+            if (result) return result;
+        }
+        
+        if (done) {
+            throw new Error('Quote stream ended before a result was received');
+        }
+    }
+}
+
 // ============================================
 // SECTION 3: Main Application
 // ============================================
@@ -101,26 +172,15 @@ class ShippingQuoteApp {
             this.currentFormData = formData;
             await this.sleep(500);
             
-            // Step 2-6: Call Netlify serverless function (all backend processing)
+            // Step 2-6: Backend processing, with progress driven by streamed stage events
             this.updateProgress(1, 'Fetching order from inFlow...');
-            await this.sleep(300);
-            
-            this.updateProgress(2, 'Calculating product dimensions...');
-            await this.sleep(300);
-            
-            this.updateProgress(3, 'Optimizing pallet configuration...');
-            await this.sleep(300);
-            
-            this.updateProgress(4, 'Calculating freight classes...');
-            await this.sleep(300);
-            
-            this.updateProgress(5, 'Fetching shipping quotes from C.H. Robinson...');
-            
-            // Call the Netlify serverless function
-            const result = await getFreightQuote(formData);
             
+            this.renderedStages = new Set();
+            const result = await getFreightQuoteStream(formData, (event, data) => {
+                this.handleStageEvent(event, data);
+            });
             
-            // Display results
+            // Display results (products and pallets are already shown when streamed)
             await this.sleep(500);
             this.displayResults(result);
             
@@ -160,6 +220,34 @@ class ShippingQuoteApp {
         };
     }
     
+    handleStageEvent(event, data) {
+        switch (event) {
+            case 'order':
+                this.updateProgress(2, `Found ${data.orderNumber}. Fetching products and dimensions...`);
+                this.streamedQuotes = 0;
+                this.showPartialResults(data.orderNumber);
+                break;
+            case 'products':
+                this.updateProgress(3, `Loaded ${data.length} products. Optimizing pallet configuration...`);
+                this.renderProducts(data);
+                break;
+            case 'pallets': {
+                const classes = [...new Set(data.map(pallet => pallet.freightClass))].join(', ');
+                this.updateProgress(4, `Built ${data.length} pallet(s), class ${classes}.`);
+                this.renderPallets(data);
+                this.updateProgress(5, 'Fetching shipping quotes from C.H. Robinson...');
+                break;
+            }
+            case 'quote':
+                this.streamedQuotes = (this.streamedQuotes || 0) + 1;
+                this.updateProgress(5, `Received ${this.streamedQuotes} quote(s), latest ${data.carrier}: $${Number(data.totalCost).toFixed(2)}`);
+                break;
+            case 'selectedQuote':
+                this.updateProgress(5, `Selected ${data.carrier}. Preparing results...`);
+                break;
+        }
+    }
+    
     // UI Methods
     updateProgress(stepIndex, message) {
         const step = this.progressSteps[stepIndex];
@@ -198,19 +286,39 @@ class ShippingQuoteApp {
         this.updateProgress(0, 'Initializing...');
     }
     
+    showPartialResults(orderNumber) {
+        // Results fill in below the progress as each stage arrives
+        document.getElementById('results-section').style.display = 'block';
+        document.getElementById('resultOrderNumber').textContent = orderNumber;
+        document.getElementById('resultTotalPallets').textContent = '-';
+        document.getElementById('resultTotalWeight').textContent = '-';
+        document.getElementById('palletResults').innerHTML = '';
+        const productDetailsElement = document.getElementById('productDetails');
+        if (productDetailsElement) productDetailsElement.innerHTML = '';
+        ['resultCarrier', 'resultBaseRate', 'resultMarkupPercent', 'resultMarkup', 'resultFinalQuote'].forEach(id => {
+            document.getElementById(id).textContent = '-';
+        });
+        document.getElementById('allQuotes').innerHTML =
+            '<div class="quote-item">Waiting for carrier quotes...</div>';
+        this.renderQuoteDetails();
+    }
+    
     displayResults(data) {
         document.getElementById('processing-section').style.display = 'none';
         document.getElementById('results-section').style.display = 'block';
         
-        // Populate order summary
+        // Without streaming (or if a stage was missed) everything is rendered here
         document.getElementById('resultOrderNumber').textContent = data.orderSummary.orderNumber;
-        document.getElementById('resultTotalPallets').textContent = data.pallets.length;
-        
-        // Calculate total weight from pallets (includes pallet weight)
-        const totalPalletWeight = data.pallets.reduce((sum, pallet) => sum + pallet.weight, 0);
-        document.getElementById('resultTotalWeight').textContent = 
-            `${Math.round(totalPalletWeight).toLocaleString()} lbs`;
+        this.renderQuoteDetails();
+        if (!this.renderedStages || !this.renderedStages.has('pallets')) this.renderPallets(data.pallets);
+        if (!this.renderedStages || !this.renderedStages.has('products')) this.renderProducts(data.products);
+        this.renderQuotes(data);
         
+        // Scroll to top of results
+        document.getElementById('results-section').scrollIntoView({ behavior: 'smooth' });
+    }
+    
+    renderQuoteDetails() {
         // Populate quote details from stored form data
         if (this.currentFormData) {
             document.getElementById('resultPickupZip').textContent = this.currentFormData.pickupZip;
@@ -225,9 +333,18 @@ class ShippingQuoteApp {
             const formattedDate = date.toLocaleDateString('en-US', { month: 'short', day: 'numeric', year: 'numeric' });
             document.getElementById('resultPickupDate').textContent = formattedDate;
         }
+    }
+    
+    renderPallets(pallets) {
+        if (this.renderedStages) this.renderedStages.add('pallets');
+        document.getElementById('resultTotalPallets').textContent = pallets.length;
+        
+        // Calculate total weight from pallets (includes pallet weight)
+        const totalPalletWeight = pallets.reduce((sum, pallet) => sum + pallet.weight, 0);
+        document.getElementById('resultTotalWeight').textContent = 
+            `${Math.round(totalPalletWeight).toLocaleString()} lbs`;
         
-        // Render pallets
-        const palletsHtml = data.pallets.map((pallet, idx) => `
+        const palletsHtml = pallets.map((pallet, idx) => `
             <div class="pallet-card">
                 <div class="pallet-header">
                     <span class="pallet-type">${pallet.palletType} Pallet #${idx + 1}</span>
@@ -241,6 +358,10 @@ class ShippingQuoteApp {
             </div>
         `).join('');
         document.getElementById('palletResults').innerHTML = palletsHtml;
+    }
+    
+    renderProducts(products) {
+        if (this.renderedStages) this.renderedStages.add('products');
         
         // Render product details (only if element exists)
         const productDetailsElement = document.getElementById('productDetails');
@@ -253,7 +374,7 @@ class ShippingQuoteApp {
                     <div>Weight (kg)</div>
                     <div>Weight (lb)</div>
                 </div>
-            ` + data.products.map(product => `
+            ` + products.map(product => `
                 <div class="product-row">
                     <div class="product-name">${product.name}</div>
                     <div>${product.quantity}</div>
@@ -264,7 +385,9 @@ class ShippingQuoteApp {
             `).join('');
             productDetailsElement.innerHTML = productsHtml;
         }
-        
+    }
+    
+    renderQuotes(data) {
         // Render selected quote
         document.getElementById('resultCarrier').textContent = data.selectedQuote.carrier;
         document.getElementById('resultBaseRate').textContent = 
@@ -298,13 +421,11 @@ class ShippingQuoteApp {
                 `;
             }).join('');
         document.getElementById('allQuotes').innerHTML = quotesHtml;
-        
-        // Scroll to top of results
-        document.getElementById('results-section').scrollIntoView({ behavior: 'smooth' });
     }
     
     showError(message) {
         document.getElementById('processing-section').style.display = 'none';
+        document.getElementById('results-section').style.display = 'none';
         document.getElementById('errorModal').classList.add('show');
         document.getElementById('errorMessage').textContent = message;
     }